@@ -0,0 +1,129 @@
+import numpy as np
+
+"""
+-----------------------------------------------------------------------------
+SUBSYSTEM: DIAGNÓSTICO DE ADQUISICIÓN (PÉRDIDA DE MUESTRAS Y JITTER)
+-----------------------------------------------------------------------------
+Descripción:
+Contadores de salud del stream de la placa, calculados a partir de los
+canales de número de paquete y timestamp que BrainFlow entrega en cada fila.
+
+Si el bucle principal se atrasa (CPU saturada) o el buffer interno de
+BrainFlow se desborda, el analizador calcularía el BPM sobre una ventana con
+huecos sin enterarse. Aquí se detecta:
+- Muestras perdidas: saltos en el contador de paquetes (módulo 256). Como el
+  contador da la vuelta, los huecos más largos se estiman con el timestamp.
+- Jitter: desviación estándar del intervalo entre muestras (vs 1/fs).
+- Tasa efectiva: muestras recibidas / tiempo transcurrido según la placa.
+- Backlog: mayor cantidad de muestras acumuladas en una sola lectura
+  (si crece, el bucle no está leyendo a tiempo).
+- Integridad de ventana: la ventana de análisis (últimas N muestras) no
+  contiene ningún hueco.
+-----------------------------------------------------------------------------
+"""
+
+# El contador de paquetes de BrainFlow (Synthetic, Cyton, ...) es de 8 bits
+PACKAGE_MODULUS = 256
+
+
+class AcquisitionStats:
+    def __init__(self, sampling_rate, package_modulus=PACKAGE_MODULUS):
+        self.sampling_rate = sampling_rate
+        self.package_modulus = package_modulus
+        self.reset()
+
+    def reset(self):
+        self.samples_received = 0
+        self.dropped_samples = 0
+        self.gap_events = 0
+        self.overruns = 0
+        self.max_backlog = 0
+
+        # Última muestra vista (para detectar saltos entre lecturas)
+        self.last_package = None
+        self.last_timestamp = None
+        self.first_timestamp = None
+        # Índice (en muestras recibidas) justo después del último hueco
+        self.last_gap_index = 0
+
+        # Acumuladores del intervalo entre muestras (para el jitter)
+        self.interval_count = 0
+        self.interval_sum = 0.0
+        self.interval_sum_sq = 0.0
+
+    def update(self, packages, timestamps):
+        """ Registra un bloque de muestras NUEVAS (en orden de llegada) """
+        n_new = len(packages)
+        if n_new == 0:
+            return
+        self.max_backlog = max(self.max_backlog, n_new)
+
+        # Encadenamos con la última muestra de la lectura anterior
+        if self.last_package is not None:
+            packages = np.concatenate(([self.last_package], packages))
+            timestamps = np.concatenate(([self.last_timestamp], timestamps))
+        else:
+            self.first_timestamp = float(timestamps[0])
+
+        if len(packages) > 1:
+            # Muestras faltantes entre muestras consecutivas según el contador...
+            missing = (np.diff(packages).astype(np.int64) - 1) % self.package_modulus
+            # ...y según el reloj de la placa (cubre huecos de más de una vuelta del contador)
+            intervals = np.diff(timestamps)
+            by_clock = np.rint(intervals * self.sampling_rate).astype(np.int64) - 1
+            missing = np.where(by_clock >= self.package_modulus, by_clock, missing)
+
+            gaps = np.flatnonzero(missing > 0)
+            if len(gaps):
+                self.dropped_samples += int(missing[gaps].sum())
+                self.gap_events += len(gaps)
+                # Posición de la muestra posterior al último hueco dentro del stream
+                offset = 0 if self.last_package is not None else 1
+                self.last_gap_index = self.samples_received + int(gaps[-1]) + offset
+
+            # Jitter: solo intervalos sin huecos (un hueco no es jitter)
+            clean = intervals[missing == 0]
+            self.interval_count += len(clean)
+            self.interval_sum += float(clean.sum())
+            self.interval_sum_sq += float(np.dot(clean, clean))
+
+        self.samples_received += n_new
+        self.last_package = float(packages[-1])
+        self.last_timestamp = float(timestamps[-1])
+
+    def register_overrun(self):
+        """ El buffer interno de BrainFlow se llenó: se perdieron las muestras más viejas """
+        self.overruns += 1
+
+    def window_intact(self, window_points):
+        """ True si las últimas 'window_points' muestras no contienen ningún hueco """
+        return (self.samples_received >= window_points
+                and self.samples_received - self.last_gap_index >= window_points)
+
+    @property
+    def jitter_s(self):
+        if self.interval_count < 2:
+            return 0.0
+        mean = self.interval_sum / self.interval_count
+        return float(np.sqrt(max(self.interval_sum_sq / self.interval_count - mean * mean, 0.0)))
+
+    @property
+    def effective_rate_hz(self):
+        if self.first_timestamp is None or self.last_timestamp <= self.first_timestamp:
+            return 0.0
+        # El tiempo incluye los huecos: es la tasa de lo que realmente llegó
+        return (self.samples_received - 1) / (self.last_timestamp - self.first_timestamp)
+
+    def snapshot(self):
+        """ Resumen para logs / métricas """
+        expected = self.samples_received + self.dropped_samples
+        return {
+            "samples_received": self.samples_received,
+            "dropped_samples": self.dropped_samples,
+            "drop_rate_pct": 100.0 * self.dropped_samples / expected if expected else 0.0,
+            "gap_events": self.gap_events,
+            "overruns": self.overruns,
+            "max_backlog": self.max_backlog,
+            "jitter_ms": self.jitter_s * 1000.0,
+            "effective_rate_hz": self.effective_rate_hz,
+        }
@@ -0,0 +1,127 @@
+import numpy as np
+
+from dsp_filters import ZeroPhaseFilter, get_ecg_cascade
+from spectral import BandSpectrumEstimator, BandPeriodogram
+from zone_engine import ZoneEngine
+
+"""
+-----------------------------------------------------------------------------
+SUBSYSTEM: DSP MULTI-ATLETA (ANÁLISIS VECTORIZADO POR LOTES)
+-----------------------------------------------------------------------------
+Descripción:
+Versión por lotes de DataAnalyzer: procesa las ventanas de TODO un equipo
+(matriz [atletas x muestras]) en cada ciclo con unas pocas llamadas NumPy,
+sin un bucle de Python por atleta. Pensado para servir un gimnasio o equipo
+completo desde un único proceso.
+
+Pipeline (mismas etapas que DataAnalyzer, una fila por atleta):
+1. Filtrado: cascada SOS fusionada zero-phase aplicada a la matriz completa.
+2. Estimación Espectral:
+   - Motor 'fft': periodograma Blackman-Harris de la ventana (misma rejilla
+     que DataFilter.get_psd_welch con nfft = ventana) con una rfft por filas.
+   - Motor 'band': banco de bins de la banda fisiológica + interpolación sub-bin.
+3. Filtro de Mediana: historial circular [atletas x ventana_mediana].
+4. EMA: vector de estados.
+5. Zonas + Histéresis: ZoneEngine (umbrales por atleta y estado de candidato en arrays).
+
+Los atletas cuyo BPM no pasa el control de rango simplemente no actualizan
+su estado en ese ciclo (igual que el 'return self.current_bpm' del caso 1-D).
+-----------------------------------------------------------------------------
+"""
+
+
+class BatchDataAnalyzer:
+    def __init__(self, sampling_rate, ages, window_points=1024, psd_engine="fft", median_window=40):
+        self.sampling_rate = sampling_rate
+        self.window_points = window_points
+        self.psd_engine = psd_engine
+
+        # Fórmula de Fox (220 - edad) por atleta
+        self.ages = np.asarray(ages, dtype=float)
+        self.n_athletes = len(self.ages)
+        self.max_hr = 220.0 - self.ages
+
+        # --- ETAPA 1: Cascada SOS con buffers para todos los atletas ---
+        self.zero_phase = ZeroPhaseFilter(get_ecg_cascade(sampling_rate), window_points,
+                                          n_signals=self.n_athletes)
+
+        # --- ETAPA 2: Motor espectral (ambos resuelven todas las filas a la vez) ---
+        if self.psd_engine == "fft":
+            self.spectrum = BandPeriodogram(sampling_rate)
+        elif self.psd_engine == "band":
+            self.spectrum = BandSpectrumEstimator(sampling_rate)
+        else:
+            raise ValueError(f"Motor espectral desconocido: {self.psd_engine}")
+
+        # --- ETAPA 3: Historial circular de la mediana (NaN = posición vacía) ---
+        self.median_window = median_window
+        self.bpm_history = np.full((self.n_athletes, median_window), np.nan)
+        self.history_count = np.zeros(self.n_athletes, dtype=int)
+        self.min_history = min(10, median_window)
+
+        # --- ETAPA 4: EMA ---
+        self.ema_alpha = 0.15
+        self.ema_bpm = np.zeros(self.n_athletes)
+        self.current_bpm = np.zeros(self.n_athletes)
+
+        # --- ETAPA 5: Umbrales y estado de histéresis por atleta (arrays) ---
+        self.zone_engine = ZoneEngine(self.max_hr)
+
+    @property
+    def current_zone(self):
+        return self.zone_engine.current_zone
+
+    def filter_signals(self, ecg_windows):
+        """
+        ETAPA 1 para todo el equipo. 'ecg_windows' es [atletas x muestras].
+        Retorna el buffer interno filtrado (se sobrescribe en el próximo ciclo).
+        """
+        return self.zero_phase.apply(ecg_windows)
+
+    def peak_frequencies(self, filtered):
+        """ ETAPA 2: frecuencia dominante en la banda fisiológica de cada atleta """
+        return self.spectrum.peak_frequencies(filtered)
+
+    def calculate_bpm(self, filtered, active=None):
+        """
+        ETAPAS 2, 3 y 4 vectorizadas. Retorna el vector de BPM actual por atleta.
+        'active' (bool[atletas], opcional): solo esas filas actualizan su BPM; el resto
+        (sin datos nuevos o con huecos en la ventana) conserva el último valor.
+        """
+        raw_bpm = self.peak_frequencies(filtered) * 60.0
+
+        # Control de rango: solo los atletas válidos actualizan su historial
+        valid = (raw_bpm >= 40) & (raw_bpm <= 240)
+        if active is not None:
+            valid &= active
+        rows = np.flatnonzero(valid)
+        slots = self.history_count[rows] % self.median_window
+        self.bpm_history[rows, slots] = raw_bpm[rows]
+        self.history_count[rows] += 1
+
+        # Mediana solo para quienes tienen historial suficiente (las posiciones vacías son NaN)
+        ready = valid & (self.history_count >= self.min_history)
+        if not ready.any():
+            return self.current_bpm
+        median_bpm = np.nanmedian(self.bpm_history[ready], axis=-1)
+
+        # EMA: el primer valor inicializa directamente
+        previous = self.ema_bpm[ready]
+        smoothed = median_bpm * self.ema_alpha + previous * (1.0 - self.ema_alpha)
+        self.ema_bpm[ready] = np.where(previous == 0.0, median_bpm, smoothed)
+        self.current_bpm[ready] = self.ema_bpm[ready]
+        return self.current_bpm
+
+    def detect_zone_changes(self, bpm, now=None):
+        """
+        ETAPA 5 vectorizada (misma máquina de estados que DataAnalyzer.detect_zone_change).
+        Retorna (cambio: bool[atletas], zona_anterior: int[atletas], zona_nueva: int[atletas]);
+        las zonas valen 0 donde no hubo cambio.
+        """
+        return self.zone_engine.update(bpm, now)
+
+    def process(self, ecg_windows, now=None, active=None):
+        """ Ciclo completo para todo el equipo: (bpm, cambio, zona_anterior, zona_nueva) """
+        bpm = self.calculate_bpm(self.filter_signals(ecg_windows), active)
+        changed, old_zone, new_zone = self.detect_zone_changes(bpm, now)
+        return bpm, changed, old_zone, new_zone
@@ -0,0 +1,63 @@
+import json
+import logging
+import os
+import tempfile
+from brainflow.board_shim import BoardShim
+
+"""
+-----------------------------------------------------------------------------
+SUBSYSTEM: CACHÉ DE METADATA DE PLACAS (ARRANQUE RÁPIDO)
+-----------------------------------------------------------------------------
+Descripción:
+BrainflowHandler necesita la metadata de la placa (tasa de muestreo, canales
+ECG, paquete y timestamp, filas) antes de abrir la sesión. Sin caché la pide
+a 'BoardShim.get_board_descr': es una llamada nativa y, al ser la primera del
+proceso, carga ahí libBoardController (~100 ms).
+
+Importar 'brainflow.board_shim' NO carga la librería (BrainFlow 5.x): la
+carga su primera llamada nativa (singleton 'BoardControllerDLL'). Con la
+metadata en caché el constructor no hace ninguna, así que la carga se
+posterga hasta 'prepare_session' en 'start' ('tester_rendimiento.py arranque'
+lo verifica). Si una versión de BrainFlow cargara la librería al importar,
+la caché seguiría ahorrando la consulta, pero no esa carga.
+
+La caché es un JSON {board_id: descriptor} tal como lo entrega
+'BoardShim.get_board_descr'. Vive en /tmp por defecto: sobrevive a los
+reinicios del contenedor ('restart: unless-stopped') y se regenera sola si se
+borra o está corrupta. Una caché inválida nunca impide arrancar.
+-----------------------------------------------------------------------------
+"""
+
+DEFAULT_CACHE_PATH = os.path.join(tempfile.gettempdir(), "brainflow_board_descr.json")
+
+# Caché en memoria del proceso (varias placas del mismo tipo leen el archivo una vez)
+_memory_cache = {}
+
+
+def _read_cache(cache_path):
+    try:
+        with open(cache_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def get_board_descr(board_id, cache_path=DEFAULT_CACHE_PATH):
+    """ Descriptor de la placa (dict de BrainFlow), desde la caché si existe """
+    key = str(board_id)
+    if key in _memory_cache:
+        return _memory_cache[key]
+
+    cache = _read_cache(cache_path) if cache_path else {}
+    descr = cache.get(key)
+    if descr is None:
+        descr = BoardShim.get_board_descr(board_id)
+        if cache_path:
+            cache[key] = descr
+            try:
+                with open(cache_path, "w") as f:
+                    json.dump(cache, f)
+            except OSError as e:
+                logging.warning(f"No se pudo guardar la caché de metadata ({cache_path}): {e}")
+    _memory_cache[key] = descr
+    return descr
@@ -0,0 +1,151 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from brainflow.board_shim import BrainFlowInputParams, BoardIds
+
+from brainflow_handler import BrainflowHandler, ReplayHandler
+from board_descriptor import DEFAULT_CACHE_PATH
+
+"""
+-----------------------------------------------------------------------------
+SUBSYSTEM: GESTOR MULTI-PLACA (UN EQUIPO COMPLETO EN UN PROCESO)
+-----------------------------------------------------------------------------
+Descripción:
+Abre N placas (reales o sintéticas), una por atleta, y las lee desde un único
+proceso. Reemplaza el esquema de un contenedor por atleta: todo el equipo se
+adquiere en un solo equipo de borde (edge box).
+
+Características:
+- Parámetros por placa: cada atleta tiene su propio BrainFlowInputParams
+  (puerto serie, MAC, ...). Las placas sintéticas se distinguen con
+  'other_info' (BrainFlow rechaza dos sesiones con parámetros idénticos).
+- Lectura concurrente: un pool de hilos lee todas las placas en cada ciclo.
+  Las llamadas a BrainFlow (ctypes) liberan el GIL mientras copian datos.
+- Ciclo de vida: prepare/start por placa; si una falla al arrancar se liberan
+  las que ya estaban abiertas. 'stop' libera todas aunque alguna falle.
+  También funciona como context manager ('with BoardManager(...) as boards').
+- Grabación / Reproducción: con 'record_dir' cada placa graba su sesión en
+  '{record_dir}/{user_id}.msrr'; con 'replay_dir' se reemplazan las placas por
+  esas grabaciones (o por '{user_id}.csv' de BrainFlow) a 'replay_speed'.
+-----------------------------------------------------------------------------
+"""
+
+
+def synthetic_params(user_id):
+    """ Parámetros de una placa sintética identificada por el atleta """
+    params = BrainFlowInputParams()
+    params.other_info = user_id
+    return params
+
+
+class BoardManager:
+    def __init__(self, athletes, num_points=1024, acquisition_mode="window",
+                 board_id=BoardIds.SYNTHETIC_BOARD.value, max_workers=8,
+                 record_dir=None, replay_dir=None, replay_speed=1.0, prewarm_s=0.0,
+                 descr_cache=DEFAULT_CACHE_PATH, ecg_leads=1):
+        """
+        'athletes' es una lista de (user_id, edad) o (user_id, edad, BrainFlowInputParams).
+        Sin parámetros explícitos se abre una placa 'board_id' identificada por el user_id.
+        'replay_speed': 1.0 = tiempo real, N = N veces más rápido, 0 = máxima velocidad.
+        'prewarm_s' > 0 entrega ventanas parciales desde esos segundos de datos (ver BrainflowHandler).
+        'ecg_leads' > 1 (0 = todas) entrega bloques [derivaciones x N] en lugar de una fila ECG.
+        """
+        self.replaying = bool(replay_dir)
+        self.athletes = {}
+        self.handlers = {}
+        for athlete in athletes:
+            user_id, age = athlete[0], athlete[1]
+            params = athlete[2] if len(athlete) > 2 else synthetic_params(user_id)
+            if user_id in self.handlers:
+                raise ValueError(f"Atleta duplicado: {user_id}")
+            self.athletes[user_id] = age
+            if self.replaying:
+                self.handlers[user_id] = ReplayHandler(self._replay_path(replay_dir, user_id),
+                                                       num_points=num_points, acquisition_mode=acquisition_mode,
+                                                       speed=replay_speed, board_id=board_id,
+                                                       prewarm_s=prewarm_s, descr_cache=descr_cache,
+                                                       ecg_leads=ecg_leads)
+                continue
+            record_path = os.path.join(record_dir, f"{user_id}.msrr") if record_dir else None
+            self.handlers[user_id] = BrainflowHandler(board_id=board_id, num_points=num_points,
+                                                      acquisition_mode=acquisition_mode, params=params,
+                                                      record_path=record_path, prewarm_s=prewarm_s,
+                                                      descr_cache=descr_cache, ecg_leads=ecg_leads)
+
+        # Todas las placas comparten tipo: misma tasa de muestreo
+        self.sampling_rate = next(iter(self.handlers.values())).sampling_rate
+        self.executor = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(self.handlers))),
+                                           thread_name_prefix="board")
+        self.started = []
+
+    @staticmethod
+    def _replay_path(replay_dir, user_id):
+        # Grabación propia si existe; si no, un CSV exportado con DataFilter.write_file
+        path = os.path.join(replay_dir, f"{user_id}.msrr")
+        if os.path.exists(path):
+            return path
+        return os.path.join(replay_dir, f"{user_id}.csv")
+
+    @property
+    def finished(self):
+        """ Reproducción: todas las grabaciones se entregaron completas """
+        return self.replaying and all(handler.finished for handler in self.handlers.values())
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+        return False
+
+    def __len__(self):
+        return len(self.handlers)
+
+    def start(self):
+        """ Prepara y arranca todas las placas (todo o nada) """
+        for user_id, handler in self.handlers.items():
+            try:
+                handler.start(age=self.athletes[user_id])
+            except Exception as e:
+                logging.error(f"No se pudo iniciar la placa de {user_id}: {e}")
+                handler.stop()  # Pudo quedar preparada a medias
+                self.stop()
+                raise
+            self.started.append(user_id)
+        logging.info(f"Gestor multi-placa activo: {len(self.started)} placas")
+
+    def poll(self, streaming=False, user_ids=None):
+        """
+        Lee todas las placas (o solo 'user_ids') en paralelo. Retorna {user_id: datos o None}:
+        la ventana completa ('get_data') o solo las muestras nuevas ('get_new_data').
+        """
+        futures = {}
+        for user_id in self.handlers if user_ids is None else user_ids:
+            handler = self.handlers[user_id]
+            read = handler.get_new_data if streaming else handler.get_data
+            futures[user_id] = self.executor.submit(read)
+
+        results = {}
+        for user_id, future in futures.items():
+            try:
+                results[user_id] = future.result()
+            except Exception as e:
+                # Una placa caída no detiene al resto del equipo
+                logging.warning(f"Error leyendo la placa de {user_id}: {e}")
+                results[user_id] = None
+        return results
+
+    def config_simulator_zone(self, zone):
+        for handler in self.handlers.values():
+            handler.config_simulator_zone(zone)
+
+    def stop(self):
+        """ Libera todas las placas abiertas (best-effort) y el pool de hilos """
+        for user_id in self.started:
+            try:
+                self.handlers[user_id].stop()
+            except Exception as e:
+                logging.warning(f"Error liberando la placa de {user_id}: {e}")
+        self.started = []
+        self.executor.shutdown(wait=False)
@@ -1,6 +1,12 @@
 import logging
+import time
 from brainflow.board_shim import BoardShim, BrainFlowInputParams, BoardIds
 
+from ring_buffer import RingBuffer
+from acquisition_stats import AcquisitionStats
+from recording import SessionRecorder, ReplayBoard, load_recording
+from board_descriptor import get_board_descr, DEFAULT_CACHE_PATH
+
 """
 -----------------------------------------------------------------------------
 SUBSYSTEM: HARDWARE ABSTRACTION LAYER (HAL)
@@ -17,28 +23,58 @@ Características Clave:
 - Inyección de Comandos: Permite enviar strings de configuración dinámicos
   al núcleo C++ (vital para la simulación de zonas de la tesis).
 - Gestión de Canales: Detecta automáticamente en qué canal físico viaja el ECG.
+  Con 'ecg_leads' > 1 (0 = todas) entrega las derivaciones como un bloque
+  [derivaciones x N] en lugar de una sola fila.
+- Adquisición Incremental (modo 'incremental'): en lugar de copiar todos los
+  canales x N puntos en cada ciclo ('get_current_board_data'), vacía solo las
+  muestras nuevas, guarda únicamente la fila ECG en un buffer pre-reservado y
+  entrega la ventana como vista (sin copia).
+- Diagnóstico: en cada lectura revisa los canales de número de paquete y
+  timestamp (muestras perdidas, jitter, tasa efectiva, desbordes) y expone
+  si la ventana de análisis está íntegra ('window_intact').
+- Timestamps de Adquisición: guarda el timestamp de la placa de cada muestra
+  de la ventana ('timestamps()'), para que eventos, status y chunks publicados
+  lleven el instante de la muestra que los originó (no el de publicación).
+- Grabación / Reproducción: 'record_path' guarda cada lectura cruda en un
+  archivo append-only; ReplayHandler reproduce una grabación (o un CSV de
+  BrainFlow) con la misma API, en tiempo real o a máxima velocidad.
+- Arranque Rápido: la metadata de la placa sale de una caché (ver
+  board_descriptor), el logger verboso de BrainFlow se habilita recién
+  cuando se pide ('enable_dev_logger') y con 'min_points' la ventana se
+  entrega parcial (pre-calentamiento) antes de completar N puntos.
 -----------------------------------------------------------------------------
 """
 
+# Capacidad del buffer interno de BrainFlow (muestras). Es el valor por defecto
+# de 'start_stream'; lo fijamos explícitamente para poder detectar desbordes.
+BRAINFLOW_BUFFER_SIZE = 450000
+
 class BrainflowHandler:
-    def __init__(self, board_id=BoardIds.SYNTHETIC_BOARD.value, num_points=1024):
-        # Habilitamos logs internos de BrainFlow para depuración profunda del driver C++
-        BoardShim.enable_dev_board_logger()
-        
-        self.params = BrainFlowInputParams()
+    def __init__(self, board_id=BoardIds.SYNTHETIC_BOARD.value, num_points=1024, acquisition_mode="window",
+                 params=None, record_path=None, prewarm_s=0.0, descr_cache=DEFAULT_CACHE_PATH, ecg_leads=1):
+        # Los logs internos de BrainFlow (depuración del driver C++) se habilitan con
+        # 'enable_dev_logger' una vez arrancado el servicio: no demoran el inicio.
+
+        # Parámetros de conexión (puerto serie, MAC, other_info...). Varias placas en el
+        # mismo proceso necesitan parámetros distintos (ver board_manager).
+        self.params = params if params is not None else BrainFlowInputParams()
         self.board_id = board_id
         
         # Instancia del controlador principal (Bridge Python <-> C++)
         self.board_shim = BoardShim(self.board_id, self.params)
         
         self.num_points = num_points
-        self.sampling_rate = BoardShim.get_sampling_rate(self.board_id)
+
+        # METADATA DE LA PLACA (caché JSON: sin llamadas nativas en el constructor)
+        descr = get_board_descr(self.board_id, descr_cache)
+        self.sampling_rate = descr["sampling_rate"]
+        self.set_prewarm(prewarm_s)
         
         # AUTO-DETECCIÓN DE CANALES
         # Diferentes placas envían el ECG en diferentes índices del array.
         # BrainFlow nos permite consultar metadata para no "adivinar" el índice.
         try:
-            all_ecg_channels = BoardShim.get_ecg_channels(self.board_id)
+            all_ecg_channels = descr["ecg_channels"]
             # Tomamos el primer canal ECG disponible (Lead I)
             self.ecg_channel = all_ecg_channels[0] 
             logging.info(f"Hardware inicializado. Canal ECG en índice: {self.ecg_channel}")
@@ -46,6 +82,47 @@ class BrainflowHandler:
             # Fallback de seguridad por si la placa no reporta canales ECG explícitos
             logging.warning(f"No se detectaron canales ECG nativos ({e}). Usando canal por defecto [1].")
             self.ecg_channel = 1 
+            all_ecg_channels = [self.ecg_channel]
+
+        # MULTI-DERIVACIÓN: las primeras 'ecg_leads' derivaciones (0 = todas)
+        self.ecg_channels = list(all_ecg_channels[:ecg_leads] if ecg_leads else all_ecg_channels)
+        self.n_leads = len(self.ecg_channels)
+        if self.n_leads == 1:
+            # Una derivación: fila 1-D (comportamiento original)
+            self.ecg_rows = self.ecg_channel
+        elif self.ecg_channels == list(range(self.ecg_channels[0], self.ecg_channels[-1] + 1)):
+            # Canales consecutivos: un slice de filas es una vista (sin copia)
+            self.ecg_rows = slice(self.ecg_channels[0], self.ecg_channels[-1] + 1)
+        else:
+            self.ecg_rows = self.ecg_channels
+        if self.n_leads > 1:
+            logging.info(f"Multi-derivación: {self.n_leads} canales ECG {self.ecg_channels}")
+
+        # MODO DE ADQUISICIÓN
+        # 'window': pide la ventana completa en cada ciclo (todos los canales x N puntos).
+        # 'incremental': vacía solo las muestras nuevas y acumula la fila ECG localmente.
+        self.acquisition_mode = acquisition_mode
+        if self.acquisition_mode not in ("window", "incremental"):
+            raise ValueError(f"Modo de adquisición desconocido: {self.acquisition_mode}")
+
+        # Buffer circular espejado (ver ring_buffer): la ventana siempre es un slice
+        # contiguo => vista sin copia, sin mover datos en ningún ciclo.
+        self.ecg_buffer = RingBuffer(self.num_points, channels=self.n_leads if self.n_leads > 1 else None)
+
+        # DIAGNÓSTICO DE ADQUISICIÓN (canales de paquete y timestamp de la placa)
+        self.package_channel = descr["package_num_channel"]
+        self.timestamp_channel = descr["timestamp_channel"]
+        self.num_rows = descr["num_rows"]
+        self.stats = AcquisitionStats(self.sampling_rate)
+        # Timestamps de la placa alineados con la ventana (mismo orden que el ECG)
+        self.timestamp_buffer = RingBuffer(self.num_points)
+        # Última lectura: índice (en muestras recibidas) de su primera muestra y cantidad
+        self.last_read_index = 0
+        self.last_read_count = 0
+
+        # GRABACIÓN (opcional): el archivo se abre al iniciar la sesión
+        self.record_path = record_path
+        self.recorder = None
 
     def start(self, age=30):
         # Inicia la sesión de streaming.
@@ -62,9 +139,26 @@ class BrainflowHandler:
         self.board_shim.config_board(f"AGE:{age}")
         
         # 3. Arrancar adquisición de datos
-        self.board_shim.start_stream()
+        self.board_shim.start_stream(BRAINFLOW_BUFFER_SIZE)
         logging.info("Stream de datos activo.")
 
+        # 4. Grabación de la sesión (todas las filas crudas, tal como llegan)
+        if self.record_path:
+            self.recorder = SessionRecorder(self.record_path, self.board_id, self.sampling_rate, self.num_rows)
+            logging.info(f"Grabando sesión en {self.record_path}")
+
+    def set_prewarm(self, prewarm_s):
+        # Pre-calentamiento: con 'prewarm_s' > 0 la ventana se entrega parcial desde que
+        # hay 'prewarm_s' segundos de datos (primer BPM antes de llenar los N puntos)
+        self.min_points = self.num_points
+        if prewarm_s and prewarm_s > 0:
+            self.min_points = min(self.num_points, max(1, int(prewarm_s * self.sampling_rate)))
+
+    @staticmethod
+    def enable_dev_logger():
+        # Logs internos de BrainFlow (verbosos): se activan después del arranque
+        BoardShim.enable_dev_board_logger()
+
     def config_simulator_zone(self, zone):
         # INTERFAZ DE SIMULACIÓN:
         # Envía el comando personalizado 'ZONE:X' al driver compilado.
@@ -78,6 +172,16 @@ class BrainflowHandler:
 
     def get_data(self):
         # Obtiene una ventana deslizante de los últimos N datos.
+
+        # Modo incremental: solo cruzan la frontera C++ las muestras nuevas.
+        # IMPORTANTE: la ventana es una vista del buffer interno; se sobrescribe en
+        # las próximas lecturas (el analizador trabaja sobre su propia copia).
+        if self.acquisition_mode == "incremental":
+            self._drain()
+            available = len(self.ecg_buffer)
+            if available < self.min_points:
+                return None
+            return self.ecg_buffer.view(available)
         
         # Se usa 'get_current_board_data', el cual obtiene los datos 
         # MÁS RECIENTES sin borrarlos del buffer interno. Esto es ideal para 
@@ -86,18 +190,129 @@ class BrainflowHandler:
         # Obtenemos matriz [num_canales x num_puntos]
         data = self.board_shim.get_current_board_data(self.num_points)
         
-        # Validación de buffer lleno (para evitar errores al inicio)
-        if data.shape[1] < self.num_points:
+        # Solo las muestras que no vimos en la lectura anterior cuentan para el diagnóstico
+        timestamps = data[self.timestamp_channel]
+        if self.stats.last_timestamp is None:
+            self._track(data)
+        else:
+            self._track(data[:, timestamps > self.stats.last_timestamp])
+
+        # Validación de buffer lleno (para evitar errores al inicio).
+        # Con pre-calentamiento se acepta una ventana parcial de al menos 'min_points'.
+        if data.shape[1] < self.min_points:
             return None 
             
         # Retornamos SOLO la fila correspondiente al canal ECG seleccionado
-        return data[self.ecg_channel] 
+        # (o el bloque [derivaciones x N] en multi-derivación)
+        return data[self.ecg_rows] 
+
+    def get_new_data(self):
+        # Obtiene SOLO las muestras que llegaron desde la última lectura.
+
+        # Se usa 'get_board_data', que VACÍA el buffer interno de BrainFlow.
+        # Pensado para el modo streaming del analizador (filtro con estado).
+        # IMPORTANTE: no mezclar con 'get_data' en modo 'window', ya que esa
+        # ventana deslizante dejaría de contener los datos ya consumidos.
+        # (En modo 'incremental' las muestras también se acumulan en la ventana local.)
+        return self._drain()
+
+    def _drain(self):
+        # Lee por conteo solo las muestras pendientes (get_board_data(n) las retira del
+        # buffer de BrainFlow). En modo incremental además las acumula en la ventana local.
+        count = self.board_shim.get_board_data_count()
+        if count == 0:
+            # Lectura vacía: el main no debe reenviar el chunk de la lectura anterior
+            self.last_read_index = self.stats.samples_received
+            self.last_read_count = 0
+            return None
+        # Buffer de BrainFlow lleno: las muestras más viejas ya se sobrescribieron
+        if count >= BRAINFLOW_BUFFER_SIZE:
+            self.stats.register_overrun()
+
+        data = self.board_shim.get_board_data(count)
+        self._track(data)
+        new_samples = data[self.ecg_rows]
+        if self.acquisition_mode == "incremental":
+            self.ecg_buffer.append(new_samples)
+        return new_samples
+
+    def timestamps(self, n_points=None):
+        # Timestamps (reloj de la placa) de las últimas 'n_points' muestras recibidas
+        # (por defecto la ventana). Vista sin copia: válida hasta la próxima lectura.
+        available = len(self.timestamp_buffer)
+        return self.timestamp_buffer.view(available if n_points is None else min(n_points, available))
+
+    def pending_samples(self):
+        # Muestras en el buffer de BrainFlow aún no leídas (disparo por cantidad de muestras).
+        # Solo tiene sentido cuando las lecturas vacían el buffer ('incremental' / get_new_data):
+        # en modo 'window' el buffer nunca se vacía y el conteo no distingue lo nuevo.
+        return self.board_shim.get_board_data_count()
+
+    def _track(self, data):
+        # Actualiza los contadores con las filas de paquete/timestamp de las muestras nuevas
+        # y las agrega a la grabación (cada muestra pasa por aquí exactamente una vez)
+        self.last_read_index = self.stats.samples_received
+        self.last_read_count = data.shape[1]
+        self.stats.update(data[self.package_channel], data[self.timestamp_channel])
+        self.timestamp_buffer.append(data[self.timestamp_channel])
+        if self.recorder is not None:
+            self.recorder.write(data)
+
+    def now(self):
+        # Reloj de la sesión para la histéresis de zonas (en vivo: reloj de pared)
+        return time.time()
+
+    @property
+    def window_intact(self):
+        # La ventana de análisis (últimas N muestras, o las disponibles durante el
+        # pre-calentamiento) no contiene huecos
+        window = min(self.num_points, self.stats.samples_received)
+        return window >= self.min_points and self.stats.window_intact(window)
 
     def stop(self):
         # Libera recursos y cierra la conexión con la placa
+        if self.recorder is not None:
+            self.recorder.close()
+            logging.info(f"Grabación cerrada: {self.recorder.samples_written} muestras en {self.record_path}")
+            self.recorder = None
         if self.board_shim.is_prepared():
             logging.info('Deteniendo BrainFlow y liberando driver...')
             try:
                 self.board_shim.release_session()
             except:
-                pass # Evita crash si ya estaba cerrado
\ No newline at end of file
+                pass # Evita crash si ya estaba cerrado
+
+
+class ReplayHandler(BrainflowHandler):
+    """
+    Misma interfaz que BrainflowHandler, alimentada por una sesión grabada.
+    speed=1.0 reproduce en tiempo real (N = N veces más rápido); speed=0 entrega
+    un bloque de 'chunk_points' muestras por lectura, sin esperar.
+    """
+    def __init__(self, path, num_points=1024, acquisition_mode="window", speed=1.0,
+                 chunk_points=12, board_id=None, prewarm_s=0.0, descr_cache=DEFAULT_CACHE_PATH, ecg_leads=1):
+        file_board_id, sampling_rate, data = load_recording(path, board_id)
+        super().__init__(board_id=file_board_id, num_points=num_points, acquisition_mode=acquisition_mode,
+                         descr_cache=descr_cache, ecg_leads=ecg_leads)
+        self.replay_path = path
+        self.sampling_rate = int(sampling_rate)
+        self.stats.sampling_rate = self.sampling_rate
+        self.set_prewarm(prewarm_s)
+        self.board_shim = ReplayBoard(data, self.sampling_rate, speed=speed, chunk_points=chunk_points,
+                                      timestamp_channel=self.timestamp_channel)
+        logging.info(f"Reproduciendo {path}: {data.shape[1]} muestras ({data.shape[1] / self.sampling_rate:.1f}s)")
+
+    @property
+    def finished(self):
+        # Llegaron todas las muestras de la grabación (y, si se vacía el buffer, se leyeron)
+        if self.acquisition_mode == "window":
+            return self.board_shim.finished
+        return self.board_shim.consumed >= self.board_shim.total_samples
+
+    def now(self):
+        # Reloj de la GRABACIÓN: a máxima velocidad la histéresis de zonas
+        # debe medir segundos de sesión, no segundos de CPU.
+        if self.stats.last_timestamp is None:
+            return 0.0
+        return self.stats.last_timestamp
+
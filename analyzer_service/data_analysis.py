@@ -1,9 +1,14 @@
 import numpy as np
 import logging
-import time
-from collections import deque
 from brainflow.data_filter import DataFilter, FilterTypes, WindowOperations, DetrendOperations
 
+from dsp_filters import StreamingFilter, Decimator, ZeroPhaseFilter, get_ecg_cascade
+from spectral import SlidingWelch, BandSpectrumEstimator, BandPeriodogram
+from qrs_detector import StreamingQRSDetector
+from rolling_stats import RunningMedian
+from zone_engine import ZoneEngine, MIN_TIME_IN_ZONE_S
+from ring_buffer import RingBuffer
+
 """
 -----------------------------------------------------------------------------
 SUBSYSTEM: DSP & ALGORITMOS
@@ -15,29 +20,68 @@ datos crudos de ECG en una frecuencia cardíaca (BPM) estable y confiable.
 
 Pipeline de Procesamiento :
 1. Pre-procesamiento: Eliminación de tendencia (Detrend) y Ruido de red.
+   - Modo 'batch': re-filtra toda la ventana (zero-phase) en cada ciclo.
+     Motor 'brainflow' (4 llamadas a DataFilter) o 'fused' (cascada SOS única).
+   - Modo 'streaming': filtro IIR con estado, procesa solo las muestras nuevas.
 2. Estimación Espectral: Método de Welch para encontrar la frecuencia dominante.
+   - Motor 'brainflow': recalcula la PSD de toda la ventana en cada ciclo.
+   - Motor 'sliding' (requiere streaming): Welch incremental por segmentos.
+   - Motor 'band': evalúa solo la banda 0.75-3.8Hz con interpolación sub-bin.
+   - Diezmado opcional (ej. 250Hz -> 50Hz) antes de la estimación espectral.
+     El stream de onda (debug_ecg_data) sigue usando la señal a tasa completa.
+   - Motor de BPM 'qrs' (requiere streaming): reemplaza la Etapa 2 por un
+     detector de latidos (Pan-Tompkins) y BPM por intervalo RR.
 3. Filtrado Estadístico: Filtro de Mediana (Median Filter) para eliminar outliers.
 4. Suavizado Temporal: Media Móvil Exponencial (EMA) para transiciones suaves.
 5. Lógica de Negocio: Detección de cambios de zona con Histéresis temporal.
+
+Timestamps de Adquisición:
+Opcionalmente cada lote de muestras viaja con sus timestamps de la placa. El
+analizador los mantiene alineados con la ventana filtrada que retorna, así el
+BPM / cambio de zona de un ciclo se asocia a la muestra más reciente que lo
+produjo ('acquisition_timestamp') y cada chunk del stream a su primera muestra.
+
+Multi-Derivación (n_leads > 1, modo batch):
+La ventana llega como bloque [derivaciones x N]. Todas las derivaciones se
+filtran en UNA llamada (cascada fusionada 2-D) y la Etapa 2 estima pico y
+calidad de cada derivación con un estimador por filas. El BPM instantáneo sale
+de un voto ponderado por calidad: gana el grupo de derivaciones que coinciden
+(+-6 BPM) con mayor calidad total, y se promedia dentro de ese grupo. Una
+derivación ruidosa o desconectada no arrastra la estimación.
+
+Memoria:
+Los buffers de trabajo (copia de la ventana, filtro zero-phase, banco espectral,
+índices de banda) se reservan una sola vez. Con los motores 'fused' + 'band' el
+ciclo en régimen no asigna arrays nuevos: sin presión sobre el allocator ni
+pausas del GC con muchos atletas. Las llamadas a DataFilter (motor 'brainflow')
+siguen generando objetos temporales en el puente ctypes de BrainFlow.
 -----------------------------------------------------------------------------
 """
 
 class DataAnalyzer:
-    def __init__(self, sampling_rate, age=30):
+    def __init__(self, sampling_rate, age=30, filter_mode="batch", window_points=1024,
+                 filter_engine="brainflow", psd_engine="brainflow", decimate_to_hz=None,
+                 bpm_engine="spectral", median_window=40, n_leads=1):
         self.sampling_rate = sampling_rate
         self.age = age
+        self.filter_mode = filter_mode
+        self.filter_engine = filter_engine
+        self.psd_engine = psd_engine
+        self.bpm_engine = bpm_engine
+        self.window_points = window_points
+        self.n_leads = n_leads
         # Fórmula estándar de Karvonen/Fox para FC Máxima teórica
         self.max_hr = 220 - self.age
         
-        # Variables de estado del atleta
-        self.current_zone = 0
+        # Variables de estado del atleta (la zona actual vive en el motor de zonas)
         self.current_bpm = 0.0 
         
         # --- ETAPA 3: Filtro de Mediana ---
-        # Almacena las últimas 40 estimaciones de BPM.
+        # Almacena las últimas 40 estimaciones de BPM (configurable).
         # A 20Hz (ciclo del main), 40 muestras representan ~2 segundos de historia.
         # Esto permite ignorar picos erráticos de hasta 1 segundo sin afectar la salida.
-        self.bpm_history = deque(maxlen=40) 
+        # Mediana deslizante con dos heaps: O(log n) por ciclo, sin ordenar la ventana.
+        self.bpm_history = RunningMedian(median_window)
         
         # --- ETAPA 4: SUAVIZADO (EMA) ---
         # Exponential Moving Average.
@@ -47,19 +91,126 @@ class DataAnalyzer:
         self.ema_alpha = 0.15 
 
         # --- LÓGICA DE HISTÉRESIS (Anti-Rebote) ---
-        # Variables para confirmar que un cambio de zona es real y no ruido.
-        self.candidate_zone = 0
-        self.zone_candidate_start_time = 0 
+        # Umbrales de zona precalculados y estado del candidato (ver zone_engine).
         # Tiempo que el atleta debe mantener la nueva intensidad para confirmar el cambio.
-        self.MIN_TIME_IN_ZONE_S = 2.0
+        self.MIN_TIME_IN_ZONE_S = MIN_TIME_IN_ZONE_S
+        # Multi-derivación: dos estimaciones a menos de esto (BPM) votan juntas
+        self.LEAD_AGREEMENT_BPM = 6.0
+        self.zone_engine = ZoneEngine(self.max_hr, min_time_in_zone_s=self.MIN_TIME_IN_ZONE_S)
+
+        # --- MODO STREAMING (Etapa 1 con estado) ---
+        # Solo se instancia si se solicita; el modo batch no lo necesita.
+        self.stream_filter = None
+        if self.filter_mode == "streaming":
+            self.stream_filter = StreamingFilter(self.sampling_rate, window_points=self.window_points)
+        elif self.filter_mode != "batch":
+            raise ValueError(f"Modo de filtrado desconocido: {self.filter_mode}")
+
+        # --- MOTOR DE FILTRADO (Modo Batch) ---
+        # 'fused': cascada SOS diseñada una vez (cacheada) y aplicada en una sola pasada.
+        # Ambos motores trabajan sobre buffers pre-reservados del tamaño de la ventana.
+        # Multi-derivación: siempre la cascada fusionada 2-D (DataFilter filtra 1-D).
+        self.filter_sos = None
+        self.zero_phase = None
+        self._filter_buffer = np.zeros(self.window_points)
+        if self.filter_engine not in ("fused", "brainflow"):
+            raise ValueError(f"Motor de filtrado desconocido: {self.filter_engine}")
+        if self.filter_engine == "fused" or self.n_leads > 1:
+            self.filter_sos = get_ecg_cascade(self.sampling_rate)
+            self.zero_phase = ZeroPhaseFilter(self.filter_sos, self.window_points, n_signals=self.n_leads)
+
+        # TIMESTAMPS DE ADQUISICIÓN (alineados con la ventana filtrada retornada)
+        self.timestamps = None
+        self._timestamp_buffer = RingBuffer(self.window_points) if self.filter_mode == "streaming" else None
+
+        # --- RUTA MULTIRATE (Diezmado antes de la Etapa 2) ---
+        # La búsqueda llega solo a 3.8Hz: la PSD puede calcularse a 25-50Hz.
+        # Solo aplica a la estimación espectral; el filtrado sigue a tasa completa.
+        self.decimator = None
+        self.analysis_rate = self.sampling_rate
+        analysis_window = self.window_points
+        if decimate_to_hz:
+            if self.psd_engine == "brainflow":
+                # get_psd_welch exige nfft potencia de 2 y fs entera
+                raise ValueError("El diezmado requiere psd_engine='band' o 'sliding'")
+            self.decimator = Decimator(self.sampling_rate, decimate_to_hz, window_points=self.window_points)
+            self.analysis_rate = self.decimator.output_rate
+            analysis_window = len(self.decimator.window)
+        # Mínimo de puntos para una resolución espectral decente (100 pts a tasa completa)
+        self.min_analysis_points = int(100 * self.analysis_rate / self.sampling_rate)
+
+        # --- MOTOR ESPECTRAL (Etapa 2) ---
+        # 'sliding': Welch incremental alimentado con las muestras filtradas nuevas.
+        # Solo tiene sentido en modo streaming: en modo batch toda la ventana se
+        # re-filtra (zero-phase) y ningún segmento anterior sigue siendo válido.
+        self.sliding_welch = None
+        if self.psd_engine == "sliding":
+            if self.stream_filter is None:
+                raise ValueError("psd_engine='sliding' requiere filter_mode='streaming'")
+            self.sliding_welch = SlidingWelch(self.analysis_rate, window_points=analysis_window,
+                                              nperseg=analysis_window // 2, nfft=analysis_window)
+        # 'band': banco de bins solo en la banda fisiológica (válido en ambos modos)
+        self.band_estimator = None
+        if self.psd_engine == "band":
+            self.band_estimator = BandSpectrumEstimator(self.analysis_rate)
+        elif self.psd_engine not in ("brainflow", "sliding"):
+            raise ValueError(f"Motor espectral desconocido: {self.psd_engine}")
+        # Índices de la banda fisiológica por tamaño de PSD (evita np.where en cada ciclo)
+        self._band_bounds = {}
+
+        # --- MOTOR DE BPM ---
+        # 'spectral': pico dominante de la PSD (Etapa 2).
+        # 'qrs': detector de latidos en streaming; BPM por intervalo RR con latencia de
+        # un latido. La mediana se toma sobre los últimos latidos (no sobre ciclos del main).
+        self.qrs_detector = None
+        self.new_beats = []  # Latidos aún no consumidos por calculate_bpm: (muestra, tiempo_s, bpm_rr)
+        self.beat_history = RunningMedian(5)
+        if self.bpm_engine == "qrs":
+            if self.stream_filter is None:
+                raise ValueError("bpm_engine='qrs' requiere filter_mode='streaming'")
+            self.qrs_detector = StreamingQRSDetector(self.sampling_rate)
+        elif self.bpm_engine != "spectral":
+            raise ValueError(f"Motor de BPM desconocido: {self.bpm_engine}")
+
+        # --- MULTI-DERIVACIÓN (Etapas 1-2 sobre [derivaciones x N]) ---
+        self.lead_spectrum = None
+        self.lead_bpm = np.zeros(self.n_leads)
+        self.lead_quality = np.zeros(self.n_leads)
+        if self.n_leads > 1:
+            if self.filter_mode != "batch" or self.bpm_engine != "spectral" or self.decimator is not None:
+                raise ValueError("Multi-derivación requiere filter_mode='batch', bpm_engine='spectral' y sin diezmado")
+            if self.psd_engine == "band":
+                self.lead_spectrum = self.band_estimator
+            elif self.psd_engine == "brainflow":
+                # Misma rejilla que get_psd_welch (nperseg = ventana), una rfft por filas
+                self.lead_spectrum = BandPeriodogram(self.sampling_rate)
+            else:
+                raise ValueError("Multi-derivación requiere psd_engine='brainflow' o 'band'")
 
-    def filter_signal(self, ecg_data):
+    def filter_signal(self, ecg_data, timestamps=None):
          
         # ETAPA 1: Limpieza de Señal (DSP)
         # Aplica filtros digitales para aislar el complejo QRS del ruido ambiental.
+        # 'timestamps' (opcional): reloj de la placa de cada muestra de la ventana.
+        if timestamps is not None:
+            self.timestamps = timestamps
+
+        # Multi-derivación: todas las derivaciones en una sola llamada [derivaciones x N]
+        if np.ndim(ecg_data) == 2:
+            return self.zero_phase.apply(ecg_data)
+
+        # Motor fusionado: Detrend + Pasa-Banda + Notches en una sola pasada (ver dsp_filters)
+        # Nota: ambos motores retornan un buffer interno que se sobrescribe en el próximo ciclo.
+        if self.filter_engine == "fused":
+            return self.zero_phase.apply(ecg_data)
         
         # Trabajamos sobre una copia para no alterar el buffer original de BrainFlow
-        filtered_data = np.copy(ecg_data)
+        # (copiada sobre el buffer pre-reservado cuando la ventana tiene el tamaño esperado)
+        if len(ecg_data) == len(self._filter_buffer):
+            filtered_data = self._filter_buffer
+            np.copyto(filtered_data, ecg_data)
+        else:
+            filtered_data = np.copy(ecg_data)
         
         # 1. Detrend: Elimina el componente DC (línea base) que varía por respiración/movimiento.
         DataFilter.detrend(filtered_data, DetrendOperations.CONSTANT.value)
@@ -81,34 +232,112 @@ class DataAnalyzer:
         
         return filtered_data
 
-    def calculate_bpm(self, filtered_data):
+    def filter_new_samples(self, new_samples, timestamps=None):
+
+        # ETAPA 1 (Modo Streaming): Limpieza incremental de señal.
+        # Filtra SOLO las muestras que llegaron desde el último ciclo y las agrega
+        # a la ventana filtrada interna. Retorna la ventana completa para la PSD,
+        # o None mientras la ventana aún se está llenando.
+        # Nota: la ventana es el buffer interno (sin copia); se sobrescribe en el próximo ciclo.
+
+        if self.stream_filter is None:
+            raise RuntimeError("filter_new_samples requiere filter_mode='streaming'")
+
+        filtered_new = self.stream_filter.process(new_samples)
+        if timestamps is not None:
+            self._timestamp_buffer.append(timestamps)
+            self.timestamps = self._timestamp_buffer.view(len(self._timestamp_buffer))
+
+        # Ruta multirate: diezmamos solo las muestras nuevas (con estado)
+        spectral_new = filtered_new
+        if self.decimator is not None:
+            spectral_new = self.decimator.process(filtered_new)
+
+        # El Welch incremental solo procesa los segmentos que estas muestras completan
+        if self.sliding_welch is not None:
+            self.sliding_welch.update(spectral_new)
+
+        # Detector de latidos: conserva sus umbrales adaptativos entre chunks.
+        # Acumulamos hasta que calculate_bpm los consuma.
+        if self.qrs_detector is not None:
+            self.new_beats.extend(self.qrs_detector.process(filtered_new))
+
+        if not self.stream_filter.is_ready:
+            return None
+
+        return self.stream_filter.window
+
+    def calculate_bpm(self, filtered_data, window_intact=True):
         # ETAPAS 2, 3 y 4: Cálculo Robusto de BPM
         # Convierte la señal filtrada en un valor numérico estable.
+        # 'window_intact' (del diagnóstico de adquisición): si la ventana contiene
+        # muestras perdidas el pico espectral / el RR no son confiables, así que
+        # mantenemos el último valor sin alimentar la mediana.
+
+        if not window_intact:
+            self.new_beats = []
+            return self.current_bpm
+
+        if self.qrs_detector is not None:
+            return self._calculate_bpm_from_beats()
         
         try:
-            # --- ETAPA 2: Estimación Espectral (Welch) ---
-            nperseg = len(filtered_data)
-            # Necesitamos suficientes puntos para una resolución espectral decente
-            if nperseg < 100: return self.current_bpm 
-            
-            # Calculamos la Densidad Espectral de Potencia (PSD)
-            noverlap = nperseg // 2
-            psd_data = DataFilter.get_psd_welch(
-                filtered_data, nperseg, noverlap, 
-                self.sampling_rate, WindowOperations.BLACKMAN_HARRIS.value
-            )
-            psd_amps = psd_data[0] # Amplitudes
-            psd_freqs = psd_data[1] # Frecuencias (Eje X)
-
-            # Limitamos la búsqueda a un rango fisiológico humano posible (45 - 230 BPM)
-            # 0.75 Hz = 45 BPM
-            # 3.80 Hz = 228 BPM
-            min_idx = np.where(psd_freqs > 0.75)[0][0]
-            max_idx = np.where(psd_freqs > 3.8)[0][0]
-
-            # Encontramos la frecuencia con mayor energía (Pico dominante = Ritmo Cardíaco)
-            peak_idx_band = np.argmax(psd_amps[min_idx:max_idx])
-            peak_freq = psd_freqs[min_idx + peak_idx_band]
+            # --- RUTA MULTIRATE ---
+            # En streaming la ventana diezmada ya está al día; en batch la diezmamos aquí.
+            analysis_data = filtered_data
+            if self.decimator is not None:
+                if self.stream_filter is not None:
+                    if not self.decimator.is_ready: return self.current_bpm
+                    analysis_data = self.decimator.window
+                else:
+                    analysis_data = self.decimator.decimate(filtered_data)
+
+            # --- ETAPA 2: Estimación Espectral ---
+            if np.ndim(analysis_data) == 2:
+                # Multi-derivación: pico y calidad por derivación + voto ponderado
+                if analysis_data.shape[-1] < self.min_analysis_points: return self.current_bpm
+                peak_freq = self._vote_leads(analysis_data)
+                if peak_freq is None: return self.current_bpm
+            elif self.band_estimator is not None:
+                # Solo evaluamos la banda fisiológica (ya limitada a 45 - 228 BPM)
+                if len(analysis_data) < self.min_analysis_points: return self.current_bpm
+                peak_freq = self.band_estimator.peak_frequency(analysis_data)
+            else:
+                # Welch (completo o incremental)
+                if self.sliding_welch is not None:
+                    # Welch incremental: la PSD ya se actualizó en filter_new_samples
+                    if not self.sliding_welch.is_ready: return self.current_bpm
+                    # La suma sin normalizar basta para el argmax (evita un array por ciclo)
+                    psd_amps = self.sliding_welch.psd_sum
+                    psd_freqs = self.sliding_welch.freqs
+                else:
+                    nperseg = len(filtered_data)
+                    # Necesitamos suficientes puntos para una resolución espectral decente
+                    if nperseg < 100: return self.current_bpm 
+                    # El Welch de BrainFlow exige potencias de 2: con una ventana parcial
+                    # (pre-calentamiento) usamos el tramo más reciente que cumple
+                    if nperseg & (nperseg - 1):
+                        nperseg = 1 << (nperseg.bit_length() - 1)
+                        filtered_data = filtered_data[-nperseg:]
+                    
+                    # Calculamos la Densidad Espectral de Potencia (PSD)
+                    noverlap = nperseg // 2
+                    psd_data = DataFilter.get_psd_welch(
+                        filtered_data, nperseg, noverlap, 
+                        self.sampling_rate, WindowOperations.BLACKMAN_HARRIS.value
+                    )
+                    psd_amps = psd_data[0] # Amplitudes
+                    psd_freqs = psd_data[1] # Frecuencias (Eje X)
+
+                # Limitamos la búsqueda a un rango fisiológico humano posible (45 - 230 BPM)
+                # 0.75 Hz = 45 BPM
+                # 3.80 Hz = 228 BPM
+                min_idx, max_idx = self._get_band_bounds(psd_freqs)
+
+                # Encontramos la frecuencia con mayor energía (Pico dominante = Ritmo Cardíaco)
+                peak_idx_band = np.argmax(psd_amps[min_idx:max_idx])
+                peak_freq = psd_freqs[min_idx + peak_idx_band]
+
             raw_bpm_instant = peak_freq * 60.0
 
             # Validación básica de rango ("Sanity Check")
@@ -120,12 +349,12 @@ class DataAnalyzer:
             self.bpm_history.append(raw_bpm_instant)
             
             # Esperamos a tener suficientes datos para estadística confiable (mínimo 0.5s)
-            if len(self.bpm_history) < 10:
+            if len(self.bpm_history) < min(10, self.bpm_history.window):
                 return self.current_bpm
 
             # La mediana ignora matemáticamente los valores extremos (ruido/artefactos).
             # Si el historial es [60, 61, 200, 62, 59], la mediana es ~60, ignorando el 200.
-            median_bpm = float(np.median(self.bpm_history))
+            median_bpm = self.bpm_history.median()
 
             # ETAPA 4: Suavizado Exponencial (EMA) 
             if self.ema_bpm == 0.0:
@@ -144,43 +373,69 @@ class DataAnalyzer:
             # para no romper el flujo del programa.
             return self.current_bpm 
 
-    def detect_zone_change(self, bpm):
+    def _vote_leads(self, filtered_leads):
+        # Voto ponderado por calidad entre derivaciones. Retorna la frecuencia
+        # fusionada (Hz) o None si ninguna derivación es utilizable.
+        freqs, quality = self.lead_spectrum.peak_frequencies(filtered_leads, return_quality=True)
+        bpm = freqs * 60.0
+        # Derivaciones fuera del rango fisiológico no votan
+        quality = np.where((bpm >= 40) & (bpm <= 240), quality, 0.0)
+        self.lead_bpm[:] = bpm
+        self.lead_quality[:] = quality
+        if not quality.any():
+            return None
+
+        # Apoyo de cada estimación = calidad total de las derivaciones que coinciden con ella
+        agree = np.abs(bpm[:, None] - bpm[None, :]) <= self.LEAD_AGREEMENT_BPM
+        support = agree @ quality
+        members = agree[np.argmax(support)] & (quality > 0.0)
+        return float(np.average(freqs[members], weights=quality[members]))
+
+    def _get_band_bounds(self, psd_freqs):
+        # La rejilla de frecuencias solo depende del tamaño de la ventana: se calcula una vez
+        bounds = self._band_bounds.get(len(psd_freqs))
+        if bounds is None:
+            bounds = (int(np.where(psd_freqs > 0.75)[0][0]), int(np.where(psd_freqs > 3.8)[0][0]))
+            self._band_bounds[len(psd_freqs)] = bounds
+        return bounds
+
+    def _calculate_bpm_from_beats(self):
+        # Motor 'qrs': el BPM se actualiza solo cuando llega un latido nuevo.
+        for _, _, rr_bpm in self.new_beats:
+            # Validación básica de rango ("Sanity Check"); el primer latido no tiene RR
+            if rr_bpm < 40 or rr_bpm > 240:
+                continue
+            self.beat_history.append(rr_bpm)
+        self.new_beats = []
+
+        # Mediana de los últimos 5 latidos: tolera un latido perdido o uno espurio
+        if len(self.beat_history) >= 3:
+            self.current_bpm = self.beat_history.median()
+        return self.current_bpm
+
+    @property
+    def acquisition_timestamp(self):
+        # Reloj de la placa de la muestra más reciente analizada (None sin timestamps)
+        if self.timestamps is None or len(self.timestamps) == 0:
+            return None
+        return float(self.timestamps[-1])
+
+    def chunk_timestamp(self, n_points):
+        # Reloj de la placa de la primera de las últimas 'n_points' muestras (chunk del stream)
+        if self.timestamps is None or len(self.timestamps) == 0:
+            return None
+        return float(self.timestamps[-min(n_points, len(self.timestamps))])
+
+    @property
+    def current_zone(self):
+        return int(self.zone_engine.current_zone[0])
+
+    def detect_zone_change(self, bpm, now=None):
         # ETAPA 5: Máquina de Estados de Zonas (Histéresis)
-        # Determina la zona de esfuerzo (1-5) basada en % de FC Max.
+        # Determina la zona de esfuerzo (1-5) basada en % de FC Max:
+        # 1 Calentamiento (<60%) | 2 Aeróbica (60-70%) | 3 Glicolitica 1 (70-80%)
+        # 4 Glicolitica 2 (80-90%) | 5 Fosfagenica (>90%)
+        # El cambio solo se confirma si la nueva zona se mantiene MIN_TIME_IN_ZONE_S segundos.
+        # 'now' permite inyectar el instante del ciclo (por defecto time.time()).
         # Retorna: (bool: hubo_cambio, int: zona_anterior, int: zona_nueva)
-        
-        # 1. Clasificación Pura (Umbrales porcentuales)
-        if bpm < (self.max_hr * 0.6): p_zone = 1      # Calentamiento (<60%)
-        elif bpm < (self.max_hr * 0.7): p_zone = 2    # Aeróbica      (60-70%)
-        elif bpm < (self.max_hr * 0.8): p_zone = 3    # Glicolitica 1 (70-80%)
-        elif bpm < (self.max_hr * 0.9): p_zone = 4    # Glicolitica 2 (80-90%)
-        else: p_zone = 5                              # Fosfagenica   (>90%)
-        
-        # CASO A: Seguimos en la misma zona actual
-        if p_zone == self.current_zone:
-            self.candidate_zone = 0
-            self.zone_candidate_start_time = 0
-            return (False, 0, 0)
-
-        # CASO B: Detectamos una zona potencial distinta, pero es la primera vez (Inicia contador)
-        if p_zone != self.candidate_zone:
-            self.candidate_zone = p_zone
-            self.zone_candidate_start_time = time.time()
-            return (False, 0, 0)
-        
-        # CASO C: La zona potencial se mantiene estable (Evaluamos Histéresis)
-        if p_zone == self.candidate_zone:
-            elapsed = time.time() - self.zone_candidate_start_time
-            
-            # Solo confirmamos el cambio si la nueva zona se ha mantenido por X segundos
-            if elapsed >= self.MIN_TIME_IN_ZONE_S:
-                old = self.current_zone
-                self.current_zone = self.candidate_zone # ¡Cambio Confirmado!
-                
-                # Reset de variables temporales
-                self.candidate_zone = 0
-                self.zone_candidate_start_time = 0
-                
-                return (True, old, self.current_zone)
-        
-        return (False, 0, 0)
\ No newline at end of file
+        return self.zone_engine.detect_zone_change(bpm, now)
@@ -4,9 +4,13 @@ import threading
 import os
 import numpy as np
 
+from board_manager import BoardManager
+from board_descriptor import DEFAULT_CACHE_PATH
 from brainflow_handler import BrainflowHandler
 from data_analysis import DataAnalyzer
+from batch_analysis import BatchDataAnalyzer
 from mqtt_handler import MQTTPublisher
+from scheduler import DeadlineScheduler, SampleCountTrigger
 
 """
 -----------------------------------------------------------------------------
@@ -26,7 +30,10 @@ Responsabilidades:
 
 Arquitectura:
 - Ejecución: Single-process con un hilo secundario para el simulador.
-- Ciclo de Vida: Bucle infinito controlado por tiempo (20Hz).
+- Multi-Atleta: N placas (una por atleta, ver board_manager) leídas en paralelo,
+  con un DataAnalyzer por atleta o, con ANALYSIS_MODE=team, un BatchDataAnalyzer
+  que filtra y estima la PSD de todo el equipo en una sola llamada por ciclo.
+- Ciclo de Vida: Bucle infinito controlado por deadlines fijos (20Hz, ver scheduler).
 -----------------------------------------------------------------------------
 """
 
@@ -37,12 +44,88 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - SERVICIO - %(messa
 # Permite ajustar parámetros desde docker-compose.yml sin tocar el código.
 TEST_AGE = int(os.getenv("TEST_AGE", "30"))
 USER_ID = os.getenv("USER_ID", "atleta_01")
+# Equipo completo en un proceso: "atleta_01:30,atleta_02:25" (una placa por atleta).
+# Vacío = un único atleta (USER_ID / TEST_AGE).
+ATHLETES = os.getenv("ATHLETES", "")
 DATA_WINDOW_POINTS = int(os.getenv("DATA_WINDOW_POINTS", "1024")) 
+# Adquisición: 'window' (ventana completa de todos los canales por ciclo) o
+# 'incremental' (solo muestras nuevas, fila ECG en buffer local sin copias)
+ACQUISITION_MODE = os.getenv("ACQUISITION_MODE", "window")
+# Modo de filtrado: 'batch' (re-filtra la ventana completa) o 'streaming' (solo muestras nuevas)
+FILTER_MODE = os.getenv("FILTER_MODE", "batch")
+# Motor del modo batch: 'brainflow' (4 llamadas DataFilter) o 'fused' (cascada SOS única)
+FILTER_ENGINE = os.getenv("FILTER_ENGINE", "brainflow")
+# Motor espectral: 'brainflow' (PSD completa por ciclo), 'sliding' (Welch incremental, requiere streaming)
+# o 'band' (solo banda 0.75-3.8Hz con interpolación sub-bin; permite ventanas más cortas)
+PSD_ENGINE = os.getenv("PSD_ENGINE", "brainflow")
+# Tasa de análisis espectral en Hz (ej. 50). 0 = sin diezmado (tasa completa de la placa)
+DECIMATE_TO_HZ = float(os.getenv("DECIMATE_TO_HZ", "0")) or None
+# Motor de BPM: 'spectral' (pico de la PSD) o 'qrs' (detector de latidos, requiere streaming)
+BPM_ENGINE = os.getenv("BPM_ENGINE", "spectral")
+# Longitud del filtro de mediana de BPM (en ciclos del main; 40 = ~2 s a 20Hz)
+MEDIAN_WINDOW = int(os.getenv("MEDIAN_WINDOW", "40"))
+# Análisis: 'athlete' (un DataAnalyzer por atleta) o 'team' (BatchDataAnalyzer: matriz
+# [atletas x ventana], un filtrado SOS fusionado y una PSD por ciclo para todo el equipo).
+# 'team' requiere FILTER_MODE=batch, BPM_ENGINE=spectral, una derivación, sin diezmado ni
+# pre-calentamiento; PSD_ENGINE=band usa el banco de bins y el resto el periodograma.
+ANALYSIS_MODE = os.getenv("ANALYSIS_MODE", "athlete")
+
+# Grabación / Reproducción de sesiones (ver recording.py)
+# RECORD_DIR: graba la sesión cruda de cada atleta en '{RECORD_DIR}/{user_id}.msrr'.
+# REPLAY_DIR: reemplaza las placas por esas grabaciones (sin hardware ni simulador).
+RECORD_DIR = os.getenv("RECORD_DIR", "")
+REPLAY_DIR = os.getenv("REPLAY_DIR", "")
+# Ritmo de reproducción: 1.0 = tiempo real, N = N veces más rápido, 0 = máxima velocidad
+REPLAY_SPEED = float(os.getenv("REPLAY_SPEED", "1.0"))
+
+# Formato del stream de onda (debug_ecg_data): 'json' (formato de texto, el único que
+# entienden visualizadorpostmqtt.py y visualizadorpostmqttV2.py) o 'float32' / 'int16'
+# (binario, ver wire_format.py; requiere un consumidor con decode_ecg_frame, como el V3)
+ECG_WIRE_FORMAT = os.getenv("ECG_WIRE_FORMAT", "json")
+# Capacidad de las colas de envío de status y stream (se descarta el más viejo al llenarse).
+# Los eventos de zona no tienen límite: nunca se descartan.
+MQTT_QUEUE_SIZE = int(os.getenv("MQTT_QUEUE_SIZE", "256"))
+# Agrupación del stream de onda: se publica cada STREAM_BATCH_MS (0 = un mensaje por chunk)
+# o al juntar STREAM_BATCH_SAMPLES muestras (0 = sin límite de tamaño).
+# STREAM_BATCH_USERS=1 empaqueta todos los atletas en una sola trama (requiere formato binario).
+STREAM_BATCH_MS = float(os.getenv("STREAM_BATCH_MS", "0"))
+STREAM_BATCH_SAMPLES = int(os.getenv("STREAM_BATCH_SAMPLES", "0"))
+STREAM_BATCH_USERS = os.getenv("STREAM_BATCH_USERS", "0") == "1"
+# Stream bajo demanda: el stream de onda solo se publica para los atletas que algún
+# consumidor pide con un lease vigente (ver stream_lease.py). 0 = publicar siempre.
+# Solo el visualizador V3 publica leases: con los visualizadores viejos debe quedar en 0.
+STREAM_LEASE = os.getenv("STREAM_LEASE", "0") == "1"
+
+# MULTI-DERIVACIÓN: derivaciones ECG por atleta ('all' = todas las de la placa).
+# Con más de una el BPM sale de un voto ponderado por calidad (requiere FILTER_MODE=batch).
+ECG_LEADS = os.getenv("ECG_LEADS", "1")
+
+# ARRANQUE RÁPIDO (Docker 'restart: unless-stopped' es el mecanismo de recuperación)
+# Segundos de datos con los que se entrega la primera ventana parcial (modo batch).
+# 0 = esperar la ventana completa (~4 s con 1024 puntos a 250Hz). Opcional: solo con
+# PSD_ENGINE=band y >= 2.5 s conserva la precisión del primer BPM (ver 'tester_rendimiento.py
+# arranque'); con la PSD de BrainFlow la ventana parcial se recorta a un Welch de 256-512 pts
+# (bins de ~30-60 BPM) y se ignora.
+PREWARM_S = float(os.getenv("PREWARM_S", "0"))
+# Caché JSON de la metadata de la placa ("" = sin caché en disco)
+BOARD_DESCR_CACHE = os.getenv("BOARD_DESCR_CACHE", DEFAULT_CACHE_PATH)
+# Logs internos de BrainFlow (verbosos): se habilitan tras el primer BPM, no durante el arranque
+BRAINFLOW_DEV_LOGGER = os.getenv("BRAINFLOW_DEV_LOGGER", "1") == "1"
+
+# Cada cuántos segundos se reportan los contadores de adquisición (pérdidas, jitter, tasa)
+STATS_LOG_INTERVAL_S = float(os.getenv("STATS_LOG_INTERVAL_S", "10"))
 
 # SINCRONIZACIÓN DE BUCLE
 # Velocidad del bucle principal: 0.05s (20Hz).
 # Esto define la frecuencia de actualización de los cálculos y el envío MQTT.
 LOOP_SPEED_S = 0.05
+# Ciclos atrasados bajo carga: 'merge' (un ciclo procesa todos los periodos vencidos)
+# o 'skip' (se descartan y se vuelve a la grilla de 50 ms)
+LOOP_POLICY = os.getenv("LOOP_POLICY", "merge")
+# Disparo del ciclo: 'timer' (grilla de 50 ms) o 'samples' (cuando una placa acumula
+# TRIGGER_SAMPLES muestras nuevas; el chunk MQTT son exactamente esas muestras)
+TRIGGER_MODE = os.getenv("TRIGGER_MODE", "timer")
+TRIGGER_SAMPLES = int(os.getenv("TRIGGER_SAMPLES", "12"))
 
 # Duración de cada "Zona de Esfuerzo" en la simulación.
 SIMULATION_DURATION_S = 20 
@@ -84,83 +167,381 @@ def run_scenario_simulator(board_handler):
                 scenario_zone = 1
                 going_up = True
 
+def parse_athletes(spec):
+    """ 'id:edad,id:edad' -> [(id, edad), ...]. Sin especificación: el atleta único de USER_ID """
+    if not spec.strip():
+        return [(USER_ID, TEST_AGE)]
+    athletes = []
+    for item in spec.split(","):
+        user_id, _, age = item.strip().partition(":")
+        athletes.append((user_id, int(age) if age else TEST_AGE))
+    return athletes
+
+def log_acquisition_stats(user_id, stats, previous_dropped):
+    """ Reporta la salud del stream; escala a WARNING si hubo pérdidas nuevas """
+    snap = stats.snapshot()
+    message = (f"[{user_id}] Adquisición: {snap['samples_received']} muestras | Perdidas {snap['dropped_samples']} "
+               f"({snap['drop_rate_pct']:.2f}%, {snap['gap_events']} huecos) | Desbordes {snap['overruns']} | "
+               f"Backlog máx {snap['max_backlog']} | Jitter {snap['jitter_ms']:.2f} ms | "
+               f"Tasa efectiva {snap['effective_rate_hz']:.1f} Hz")
+    if snap['dropped_samples'] > previous_dropped or snap['overruns']:
+        logging.warning(message + " -> posible CPU saturada o bucle atrasado")
+    else:
+        logging.info(message)
+    return snap['dropped_samples']
+
+def log_scheduler_stats(scheduler):
+    """ Reporta la puntualidad del bucle principal """
+    snap = scheduler.snapshot()
+    histogram = " ".join(f"{label}:{count}" for label, count in snap['lateness_histogram'].items() if count)
+    message = (f"Bucle: {snap['ticks']} ciclos | Retraso medio {snap['mean_lateness_ms']:.2f} ms "
+               f"(máx {snap['max_lateness_ms']:.1f}) | Desbordes {snap['overruns']} "
+               f"(máx {snap['max_overrun_ms']:.1f} ms) | Fusionados {snap['merged_ticks']} | "
+               f"Salteados {snap['skipped_ticks']} | Histograma [{histogram}]")
+    if snap['overruns'] or snap['skipped_ticks']:
+        logging.warning(message)
+    else:
+        logging.info(message)
+    scheduler.reset_stats()
+
+def log_trigger_stats(trigger):
+    """ Reporta el disparo por muestras (ciclos, espera y tamaño medio de chunk) """
+    snap = trigger.snapshot()
+    logging.info(f"Disparo por muestras: {snap['ticks']} ciclos | {snap['mean_samples_per_tick']:.1f} muestras/ciclo | "
+                 f"Consultas vacías {snap['idle_polls']} | Esperas agotadas {snap['timeouts']}")
+    trigger.reset_stats()
+
+def log_mqtt_stats(mqtt):
+    """ Reporta la cola de envío MQTT; escala a WARNING si hubo descartes o fallos """
+    snap = mqtt.snapshot()
+    parts = [f"{priority} {s['sent']}/{s['enqueued']} enviados (cola {s['queued']}, en vuelo {s['in_flight']}, "
+             f"descartados {s['dropped']}, fallidos {s['failed']}, ack {s['mean_ack_ms']:.1f}/{s['max_ack_ms']:.1f} ms)"
+             for priority, s in snap.items()]
+    message = "MQTT: " + " | ".join(parts)
+    if mqtt.stream_lease:
+        leases = mqtt.lease_snapshot()
+        message += (f" | stream bajo demanda: {leases['leases']} leases, {leases['gated_chunks']} chunks sin "
+                    f"lease, {leases['coalesced_chunks']} agrupados por tasa")
+    if any(s['dropped'] or s['failed'] for s in snap.values()):
+        logging.warning(message + " -> broker lento o red caída")
+    else:
+        logging.info(message)
+    mqtt.reset_stats()
+
+def mark_startup(startup, key, label):
+    """ Registra (una sola vez) un hito del arranque en segundos desde el inicio de main() """
+    if startup.get(key) is None:
+        startup[key] = time.monotonic() - startup["t0"]
+        logging.info(f"ARRANQUE: {label} a los {startup[key]:.2f}s")
+
+def process_athlete(user_id, analyzer, board, ecg_data_raw, mqtt):
+    """
+    Pipeline completo de un atleta para las muestras de este ciclo.
+    El chunk MQTT son exactamente las muestras nuevas de esta lectura (con su índice).
+    Retorna (bpm, hubo_cambio_de_zona), o None si aún no hay ventana filtrada.
+    """
+
+    # B. PROCESAMIENTO DE SEÑAL (DSP)
+    # Aplicamos filtros Pasa-Banda (1-50Hz) y Notch (50/60Hz)
+    if FILTER_MODE == "streaming":
+        # El filtro conserva su estado: solo procesamos los puntos nuevos
+        # y recibimos la ventana filtrada completa para la PSD.
+        n_new = len(ecg_data_raw)
+        filtered_data = analyzer.filter_new_samples(ecg_data_raw, timestamps=board.timestamps(n_new))
+        if filtered_data is None:
+            return None
+    else:
+        # Usamos la ventana completa para que los filtros funcionen mejor.
+        n_new = board.last_read_count
+        filtered_data = analyzer.filter_signal(ecg_data_raw, timestamps=board.timestamps(np.shape(ecg_data_raw)[-1]))
+    
+    # C. ANÁLISIS MATEMÁTICO (Extracción de Características)
+    # Calculamos BPM usando Welch + Filtro de Mediana
+    # Si la ventana tiene huecos (muestras perdidas) se conserva el último BPM
+    bpm = analyzer.calculate_bpm(filtered_data, window_intact=board.window_intact)
+    # Multi-derivación: el stream de onda lleva solo la primera derivación
+    if np.ndim(filtered_data) == 2:
+        filtered_data = filtered_data[0]
+    
+    # D. DETECCION DE EVENTOS
+    # Verificamos si el atleta cambió de Zona de Frecuencia Cardíaca
+    # El reloj lo da la placa: en una reproducción acelerada es el de la grabación
+    (change, old_z, new_z) = analyzer.detect_zone_change(bpm, now=board.now())
+
+    # E. COMUNICACIÓN (MQTT)
+    # Todos los mensajes llevan el reloj de la placa de la muestra que los originó
+    # (no el instante de publicación) y la latencia adquisición -> publicación.
+    acquisition_ts = analyzer.acquisition_timestamp
+    
+    # Tópico 1: EVENTOS (Alta Prioridad - QoS 1)
+    # Solo se envía cuando ocurre un cambio de estado significativo.
+    if change:
+        logging.info(f"[{user_id}] ¡CAMBIO DETECTADO! Zona {old_z} -> {new_z} (BPM: {bpm:.2f})")
+        mqtt.publish_zone_change(user_id, old_z, new_z, bpm, acquisition_ts=acquisition_ts)
+    
+    # Tópico 2: STATUS (Baja Prioridad - QoS 0)
+    # Heartbeat del sistema (1 vez por ciclo) para dashboards.
+    mqtt.publish_status(user_id, bpm, analyzer.current_zone, acquisition_ts=acquisition_ts)
+
+    # Tópico 3: STREAM DE ONDA (Alta Frecuencia)
+    # Aquí ocurre la magia del streaming. Recortamos ("Slicing") solo
+    # el final del array filtrado para enviarlo al visualizador.
+    # El chunk son exactamente las muestras nuevas de la lectura (no un tamaño fijo
+    # 'fs * 0.05': con deriva del bucle repetía o salteaba muestras) y viaja con el
+    # índice de su primera muestra; el consumidor lo verifica con StreamReassembler.
+    # Con backlog mayor que la ventana solo se envía la cola disponible.
+    n_send = min(n_new, len(filtered_data))
+    if n_send > 0:
+        first_index = board.last_read_index + board.last_read_count - n_send
+        mqtt.publish_ecg_data(filtered_data[-n_send:], user_id, sample_index=first_index,
+                              acquisition_ts=analyzer.chunk_timestamp(n_send))
+
+    return bpm, change
+
+def board_timestamp(board, n_points=1):
+    """ Reloj de la placa de la primera de sus últimas 'n_points' muestras (None sin timestamps) """
+    stamps = board.timestamps(n_points)
+    return float(stamps[0]) if len(stamps) else None
+
+def team_analysis_conflicts(prewarm_s):
+    """ Opciones que impiden el análisis por lotes (ANALYSIS_MODE=team) """
+    conflicts = []
+    if FILTER_MODE != "batch":
+        conflicts.append(f"FILTER_MODE={FILTER_MODE}")
+    if BPM_ENGINE != "spectral":
+        conflicts.append(f"BPM_ENGINE={BPM_ENGINE}")
+    if PSD_ENGINE == "sliding":
+        conflicts.append(f"PSD_ENGINE={PSD_ENGINE}")
+    if ECG_LEADS != "1":
+        conflicts.append(f"ECG_LEADS={ECG_LEADS}")
+    if DECIMATE_TO_HZ:
+        conflicts.append(f"DECIMATE_TO_HZ={DECIMATE_TO_HZ:g}")
+    if prewarm_s:
+        conflicts.append(f"PREWARM_S={prewarm_s:g}")
+    return conflicts
+
+def process_team(team, team_ids, windows, boards, readings, mqtt):
+    """
+    Pipeline de todo el equipo para este ciclo (ANALYSIS_MODE=team): las ventanas se copian
+    a la matriz 'windows' [atletas x ventana] y se filtran y analizan en una sola llamada.
+    Los atletas sin lectura nueva (o con huecos en la ventana) conservan su BPM.
+    Retorna {user_id: (bpm, hubo_cambio_de_zona)} de los atletas con lectura o cambio de zona.
+    """
+    fresh = np.zeros(len(team_ids), dtype=bool)
+    intact = np.zeros(len(team_ids), dtype=bool)
+    for row, user_id in enumerate(team_ids):
+        ecg_data_raw = readings.get(user_id)
+        if ecg_data_raw is None or len(ecg_data_raw) != windows.shape[1]:
+            continue
+        windows[row] = ecg_data_raw
+        fresh[row] = True
+        intact[row] = boards.handlers[user_id].window_intact
+
+    # B - D. Filtrado, BPM y zonas de todo el equipo (una llamada por etapa)
+    filtered = team.filter_signals(windows)
+    bpm = team.calculate_bpm(filtered, active=fresh & intact)
+    now = np.array([boards.handlers[user_id].now() for user_id in team_ids])
+    # La histéresis avanza para todos: un atleta sin lectura nueva confirma su zona a tiempo
+    changed, old_zone, new_zone = team.detect_zone_changes(bpm, now=now)
+
+    # E. COMUNICACIÓN (MQTT): mismos tópicos y campos que process_athlete
+    results = {}
+    for row, user_id in enumerate(team_ids):
+        board = boards.handlers[user_id]
+        athlete_bpm = float(bpm[row])
+        acquisition_ts = board_timestamp(board)
+        if changed[row]:
+            logging.info(f"[{user_id}] ¡CAMBIO DETECTADO! Zona {old_zone[row]} -> {new_zone[row]} (BPM: {athlete_bpm:.2f})")
+            mqtt.publish_zone_change(user_id, int(old_zone[row]), int(new_zone[row]), athlete_bpm,
+                                     acquisition_ts=acquisition_ts)
+        if fresh[row]:
+            mqtt.publish_status(user_id, athlete_bpm, int(team.current_zone[row]), acquisition_ts=acquisition_ts)
+            n_send = min(board.last_read_count, windows.shape[1])
+            if n_send > 0:
+                first_index = board.last_read_index + board.last_read_count - n_send
+                mqtt.publish_ecg_data(filtered[row, -n_send:], user_id, sample_index=first_index,
+                                      acquisition_ts=board_timestamp(board, n_send))
+        if fresh[row] or changed[row]:
+            results[user_id] = (athlete_bpm, bool(changed[row]))
+    return results
+
 def main():
     logging.info("--> INICIANDO SERVICIO DE ANALISIS (BACKEND) <--")
+    # Métricas de arranque: sesiones listas, primer BPM, todos con BPM, primer evento de zona
+    startup = {"t0": time.monotonic()}
     
     # INICIALIZACIÓN DE COMPONENTES
     try:
-        # Hardware: Interfaz con BrainFlow (C++)
-        board = BrainflowHandler(num_points=DATA_WINDOW_POINTS)
-        # Lógica: Algoritmos matemáticos
-        analyzer = DataAnalyzer(sampling_rate=board.sampling_rate, age=TEST_AGE)
+        # Hardware: una placa BrainFlow (C++) por atleta, gestionadas en conjunto
+        athletes = parse_athletes(ATHLETES)
+        # El disparo por muestras cuenta lo pendiente en el buffer de BrainFlow: las lecturas
+        # deben vaciarlo ('window' + batch nunca lo vacía => se pasa a 'incremental')
+        acquisition_mode = ACQUISITION_MODE
+        # El pre-calentamiento aplica al re-filtrado de la ventana (batch) con la PSD por banda
+        prewarm_s = PREWARM_S if FILTER_MODE == "batch" else 0.0
+        if prewarm_s and PSD_ENGINE != "band":
+            logging.warning(f"PREWARM_S={PREWARM_S} ignorado: la ventana parcial degrada el primer BPM "
+                            f"con PSD_ENGINE={PSD_ENGINE} (usar 'band')")
+            prewarm_s = 0.0
+        if TRIGGER_MODE == "samples" and FILTER_MODE != "streaming" and acquisition_mode == "window":
+            logging.info("Disparo por muestras: adquisición 'window' -> 'incremental'")
+            acquisition_mode = "incremental"
+        boards = BoardManager(athletes, num_points=DATA_WINDOW_POINTS, acquisition_mode=acquisition_mode,
+                              record_dir=RECORD_DIR or None, replay_dir=REPLAY_DIR or None,
+                              replay_speed=REPLAY_SPEED, descr_cache=BOARD_DESCR_CACHE or None,
+                              ecg_leads=0 if ECG_LEADS == "all" else int(ECG_LEADS),
+                              prewarm_s=prewarm_s)
+        # Lógica: Algoritmos matemáticos (un analizador con estado propio por atleta,
+        # o uno solo por lotes para todo el equipo)
+        team = None
+        analyzers = {}
+        team_ids = [user_id for user_id, _ in athletes]
+        if ANALYSIS_MODE == "team":
+            conflicts = team_analysis_conflicts(prewarm_s)
+            if conflicts:
+                logging.warning(f"ANALYSIS_MODE=team ignorado (requiere batch con una derivación): "
+                                f"{', '.join(conflicts)}")
+            else:
+                team = BatchDataAnalyzer(boards.sampling_rate, [age for _, age in athletes],
+                                         window_points=DATA_WINDOW_POINTS,
+                                         psd_engine="band" if PSD_ENGINE == "band" else "fft",
+                                         median_window=MEDIAN_WINDOW)
+                # Matriz de ventanas reutilizada en cada ciclo (sin asignaciones por atleta)
+                team_windows = np.zeros((len(team_ids), DATA_WINDOW_POINTS))
+        if team is None:
+            analyzers = {
+                user_id: DataAnalyzer(sampling_rate=boards.sampling_rate, age=age,
+                                      filter_mode=FILTER_MODE, window_points=DATA_WINDOW_POINTS,
+                                      filter_engine=FILTER_ENGINE, psd_engine=PSD_ENGINE,
+                                      decimate_to_hz=DECIMATE_TO_HZ, bpm_engine=BPM_ENGINE,
+                                      median_window=MEDIAN_WINDOW,
+                                      n_leads=boards.handlers[user_id].n_leads)
+                for user_id, age in athletes
+            }
         # Red: Cliente MQTT
-        mqtt = MQTTPublisher(broker_host="mqtt-broker") 
+        batch_users = STREAM_BATCH_USERS
+        if batch_users and ECG_WIRE_FORMAT == "json":
+            logging.warning("STREAM_BATCH_USERS=1 ignorado: las tramas multi-atleta requieren "
+                            "ECG_WIRE_FORMAT binario (float32 / int16)")
+            batch_users = False
+        mqtt = MQTTPublisher(broker_host="mqtt-broker", ecg_format=ECG_WIRE_FORMAT,
+                             sampling_rate=boards.sampling_rate, queue_size=MQTT_QUEUE_SIZE,
+                             batch_ms=STREAM_BATCH_MS, batch_max_samples=STREAM_BATCH_SAMPLES,
+                             batch_users=batch_users, stream_lease=STREAM_LEASE,
+                             # Reproducción: timestamps rebasados al arranque; la latencia
+                             # solo es real si las muestras llegan a velocidad 1.0
+                             report_latency=not boards.replaying or REPLAY_SPEED == 1.0)
     except Exception as e:
         logging.critical(f"Error fatal iniciando componentes: {e}")
         return
 
     try:
         # ARRANQUE DE PROCESOS
-        board.start(age=TEST_AGE)
+        boards.start()
+        mark_startup(startup, "boards_ready", "placas listas")
+        athletes_with_bpm = set()
         
         # Iniciamos el simulador en un hilo paralelo para no bloquear el análisis
-        sim_thread = threading.Thread(target=run_scenario_simulator, args=(board,), daemon=True)
-        sim_thread.start()
+        # (una reproducción ya trae sus cambios de zona grabados)
+        if not boards.replaying:
+            sim_thread = threading.Thread(target=run_scenario_simulator, args=(boards,), daemon=True)
+            sim_thread.start()
+        else:
+            logging.info(f"Reproduciendo sesiones de {REPLAY_DIR} (velocidad {REPLAY_SPEED or 'máxima'})")
+
+        # Reproducción a máxima velocidad: sin esperas entre ciclos
+        fast_forward = boards.replaying and REPLAY_SPEED <= 0
         
-        # CALCULO DE TAMAÑO DE PAQUETE (STREAMING)
+        # TAMAÑO DE PAQUETE (STREAMING)
         # Para enviar la señal ECG en tiempo real, no enviamos toda la ventana (1024 pts)
         # en cada ciclo, porque eso duplicaría datos y saturaría la red.
-        # Enviamos solo los puntos NUEVOS generados en los últimos 0.05 segundos.
-        # Fórmula: Frecuencia (250Hz) * Tiempo (0.05s) = ~12.5 puntos.
-        points_per_chunk = int(board.sampling_rate * LOOP_SPEED_S)
-        if points_per_chunk < 1: points_per_chunk = 1
+        # Enviamos solo los puntos NUEVOS de cada lectura: ~fs * 0.05 = ~12.5 puntos
+        # por ciclo a 250Hz (el número exacto lo da la placa, ver process_athlete).
+        if TRIGGER_MODE == "samples":
+            trigger = SampleCountTrigger(boards.handlers, TRIGGER_SAMPLES)
+            pace = f"Disparo cada {TRIGGER_SAMPLES} muestras"
+        else:
+            pace = f"Bucle {LOOP_SPEED_S}s | Chunk MQTT ~{boards.sampling_rate * LOOP_SPEED_S:.1f} pts"
         
-        logging.info(f"Configuración: Bucle {LOOP_SPEED_S}s | Chunk MQTT {points_per_chunk} pts")
+        if team is not None:
+            engines = f"Análisis por equipo (fused/{team.psd_engine})"
+        else:
+            engines = f"Filtro {FILTER_MODE}/{FILTER_ENGINE} | PSD {PSD_ENGINE} | BPM {BPM_ENGINE}"
+        logging.info(f"Configuración: {len(boards)} atleta(s) | {pace} | Adquisición {acquisition_mode} | {engines}")
+
+        # Diagnóstico de adquisición: reporte periódico por placa
+        last_stats_log = time.monotonic()
+        reported_dropped = {user_id: 0 for user_id in team_ids}
+
+        # Control de Ritmo (20Hz): deadlines fijos sobre el reloj monótono
+        scheduler = DeadlineScheduler(LOOP_SPEED_S, policy=LOOP_POLICY)
+        scheduler.start()
 
         # BUCLE PRINCIPAL (MAIN LOOP)
         while True:
-            # A. ADQUISICIÓN DE DATOS
-            # Obtenemos la ventana deslizante completa (ej. últimos 4 segundos)
-            ecg_data_raw = board.get_data()
+            # Disparo por muestras: solo se leen las placas con >= K muestras nuevas.
+            # Por reloj: reproducción a máxima velocidad sin esperas entre ciclos.
+            ready = None
+            if TRIGGER_MODE == "samples":
+                ready = trigger.wait()
+            elif not fast_forward:
+                scheduler.wait()
+
+            # A. ADQUISICIÓN DE DATOS (todas las placas en paralelo)
+            # Streaming: SOLO las muestras nuevas desde el último ciclo.
+            # Batch: la ventana deslizante completa (ej. últimos 4 segundos).
+            readings = boards.poll(streaming=FILTER_MODE == "streaming", user_ids=ready)
+            # Stream agrupado / limitado por tasa: sale al vencer su plazo aunque no haya datos nuevos
+            mqtt.service_stream()
             
-            if ecg_data_raw is None:
-                time.sleep(0.01)
+            if time.monotonic() - last_stats_log >= STATS_LOG_INTERVAL_S:
+                for user_id, board in boards.handlers.items():
+                    reported_dropped[user_id] = log_acquisition_stats(user_id, board.stats, reported_dropped[user_id])
+                if TRIGGER_MODE == "samples":
+                    log_trigger_stats(trigger)
+                elif not fast_forward:
+                    log_scheduler_stats(scheduler)
+                log_mqtt_stats(mqtt)
+                last_stats_log = time.monotonic()
+
+            if all(ecg_data_raw is None for ecg_data_raw in readings.values()):
+                if boards.finished:
+                    logging.info("Reproducción terminada.")
+                    break
                 continue
 
-            # B. PROCESAMIENTO DE SEÑAL (DSP)
-            # Aplicamos filtros Pasa-Banda (1-50Hz) y Notch (50/60Hz)
-            # Usamos la ventana completa para que los filtros funcionen mejor.
-            filtered_data = analyzer.filter_signal(ecg_data_raw)
-            
-            # C. ANÁLISIS MATEMÁTICO (Extracción de Características)
-            # Calculamos BPM usando Welch + Filtro de Mediana
-            bpm = analyzer.calculate_bpm(filtered_data)
-            
-            # D. DETECCION DE EVENTOS
-            # Verificamos si el atleta cambió de Zona de Frecuencia Cardíaca
-            (change, old_z, new_z) = analyzer.detect_zone_change(bpm)
+            # B - E. Pipeline por atleta (los que no tienen datos nuevos esperan al próximo ciclo)
+            # o de todo el equipo en una llamada. Un ciclo fusionado ('merge') cubre varios
+            # periodos: trae (y envía) más muestras nuevas.
+            if team is not None:
+                results = process_team(team, team_ids, team_windows, boards, readings, mqtt)
+            else:
+                results = {
+                    user_id: process_athlete(user_id, analyzers[user_id], boards.handlers[user_id],
+                                             ecg_data_raw, mqtt)
+                    for user_id, ecg_data_raw in readings.items() if ecg_data_raw is not None
+                }
 
-            # E. COMUNICACIÓN (MQTT)
-            
-            # Tópico 1: EVENTOS (Alta Prioridad - QoS 1)
-            # Solo se envía cuando ocurre un cambio de estado significativo.
-            if change:
-                logging.info(f"¡CAMBIO DETECTADO! Zona {old_z} -> {new_z} (BPM: {bpm:.2f})")
-                mqtt.publish_zone_change(USER_ID, old_z, new_z, bpm)
-            
-            # Tópico 2: STATUS (Baja Prioridad - QoS 0)
-            # Heartbeat del sistema (1 vez por ciclo) para dashboards.
-            mqtt.publish_status(USER_ID, bpm, analyzer.current_zone)
-
-            # Tópico 3: STREAM DE ONDA (Alta Frecuencia)
-            # Aquí ocurre la magia del streaming. Recortamos ("Slicing") solo
-            # el final del array filtrado para enviarlo al visualizador.
-            if len(filtered_data) >= points_per_chunk:
-                chunk_to_send = filtered_data[-points_per_chunk:]
-                mqtt.publish_ecg_data(chunk_to_send)
+            for user_id, result in results.items():
+                # Métricas de arranque (solo hasta completarlas)
+                if result is None or startup.get("first_zone_event") is not None:
+                    continue
+                bpm, change = result
+                if bpm > 0 and user_id not in athletes_with_bpm:
+                    athletes_with_bpm.add(user_id)
+                    if startup.get("first_bpm") is None:
+                        mark_startup(startup, "first_bpm", f"primer BPM ({user_id}: {bpm:.1f})")
+                        # Arranque completo: recién ahora los logs verbosos del driver
+                        if BRAINFLOW_DEV_LOGGER:
+                            BrainflowHandler.enable_dev_logger()
+                    if len(athletes_with_bpm) == len(team_ids):
+                        mark_startup(startup, "all_bpm", "todos los atletas con BPM")
+                if change:
+                    mark_startup(startup, "first_zone_event", f"primer evento de zona ({user_id})")
             
-            # Control de Ritmo (20Hz)
-            time.sleep(LOOP_SPEED_S) 
+            if boards.finished:
+                logging.info("Reproducción terminada.")
+                break
 
     except KeyboardInterrupt:
         logging.info("Deteniendo servicio por solicitud de usuario...")
@@ -168,7 +549,7 @@ def main():
         logging.error(f"Error no controlado en bucle principal: {e}")
     finally:
         # Limpieza de recursos (Hardware y Red)
-        board.stop()
+        boards.stop()
         mqtt.disconnect()
         logging.info("Servicio finalizado correctamente.")
 
@@ -2,6 +2,13 @@ import paho.mqtt.client as mqtt
 import json
 import time
 import logging
+import threading
+from collections import deque
+
+import numpy as np
+
+from wire_format import ENCODINGS, WIRE_FORMATS, encode_ecg_chunk, encode_ecg_frame
+from stream_lease import LEASE_TOPIC_PREFIX, parse_lease
 
 """
 -----------------------------------------------------------------------------
@@ -17,107 +24,515 @@ Características:
   para no bloquear el bucle principal de análisis matemático.
 - QoS Diferenciado: Utiliza diferentes niveles de garantía de entrega según
   la criticidad del dato (Eventos vs Streaming).
+- Timestamps de Adquisición: 'timestamp' es el reloj de la placa de la muestra
+  que originó el mensaje (si se conoce) y 'latency_ms' el tiempo transcurrido
+  desde esa muestra hasta la publicación (latencia extremo a extremo).
+  Se omite con 'report_latency=False' (reproducción a velocidad != 1.0).
+- Stream de onda binario: con 'ecg_format' = 'float32' / 'int16' los chunks
+  viajan empaquetados (ver wire_format.py); 'json' conserva el formato anterior.
+
+Cola de envío (no bloqueante):
+Los 'publish_*' solo serializan el mensaje y lo encolan; un hilo emisor
+dedicado llama a 'client.publish'. Tres clases de prioridad:
+- 'event'  (cambios de zona): cola sin límite, NUNCA se descarta.
+- 'status' y 'stream': colas acotadas; si se llenan (broker lento, red caída)
+  se descarta el mensaje MÁS VIEJO, que ya perdió vigencia.
+El emisor siempre vacía primero eventos, luego status y al final stream.
+
+Métricas por clase ('snapshot'): encolados, en cola, enviados, descartados,
+fallidos y en vuelo (publicados sin confirmar), más la latencia
+publicación -> confirmación ('on_publish': PUBACK con QoS 1, escritura en
+el socket con QoS 0).
+
+Agrupación del stream (batching):
+Con 'batch_ms' > 0 los chunks de onda se acumulan y se publican juntos al
+cumplirse el presupuesto de tiempo (o 'batch_max_samples' muestras): los
+chunks consecutivos de un atleta se fusionan en uno solo (menos mensajes y
+cabeceras para el broker). Con 'batch_users' (solo formato binario) todos los
+atletas van en UNA trama por presupuesto. Cada mensaje del stream lleva un
+número de secuencia creciente: el consumidor detecta tramas perdidas y, con
+el índice de muestra de cada chunk, rearma el stream exacto.
+El bucle principal llama a 'service_stream' en cada ciclo: lo pendiente sale
+al vencer su plazo aunque no lleguen chunks nuevos (placa detenida o sin datos).
+
+Stream bajo demanda (leases):
+Con 'stream_lease' el stream de onda solo se publica para los atletas que
+algún consumidor pidió en 'msoft/msrr/stream_lease/+' (ver stream_lease.py)
+y mientras ese pedido esté vigente: sin visualizadores abiertos no sale
+stream. Si el lease fija 'max_rate_hz' los chunks del atleta se juntan y se
+publican a esa tasa como máximo (sin perder muestras). Eventos y status no
+dependen de los leases.
 -----------------------------------------------------------------------------
 """
 
+# Clases de prioridad, en el orden en que las vacía el emisor
+PRIORITY_CLASSES = ("event", "status", "stream")
+
+
 class MQTTPublisher:
-    def __init__(self, broker_host="mqtt-broker", broker_port=1883):
+    def __init__(self, broker_host="mqtt-broker", broker_port=1883, ecg_format="json", sampling_rate=0.0,
+                 queue_size=256, batch_ms=0.0, batch_max_samples=0, batch_users=False, clock=time.monotonic,
+                 stream_lease=False, report_latency=True):
+        if ecg_format not in WIRE_FORMATS:
+            raise ValueError(f"Formato de stream desconocido: {ecg_format} (usar {', '.join(WIRE_FORMATS)})")
+        if batch_users and ecg_format not in ENCODINGS:
+            raise ValueError("Las tramas multi-atleta requieren un formato binario (float32 / int16)")
         self.broker_host = broker_host
         self.broker_port = broker_port
-        
-        # DEFINICIÓN DE TÓPICOS 
+        self.ecg_format = ecg_format
+        # Viaja en la cabecera binaria: el consumidor reconstruye el eje de tiempo
+        self.sampling_rate = sampling_rate
+        # 'latency_ms' solo tiene sentido si las muestras llegan en tiempo real (no en una
+        # reproducción acelerada, donde el reloj de la sesión va por delante del actual)
+        self.report_latency = report_latency
+
+        # DEFINICIÓN DE TÓPICOS
         # Estructura jerárquica: msoft/{usuario}/{tipo_de_dato}
         self.topic_zone = "msoft/msrr/zone_change"     # Eventos Críticos
         self.topic_ecg_data = "msoft/msrr/debug_ecg_data"  # Stream de Onda (Debug/Vis)
         self.topic_status = "msoft/msrr/status"        # Telemetría de Estado
-        
+
+        # COLA DE ENVÍO: eventos sin límite, status/stream acotados (descarte del más viejo)
+        self.queue_size = queue_size
+        self._queues = {"event": deque(), "status": deque(), "stream": deque()}
+        self._wakeup = threading.Condition()
+        self._running = False
+        self._sender = None
+        # Mensajes publicados sin confirmar: mid -> (clase, instante de publicación)
+        self._inflight = {}
+        # Confirmaciones que llegaron antes de registrar el mid (QoS 0 se confirma dentro de publish)
+        self._early_acks = {}
+        self._inflight_lock = threading.Lock()
+        self.reset_stats()
+
+        # AGRUPACIÓN DEL STREAM: chunks pendientes [user_id, partes, n, índice, timestamp]
+        self.batch_s = batch_ms / 1000.0
+        self.batch_max_samples = batch_max_samples
+        self.batch_users = batch_users
+        self._pending_chunks = []
+        self._pending_samples = 0
+        self._pending_since = None
+        self.stream_seq = 0  # Secuencia del próximo mensaje del stream
+        self._clock = clock
+
+        # STREAM BAJO DEMANDA: consumer_id -> (usuarios o None = todos, max_rate_hz, vencimiento)
+        self.stream_lease = stream_lease
+        self.topic_lease = f"{LEASE_TOPIC_PREFIX}/+"
+        self._leases = {}
+        self._lease_lock = threading.Lock()
+        # Chunks retenidos por la tasa máxima: user_id -> [partes, n, índice, timestamp]
+        self._throttled = {}
+        self._last_stream_at = {}
+
         # Inicializamos cliente con la API V2 (Estándar actual de Paho)
         self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+        self.client.on_publish = self._on_publish
+        if stream_lease:
+            # Antes de conectar: la suscripción se rehace en cada (re)conexión
+            self.client.on_connect = self._on_connect
+            self.client.on_message = self._on_lease_message
         self.connect()
+        if self.client:
+            self._start_sender()
 
     def connect(self):
         """ Establece la conexión y arranca el hilo de red """
         try:
             logging.info(f"Conectando a MQTT en {self.broker_host}...")
-            
+
             # Conexión bloqueante inicial (timeout 60s)
             self.client.connect(self.broker_host, self.broker_port, 60)
-            
+
             # loop_start() crea un hilo secundario (Daemon Thread) que:
             # 1. Maneja la reconexión automática.
             # 2. Gestiona los PINGs (Keep-alive).
             # 3. Procesa mensajes entrantes/salientes.
             # Esto permite que el 'main.py' siga procesando ECG sin pausas.
-            self.client.loop_start() 
-            
+            self.client.loop_start()
+
             logging.info("Conexión MQTT establecida.")
         except Exception as e:
             logging.error(f"Error conexión MQTT: {e}")
             self.client = None
 
-    def publish_zone_change(self, user_id, zona_anterior, zona_nueva, bpm_actual):
+    # --- COLA DE ENVÍO ---
+
+    def reset_stats(self):
+        self.enqueued = dict.fromkeys(PRIORITY_CLASSES, 0)
+        self.sent = dict.fromkeys(PRIORITY_CLASSES, 0)
+        self.dropped = dict.fromkeys(PRIORITY_CLASSES, 0)
+        self.failed = dict.fromkeys(PRIORITY_CLASSES, 0)
+        self.acked = dict.fromkeys(PRIORITY_CLASSES, 0)
+        self.ack_latency_sum_s = dict.fromkeys(PRIORITY_CLASSES, 0.0)
+        self.ack_latency_max_s = dict.fromkeys(PRIORITY_CLASSES, 0.0)
+        # Stream bajo demanda: chunks no publicados (sin lease) y chunks retenidos por la tasa
+        self.gated_chunks = 0
+        self.coalesced_chunks = 0
+
+    def _start_sender(self):
+        self._running = True
+        self._sender = threading.Thread(target=self._send_loop, name="mqtt-sender", daemon=True)
+        self._sender.start()
+
+    def _enqueue(self, priority, topic, payload, qos):
+        """ Encola un mensaje ya serializado. Nunca bloquea al bucle principal """
+        with self._wakeup:
+            queue = self._queues[priority]
+            if priority != "event" and len(queue) >= self.queue_size:
+                queue.popleft()  # Descartamos el más viejo: el nuevo es más vigente
+                self.dropped[priority] += 1
+            queue.append((topic, payload, qos))
+            self.enqueued[priority] += 1
+            self._wakeup.notify()
+
+    def _next_message(self):
+        # Llamar con '_wakeup' tomado. Prioridad estricta: event > status > stream
+        for priority in PRIORITY_CLASSES:
+            if self._queues[priority]:
+                return priority, self._queues[priority].popleft()
+        return None, None
+
+    def _send_loop(self):
+        while True:
+            with self._wakeup:
+                priority, message = self._next_message()
+                while message is None:
+                    if not self._running:
+                        return
+                    self._wakeup.wait()
+                    priority, message = self._next_message()
+            self._send(priority, *message)
+
+    def _send(self, priority, topic, payload, qos):
+        sent_at = time.monotonic()
+        try:
+            info = self.client.publish(topic, payload, qos=qos)
+        except Exception as e:
+            self.failed[priority] += 1
+            if priority == "event":
+                logging.error(f"Error publicando evento: {e}")
+            return
+        if info.rc != mqtt.MQTT_ERR_SUCCESS and qos == 0:
+            # QoS 0 sin conexión: Paho lo descarta (QoS 1 queda en su cola hasta reconectar)
+            self.failed[priority] += 1
+            return
+
+        self.sent[priority] += 1
+        with self._inflight_lock:
+            acked_at = self._early_acks.pop(info.mid, None)
+            if acked_at is None:
+                self._inflight[info.mid] = (priority, sent_at)
+        if acked_at is not None:
+            self._record_ack(priority, acked_at - sent_at)
+        if priority == "event":
+            logging.info(f"Evento enviado ({topic})")
+
+    def _on_publish(self, client, userdata, mid, reason_code=None, properties=None):
+        """ Callback de Paho (hilo de red): el mensaje 'mid' fue confirmado / escrito """
+        now = time.monotonic()
+        with self._inflight_lock:
+            entry = self._inflight.pop(mid, None)
+            if entry is None:
+                self._early_acks[mid] = now
+                return
+        priority, sent_at = entry
+        self._record_ack(priority, now - sent_at)
+
+    def _record_ack(self, priority, latency_s):
+        self.acked[priority] += 1
+        self.ack_latency_sum_s[priority] += latency_s
+        self.ack_latency_max_s[priority] = max(self.ack_latency_max_s[priority], latency_s)
+
+    def snapshot(self):
+        """ Resumen por clase de prioridad para logs / métricas """
+        with self._wakeup:
+            queued = {priority: len(queue) for priority, queue in self._queues.items()}
+        with self._inflight_lock:
+            in_flight = dict.fromkeys(PRIORITY_CLASSES, 0)
+            for priority, _ in self._inflight.values():
+                in_flight[priority] += 1
+        summary = {}
+        for priority in PRIORITY_CLASSES:
+            acked = self.acked[priority]
+            summary[priority] = {
+                "enqueued": self.enqueued[priority],
+                "queued": queued[priority],
+                "sent": self.sent[priority],
+                "dropped": self.dropped[priority],
+                "failed": self.failed[priority],
+                "in_flight": in_flight[priority],
+                "mean_ack_ms": self.ack_latency_sum_s[priority] / acked * 1000.0 if acked else 0.0,
+                "max_ack_ms": self.ack_latency_max_s[priority] * 1000.0,
+            }
+        return summary
+
+    # --- STREAM BAJO DEMANDA (LEASES) ---
+
+    def _on_connect(self, client, userdata, flags, reason_code, properties=None):
+        """ Callback de Paho: (re)suscripción a los leases (los retenidos llegan enseguida) """
+        if reason_code == 0:
+            client.subscribe(self.topic_lease, qos=1)
+
+    def _on_lease_message(self, client, userdata, msg):
+        """ Callback de Paho (hilo de red): alta, renovación o baja de un lease """
+        consumer_id = msg.topic.rsplit("/", 1)[-1]
+        try:
+            lease = parse_lease(msg.payload)
+        except (ValueError, TypeError, AttributeError) as e:
+            logging.warning(f"Lease inválido de {consumer_id}: {e}")
+            return
+        with self._lease_lock:
+            if lease is None:
+                if self._leases.pop(consumer_id, None) is not None:
+                    logging.info(f"Stream: {consumer_id} dejó de mirar")
+                return
+            users, ttl_s, max_rate_hz = lease
+            if consumer_id not in self._leases:
+                logging.info(f"Stream: {consumer_id} mira {'todos' if users is None else sorted(users)}"
+                             + (f" a {max_rate_hz:g} Hz" if max_rate_hz else ""))
+            self._leases[consumer_id] = (users, max_rate_hz, self._clock() + ttl_s)
+
+    def stream_demand(self, user_id):
+        """
+        ¿Alguien mira el stream de 'user_id'? Retorna (pedido, max_rate_hz o None = sin límite).
+        Con varios leases manda el más permisivo. Los leases vencidos se descartan aquí.
+        """
+        if not self.stream_lease:
+            return True, None
+        now = self._clock()
+        wanted, max_rate_hz = False, 0.0
+        with self._lease_lock:
+            for consumer_id, (users, rate, expires_at) in list(self._leases.items()):
+                if expires_at <= now:
+                    del self._leases[consumer_id]
+                    logging.info(f"Stream: venció el lease de {consumer_id}")
+                    continue
+                if users is not None and user_id not in users:
+                    continue
+                wanted = True
+                max_rate_hz = None if rate is None or max_rate_hz is None else max(max_rate_hz, rate)
+        return wanted, max_rate_hz if wanted else None
+
+    def lease_snapshot(self):
+        """ Leases vigentes y chunks del stream no publicados / retenidos (para logs) """
+        with self._lease_lock:
+            leases = len(self._leases)
+        return {"leases": leases, "gated_chunks": self.gated_chunks, "coalesced_chunks": self.coalesced_chunks}
+
+    # --- MENSAJES ---
+
+    def _stamp(self, payload, acquisition_ts):
+        """ Sella el payload con el instante de adquisición y la latencia hasta ahora """
+        now = time.time()
+        if acquisition_ts is None:
+            payload["timestamp"] = now
+            return payload
+        payload["timestamp"] = acquisition_ts
+        if self.report_latency:
+            payload["latency_ms"] = round((now - acquisition_ts) * 1000.0, 1)
+        return payload
+
+    def publish_zone_change(self, user_id, zona_anterior, zona_nueva, bpm_actual, acquisition_ts=None):
         """
         Publica un EVENTO DE CAMBIO DE ZONA.
         QoS: 1 (At Least Once) - El broker debe confirmar recepción.
+        Clase 'event': nunca se descarta de la cola de envío.
         """
         if not self.client: return
-        
+
         payload = {
             "user_id": user_id,
             "zona_anterior": zona_anterior,
             "zona_nueva": zona_nueva,
             "bpm_actual": round(bpm_actual, 2),
-            "timestamp": time.time(),
             "type": "EVENT"
         }
-        
-        try:
-            # QoS=1 asegura que el evento se guarde en la BD incluso si la red parpadea.
-            self.client.publish(self.topic_zone, json.dumps(payload), qos=1)
-            logging.info(f"Evento enviado: Zona {zona_nueva}")
-        except Exception as e:
-            logging.error(f"Error publicando evento: {e}")
+        self._stamp(payload, acquisition_ts)
+
+        # QoS=1 asegura que el evento se guarde en la BD incluso si la red parpadea.
+        self._enqueue("event", self.topic_zone, json.dumps(payload), qos=1)
 
-    def publish_status(self, user_id, bpm_actual, current_zone):
+    def publish_status(self, user_id, bpm_actual, current_zone, acquisition_ts=None):
         """
         Publica el ESTADO ACTUAL (Heartbeat).
         QoS: 0 (Fire and Forget).
         """
         if not self.client: return
-        
+
         payload = {
             "user_id": user_id,
             "bpm": round(bpm_actual, 2),
             "zone": current_zone,
-            "timestamp": time.time(),
             "type": "STATUS"
         }
-        
-        try:
-            # QoS=0 es suficiente. Si se pierde un paquete, llegará otro en 50ms.
-            self.client.publish(self.topic_status, json.dumps(payload), qos=0)
-        except: pass 
+        self._stamp(payload, acquisition_ts)
 
-    def publish_ecg_data(self, data):
+        # QoS=0 es suficiente. Si se pierde un paquete, llegará otro en 50ms.
+        self._enqueue("status", self.topic_status, json.dumps(payload), qos=0)
+
+    def publish_ecg_data(self, data, user_id=None, sample_index=None, acquisition_ts=None):
         """
         Publica el STREAM DE ONDA RAW.
         QoS: 0.
+        Con varios atletas en el mismo proceso, 'user_id' identifica de quién es el chunk.
+        'sample_index' es el índice (en el stream de la placa) de la primera muestra
+        y 'acquisition_ts' su timestamp de la placa.
+        Con agrupación el chunk queda pendiente hasta cumplir el presupuesto ('service_stream').
+        Con leases solo se publica si algún consumidor mira a 'user_id' (y a su tasa máxima).
         """
         if not self.client: return
-        
-        try:
-            # 'data' es un array de Numpy. JSON estándar no soporta Numpy.
-            # Debemos usar .tolist() para convertirlo a una lista nativa de Python.
-            payload = {"ecg_data": data.tolist()} 
-            
-            self.client.publish(self.topic_ecg_data, json.dumps(payload), qos=0)
-        except Exception as e:
-            # En streaming de alta frecuencia, si falla un paquete, lo ignoramos (pass).
-            # Loguear errores aquí saturaría la consola (IO Blocking).
-            pass 
 
-    def disconnect(self):
-        """ Cierre limpio de recursos """
+        wanted, max_rate_hz = self.stream_demand(user_id)
+        if not wanted:
+            # Nadie mira: ni se serializa. Lo retenido por la tasa o la agrupación también
+            # pierde vigencia
+            self.gated_chunks += 1
+            self._throttled.pop(user_id, None)
+            self._drop_pending(user_id)
+            return
+        if max_rate_hz is None and user_id not in self._throttled:
+            self._queue_stream_chunk(data, user_id, sample_index, acquisition_ts)
+            return
+
+        # Tasa máxima: se acumula lo del atleta y se libera un solo chunk por intervalo
+        held = self._throttled.get(user_id)
+        if held is not None and sample_index is not None and held[2] is not None \
+                and held[2] + held[1] != sample_index:
+            # No contiguo (reinicio del stream): lo retenido sale solo
+            self._release_throttled(user_id)
+            held = None
+        samples = np.array(data, dtype=np.float64)
+        if held is None:
+            self._throttled[user_id] = [[samples], len(samples), sample_index, acquisition_ts]
+        else:
+            held[0].append(samples)
+            held[1] += len(samples)
+            self.coalesced_chunks += 1
+        now = self._clock()
+        last = self._last_stream_at.get(user_id)
+        if max_rate_hz is None or last is None or now - last >= 1.0 / max_rate_hz:
+            self._last_stream_at[user_id] = now
+            self._release_throttled(user_id)
+
+    def _release_throttled(self, user_id):
+        parts, _, sample_index, acquisition_ts = self._throttled.pop(user_id)
+        self._queue_stream_chunk(np.concatenate(parts) if len(parts) > 1 else parts[0],
+                                 user_id, sample_index, acquisition_ts)
+
+    def _queue_stream_chunk(self, data, user_id, sample_index, acquisition_ts):
+        # Publica el chunk (o lo deja pendiente de la agrupación)
+        if self.batch_s <= 0:
+            self._publish_stream([[user_id, [data], len(data), sample_index, acquisition_ts]])
+            return
+
+        # Copia: 'data' suele ser un buffer que el analizador reutiliza en el próximo ciclo
+        samples = np.array(data, dtype=np.float64)
+        pending = next((chunk for chunk in reversed(self._pending_chunks) if chunk[0] == user_id), None)
+        if pending is not None and (sample_index is None or pending[3] is None
+                                    or pending[3] + pending[2] == sample_index):
+            # Continuación del chunk pendiente del atleta: se fusiona
+            pending[1].append(samples)
+            pending[2] += len(samples)
+        else:
+            self._pending_chunks.append([user_id, [samples], len(samples), sample_index, acquisition_ts])
+        self._pending_samples += len(samples)
+
+        now = self._clock()
+        if self._pending_since is None:
+            self._pending_since = now
+        if (now - self._pending_since >= self.batch_s
+                or 0 < self.batch_max_samples <= self._pending_samples):
+            self.flush_stream()
+
+    def service_stream(self):
+        """
+        Llamar en cada ciclo del bucle principal (mismo hilo que 'publish_ecg_data'): publica
+        lo retenido por la tasa de un lease y lo pendiente de la agrupación cuyo plazo ya
+        venció, aunque no hayan llegado chunks nuevos que lo disparen.
+        """
+        if not self.client: return
+        now = self._clock()
+        for user_id in list(self._throttled):
+            wanted, max_rate_hz = self.stream_demand(user_id)
+            if not wanted:
+                self._throttled.pop(user_id)
+                self._drop_pending(user_id)
+                continue
+            last = self._last_stream_at.get(user_id)
+            if max_rate_hz is None or last is None or now - last >= 1.0 / max_rate_hz:
+                self._last_stream_at[user_id] = now
+                self._release_throttled(user_id)
+        if self._pending_since is not None and now - self._pending_since >= self.batch_s:
+            self.flush_stream()
+
+    def _drop_pending(self, user_id):
+        # Descarta los chunks de 'user_id' pendientes de la agrupación (se quedó sin lease)
+        kept = [chunk for chunk in self._pending_chunks if chunk[0] != user_id]
+        if len(kept) == len(self._pending_chunks):
+            return
+        self._pending_chunks = kept
+        self._pending_samples = sum(chunk[2] for chunk in kept)
+        if not kept:
+            self._pending_since = None
+
+    def flush_stream(self):
+        """ Publica ya los chunks de onda pendientes de la agrupación """
+        if not self._pending_chunks:
+            return
+        chunks = self._pending_chunks
+        self._pending_chunks = []
+        self._pending_samples = 0
+        self._pending_since = None
+        for chunk in chunks:
+            if len(chunk[1]) > 1:
+                chunk[1] = [np.concatenate(chunk[1])]
+        self._publish_stream(chunks)
+
+    def _publish_stream(self, chunks):
+        # Serializa y encola: una trama multi-atleta o un mensaje por chunk, cada uno con su secuencia
+        if self.batch_users:
+            payloads = [encode_ecg_chunk(parts[0], user_id, sample_index, acquisition_ts,
+                                         self.sampling_rate, self.ecg_format, self.stream_seq)
+                        for user_id, parts, _, sample_index, acquisition_ts in chunks]
+            self._enqueue("stream", self.topic_ecg_data, encode_ecg_frame(payloads, self.stream_seq), qos=0)
+            self.stream_seq += 1
+            return
+
+        for user_id, parts, _, sample_index, acquisition_ts in chunks:
+            data = parts[0]
+            if self.ecg_format in ENCODINGS:
+                # Formato binario: cabecera fija + muestras empaquetadas (sin texto)
+                payload = encode_ecg_chunk(data, user_id, sample_index, acquisition_ts,
+                                           self.sampling_rate, self.ecg_format, self.stream_seq)
+            else:
+                # 'data' es un array de Numpy. JSON estándar no soporta Numpy.
+                # Debemos usar .tolist() para convertirlo a una lista nativa de Python.
+                payload = {"ecg_data": data.tolist(), "seq": self.stream_seq}
+                if user_id is not None:
+                    payload["user_id"] = user_id
+                if sample_index is not None:
+                    payload["sample_index"] = int(sample_index)
+                if acquisition_ts is not None:
+                    self._stamp(payload, acquisition_ts)
+                payload = json.dumps(payload)
+            self._enqueue("stream", self.topic_ecg_data, payload, qos=0)
+            self.stream_seq += 1
+
+    def disconnect(self, flush_timeout_s=2.0):
+        """ Cierre limpio de recursos (intenta vaciar la cola antes de cortar) """
+        if self.client:
+            for user_id in list(self._throttled):
+                self._release_throttled(user_id)
+            self.flush_stream()
+        if self._sender is not None:
+            deadline = time.monotonic() + flush_timeout_s
+            while any(self._queues.values()) and time.monotonic() < deadline:
+                time.sleep(0.01)
+            with self._wakeup:
+                self._running = False
+                self._wakeup.notify()
+            self._sender.join(timeout=flush_timeout_s)
+            self._sender = None
         if self.client:
             self.client.loop_stop() # Detiene el hilo de fondo
-            self.client.disconnect()
\ No newline at end of file
+            self.client.disconnect()
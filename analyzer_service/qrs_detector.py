@@ -0,0 +1,218 @@
+import numpy as np
+from scipy import signal
+
+from dsp_filters import sosfilt_stateful
+
+"""
+-----------------------------------------------------------------------------
+SUBSYSTEM: DETECTOR DE LATIDOS (QRS / ONDA R) EN STREAMING
+-----------------------------------------------------------------------------
+Descripción:
+Motor de BPM alternativo al pico espectral de DataAnalyzer. Detecta cada
+complejo QRS (estilo Pan-Tompkins) procesando SOLO las muestras nuevas y
+conservando sus umbrales adaptativos entre llamadas. El BPM se obtiene del
+intervalo RR entre latidos consecutivos: latencia de un latido (~1 s) en lugar
+de la ventana de 4 s + mediana + EMA del método espectral.
+
+Pipeline (Pan-Tompkins, 1985):
+1. Pasa-Banda 5-15Hz: realza la energía del QRS frente a ondas P/T y deriva.
+2. Derivada de 5 puntos: resalta las pendientes pronunciadas del QRS.
+3. Cuadrado: rectifica y enfatiza las pendientes grandes.
+4. Integración por ventana móvil (150 ms): agrupa el QRS en un solo lóbulo.
+5. Umbrales adaptativos (SPKI/NPKI) + periodo refractario (200 ms)
+   + búsqueda hacia atrás si falta un latido (RR > 166% del RR promedio).
+-----------------------------------------------------------------------------
+"""
+
+# Periodo refractario fisiológico: no puede haber dos latidos en menos de 200 ms
+REFRACTORY_S = 0.2
+# Ventana de integración (ancho típico de un QRS)
+INTEGRATION_S = 0.15
+# Fase de aprendizaje inicial para sembrar los umbrales
+LEARNING_S = 2.0
+# Historia de entrada: cubre la búsqueda hacia atrás hasta ~50 BPM (1.66 * 1.2 s)
+SEARCHBACK_HISTORY_S = 2.0
+
+
+class StreamingQRSDetector:
+    def __init__(self, sampling_rate, rr_average_beats=8):
+        self.sampling_rate = sampling_rate
+
+        # --- ETAPA 1: Pasa-Banda 5-15Hz con estado ---
+        self.sos = signal.butter(2, (5.0, 15.0), btype='bandpass', fs=sampling_rate, output='sos')
+        self.zi = np.zeros((self.sos.shape[0], 2))
+
+        # --- ETAPA 2 y 4: Historias para derivada e integración entre chunks ---
+        self.derivative_history = np.zeros(4)
+        self.integration_points = max(1, int(INTEGRATION_S * sampling_rate))
+        self.squared_history = np.zeros(self.integration_points - 1)
+
+        # --- HISTORIA DE ENTRADA (para ubicar la onda R) ---
+        # El pico del integrado llega retrasado respecto a la onda R y se confirma
+        # 200 ms después (o mucho más tarde en la búsqueda hacia atrás).
+        # Guardamos la entrada reciente para buscar el máximo real.
+        self.refractory_points = int(REFRACTORY_S * sampling_rate)
+        self.input_history = np.zeros(int(SEARCHBACK_HISTORY_S * sampling_rate))
+
+        # --- ETAPA 5: Estado de decisión ---
+        self.learning_points = int(LEARNING_S * sampling_rate)
+        self.learning_max = 0.0
+        self.learning_sum = 0.0
+        self.spki = 0.0  # Nivel estimado de picos de señal (QRS)
+        self.npki = 0.0  # Nivel estimado de picos de ruido
+        self.threshold = 0.0
+
+        # Candidato a pico local en curso (valor, índice global de muestra)
+        self.candidate_value = 0.0
+        self.candidate_index = -1
+        # Mayor pico de ruido desde el último latido (para la búsqueda hacia atrás)
+        self.searchback_value = 0.0
+        self.searchback_index = -1
+
+        # Intervalos RR recientes (en muestras) para la búsqueda hacia atrás
+        self.rr_intervals = np.zeros(rr_average_beats)
+        self.rr_count = 0
+
+        self.samples_seen = 0
+        self.last_beat_index = -1  # Índice del pico del integrado (para el refractario)
+        self.last_r_index = -1     # Índice de la onda R (para el intervalo RR)
+        self.instant_bpm = 0.0
+        self.beat_count = 0
+
+    @property
+    def rr_average(self):
+        n = min(self.rr_count, len(self.rr_intervals))
+        return self.rr_intervals[:n].mean() if n else 0.0
+
+    def process(self, filtered_samples):
+        """
+        Procesa SOLO las muestras nuevas (ya filtradas por la Etapa 1).
+        Retorna una lista de latidos detectados en este chunk:
+        [(indice_muestra, tiempo_s, bpm_rr), ...] donde tiempo_s se mide desde
+        el inicio del stream y bpm_rr es 60 / RR (0.0 para el primer latido).
+        """
+        n_new = len(filtered_samples)
+        if n_new == 0:
+            return []
+
+        # Historia de entrada: desplazamos y agregamos el chunk al final
+        if n_new >= len(self.input_history):
+            self.input_history[:] = filtered_samples[-len(self.input_history):]
+        else:
+            self.input_history[:-n_new] = self.input_history[n_new:]
+            self.input_history[-n_new:] = filtered_samples
+
+        # 1. Pasa-Banda 5-15Hz (con estado entre chunks)
+        band = sosfilt_stateful(self.sos, filtered_samples, self.zi)
+
+        # 2. Derivada de 5 puntos: y[n] = (2x[n] + x[n-1] - x[n-3] - 2x[n-4]) * fs / 8
+        extended = np.concatenate((self.derivative_history, band))
+        derivative = (2 * extended[4:] + extended[3:-1] - extended[1:-3] - 2 * extended[:-4]) \
+            * (self.sampling_rate / 8.0)
+        self.derivative_history = extended[-4:]
+
+        # 3. Cuadrado
+        squared = derivative * derivative
+
+        # 4. Integración por ventana móvil (suma acumulada sobre la historia)
+        extended = np.concatenate((self.squared_history, squared))
+        cumulative = np.concatenate(([0.0], np.cumsum(extended)))
+        integrated = (cumulative[self.integration_points:] - cumulative[:-self.integration_points]) \
+            / self.integration_points
+        if self.integration_points > 1:
+            self.squared_history = extended[-(self.integration_points - 1):]
+
+        # 5. Decisión (bucle solo sobre las ~12 muestras nuevas)
+        first_index = self.samples_seen
+        self.samples_seen += n_new
+        beats = []
+        for offset, value in enumerate(integrated.tolist()):
+            index = first_index + offset
+
+            # Fase de aprendizaje: solo acumulamos estadísticas para sembrar umbrales
+            if index < self.learning_points:
+                self.learning_max = max(self.learning_max, value)
+                self.learning_sum += value
+                if index == self.learning_points - 1:
+                    self.spki = 0.25 * self.learning_max
+                    self.npki = 0.5 * self.learning_sum / self.learning_points
+                    self._update_threshold()
+                continue
+
+            # Seguimos subiendo: actualizamos el candidato a pico local
+            if value > self.candidate_value:
+                self.candidate_value = value
+                self.candidate_index = index
+            # El candidato se confirma como máximo local si no fue superado en 200 ms
+            elif self.candidate_index >= 0 and index - self.candidate_index >= self.refractory_points:
+                beat = self._classify_peak(self.candidate_value, self.candidate_index)
+                if beat is not None:
+                    beats.append(beat)
+                self.candidate_value = value
+                self.candidate_index = index
+
+            # Búsqueda hacia atrás: si pasó demasiado tiempo sin latido, aceptamos
+            # el mayor pico de ruido si supera la mitad del umbral.
+            if self._searchback_due(index):
+                beats.append(self._register_beat(self.searchback_index, self.searchback_value, searchback=True))
+
+        return beats
+
+    def _classify_peak(self, value, index):
+        # Dentro del periodo refractario: no puede ser un latido
+        in_refractory = self.last_beat_index >= 0 and index - self.last_beat_index < self.refractory_points
+
+        if value > self.threshold and not in_refractory:
+            return self._register_beat(index, value)
+
+        # Pico de ruido: actualizamos NPKI y guardamos el mejor para la búsqueda hacia atrás
+        self.npki = 0.125 * value + 0.875 * self.npki
+        self._update_threshold()
+        if not in_refractory and value > self.searchback_value:
+            self.searchback_value = value
+            self.searchback_index = index
+        return None
+
+    def _searchback_due(self, index):
+        if self.last_beat_index < 0 or self.rr_count == 0 or self.searchback_index < 0:
+            return False
+        overdue = index - self.last_beat_index > 1.66 * self.rr_average
+        return overdue and self.searchback_value > 0.5 * self.threshold
+
+    def _register_beat(self, index, value, searchback=False):
+        # En la búsqueda hacia atrás el pico aprende más rápido (Pan-Tompkins)
+        weight = 0.25 if searchback else 0.125
+        self.spki = weight * value + (1.0 - weight) * self.spki
+        self._update_threshold()
+
+        # Ubicamos la onda R: máximo |entrada| en la ventana de integración previa al pico
+        r_index = self._locate_r_peak(index)
+
+        if self.last_r_index >= 0:
+            rr = r_index - self.last_r_index
+            if rr > 0:
+                self.rr_intervals[self.rr_count % len(self.rr_intervals)] = rr
+                self.rr_count += 1
+                self.instant_bpm = 60.0 * self.sampling_rate / rr
+
+        self.last_beat_index = index
+        self.last_r_index = r_index
+        self.beat_count += 1
+        self.searchback_value = 0.0
+        self.searchback_index = -1
+
+        return (r_index, r_index / self.sampling_rate, self.instant_bpm if self.beat_count > 1 else 0.0)
+
+    def _locate_r_peak(self, index):
+        # Posición del índice global dentro de la historia de entrada
+        history_start = self.samples_seen - len(self.input_history)
+        end = index - history_start + 1
+        start = end - 2 * self.integration_points
+        if end <= 0:
+            # Fuera de la historia (no debería ocurrir): usamos el pico del integrado
+            return index
+        start = max(start, 0)
+        return history_start + start + int(np.argmax(np.abs(self.input_history[start:end])))
+
+    def _update_threshold(self):
+        self.threshold = self.npki + 0.25 * (self.spki - self.npki)
@@ -0,0 +1,180 @@
+import os
+import struct
+import time
+import numpy as np
+from brainflow.board_shim import BoardShim
+from brainflow.data_filter import DataFilter
+
+"""
+-----------------------------------------------------------------------------
+SUBSYSTEM: GRABACIÓN Y REPRODUCCIÓN DE SESIONES
+-----------------------------------------------------------------------------
+Descripción:
+Permite capturar una sesión real de la placa y volver a pasarla por el
+analizador sin hardware y sin esperar los ciclos de zona del simulador.
+
+Grabación (SessionRecorder):
+Archivo binario de solo-agregado (append-only). Cada lectura de la placa se
+escribe tal cual (TODOS los canales, float64) como un bloque nuevo; nunca se
+reescribe nada. Si el proceso muere, como mucho se pierde el último bloque
+(el lector descarta un bloque truncado al final).
+
+    Cabecera: MAGIC 'MSRR' | versión (u16) | board_id (i32) | fs (f64) | filas (u32)
+    Bloque:   n_muestras (u32) | datos float64 [filas x n_muestras] (fila mayor)
+
+Reproducción (ReplayBoard):
+Imita la parte de BoardShim que usa BrainflowHandler (contar, vaciar y pedir
+la ventana actual) sobre una grabación propia o un archivo de BrainFlow
+('DataFilter.write_file', CSV). Dos ritmos:
+- Tiempo real (speed=1.0, o N veces más rápido con speed=N): las muestras
+  "llegan" según el reloj, igual que con la placa.
+- Máxima velocidad (speed=0): cada consulta entrega el siguiente bloque de
+  'chunk_points' muestras sin esperar. Una sesión de minutos se procesa en
+  segundos (regresiones, ajuste de parámetros).
+Timestamps: el canal de timestamp de la grabación es de la sesión ORIGINAL.
+Al arrancar el stream se desplaza (rebase) para que la primera muestra tenga
+el instante de arranque de la reproducción: se conservan las diferencias
+entre muestras (segundos de sesión) y, en tiempo real, la latencia extremo a
+extremo vuelve a medirse contra el reloj actual.
+-----------------------------------------------------------------------------
+"""
+
+RECORDING_MAGIC = b"MSRR"
+RECORDING_VERSION = 1
+_HEADER = struct.Struct("<4sHidI")
+_BLOCK = struct.Struct("<I")
+
+
+class SessionRecorder:
+    def __init__(self, path, board_id, sampling_rate, n_rows):
+        self.path = path
+        self.n_rows = n_rows
+        self.samples_written = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.file = open(path, "wb")
+        self.file.write(_HEADER.pack(RECORDING_MAGIC, RECORDING_VERSION, board_id, float(sampling_rate), n_rows))
+        self.file.flush()
+
+    def write(self, data):
+        """ Agrega un bloque [filas x n] (la lectura cruda de la placa) """
+        n_samples = data.shape[1]
+        if n_samples == 0 or self.file is None:
+            return
+        self.file.write(_BLOCK.pack(n_samples))
+        self.file.write(np.ascontiguousarray(data, dtype="<f8").tobytes())
+        # Un bloque por ciclo: el flush mantiene el archivo útil si el proceso muere
+        self.file.flush()
+        self.samples_written += n_samples
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def load_recording(path, board_id=None):
+    """
+    Lee una sesión completa. Retorna (board_id, fs, datos [filas x muestras]).
+    Archivos '.csv' se leen como grabaciones de BrainFlow (requieren 'board_id').
+    """
+    if path.lower().endswith(".csv"):
+        if board_id is None:
+            raise ValueError("Las grabaciones CSV de BrainFlow necesitan el board_id")
+        return board_id, BoardShim.get_sampling_rate(board_id), DataFilter.read_file(path)
+
+    with open(path, "rb") as f:
+        raw = f.read()
+    magic, version, file_board_id, sampling_rate, n_rows = _HEADER.unpack_from(raw, 0)
+    if magic != RECORDING_MAGIC or version != RECORDING_VERSION:
+        raise ValueError(f"{path} no es una grabación MSRR v{RECORDING_VERSION}")
+
+    blocks = []
+    offset = _HEADER.size
+    while offset + _BLOCK.size <= len(raw):
+        (n_samples,) = _BLOCK.unpack_from(raw, offset)
+        offset += _BLOCK.size
+        n_bytes = n_rows * n_samples * 8
+        if offset + n_bytes > len(raw):
+            break  # Último bloque truncado (proceso interrumpido): se descarta
+        blocks.append(np.frombuffer(raw, dtype="<f8", count=n_rows * n_samples, offset=offset)
+                      .reshape(n_rows, n_samples))
+        offset += n_bytes
+
+    data = np.concatenate(blocks, axis=1) if blocks else np.zeros((n_rows, 0))
+    return file_board_id, sampling_rate, data
+
+
+class ReplayBoard:
+    def __init__(self, data, sampling_rate, speed=1.0, chunk_points=12, timestamp_channel=None):
+        # Copia escribible si hace falta rebasar los timestamps (np.frombuffer es de solo lectura)
+        self.data = data if timestamp_channel is None or data.flags.writeable else np.array(data)
+        self.sampling_rate = sampling_rate
+        self.speed = speed
+        self.chunk_points = chunk_points
+        self.timestamp_channel = timestamp_channel
+        self.timestamp_offset = 0.0  # Desplazamiento aplicado al canal de timestamp
+
+        self.available = 0  # Muestras que ya "llegaron"
+        self.consumed = 0   # Muestras retiradas con get_board_data
+        self.start_time = None
+        self.prepared = False
+
+    @property
+    def total_samples(self):
+        return self.data.shape[1]
+
+    @property
+    def finished(self):
+        return self.available >= self.total_samples
+
+    # --- Interfaz compatible con BoardShim ---
+    def prepare_session(self):
+        self.prepared = True
+
+    def is_prepared(self):
+        return self.prepared
+
+    def config_board(self, config):
+        # Los comandos del simulador (AGE/ZONE) no aplican a una sesión grabada
+        return ""
+
+    def start_stream(self, buffer_size=None):
+        self.start_time = time.monotonic()
+        self._rebase_timestamps(time.time())
+
+    def _rebase_timestamps(self, start_wall):
+        # La primera muestra pasa a tener el instante de arranque de la reproducción
+        if self.timestamp_channel is None or self.total_samples == 0:
+            return
+        timestamps = self.data[self.timestamp_channel]
+        offset = start_wall - (timestamps[0] - self.timestamp_offset)
+        timestamps += offset - self.timestamp_offset
+        self.timestamp_offset = offset
+
+    def release_session(self):
+        self.prepared = False
+
+    def get_board_data_count(self):
+        self._advance()
+        return self.available - self.consumed
+
+    def get_board_data(self, num_samples=None):
+        pending = self.available - self.consumed
+        n = pending if num_samples is None else min(num_samples, pending)
+        block = self.data[:, self.consumed:self.consumed + n]
+        self.consumed += n
+        return block
+
+    def get_current_board_data(self, num_samples):
+        self._advance()
+        return self.data[:, max(0, self.available - num_samples):self.available]
+
+    def _advance(self):
+        # Máxima velocidad: un bloque por consulta. Tiempo real: según el reloj.
+        if self.speed <= 0:
+            self.available = min(self.available + self.chunk_points, self.total_samples)
+        elif self.start_time is not None:
+            elapsed = time.monotonic() - self.start_time
+            self.available = min(int(elapsed * self.sampling_rate * self.speed), self.total_samples)
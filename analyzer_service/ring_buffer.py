@@ -0,0 +1,96 @@
+import numpy as np
+
+"""
+-----------------------------------------------------------------------------
+SUBSYSTEM: BUFFER CIRCULAR ESPEJADO (VENTANA SIEMPRE CONTIGUA)
+-----------------------------------------------------------------------------
+Descripción:
+Buffer circular compartido por adquisición, análisis y visualizadores para
+mantener las últimas N muestras de una señal (o de varios canales).
+
+Problema:
+- 'np.roll' copia la ventana completa en cada chunk (O(N) por append) y
+  asigna un array nuevo.
+- 'deque' es O(1) por muestra pero hay que convertirlo a array para graficar
+  o filtrar (O(N) y asignación en cada lectura).
+- Un buffer circular clásico es O(1) pero la ventana queda partida en dos
+  trozos cuando da la vuelta: no se puede pasar como un único slice.
+
+Solución (Escritura Doble / "Mirrored Ring Buffer"):
+El almacenamiento tiene el DOBLE de la capacidad y cada muestra se escribe
+dos veces: en la posición 'p' y en 'p + N'. Así las dos mitades son idénticas
+y cualquier tramo de N posiciones consecutivas contiene la señal en orden
+cronológico: las últimas N muestras son SIEMPRE un slice contiguo (vista sin
+copia). El coste por append es O(muestras nuevas) y nunca se mueve la ventana.
+Es la versión portable del "doble mapeo" de memoria virtual (misma página
+física mapeada dos veces), sin depender de mmap ni del sistema operativo.
+
+Multi-Canal:
+Con 'channels' el almacenamiento es [canales x 2N] (C-contiguo): la ventana
+es una vista [canales x N] y cada fila es contigua.
+-----------------------------------------------------------------------------
+"""
+
+
+class RingBuffer:
+    def __init__(self, capacity, channels=None, dtype=np.float64):
+        if capacity < 1:
+            raise ValueError("La capacidad del buffer debe ser >= 1")
+        self.capacity = capacity
+        self.channels = channels
+
+        shape = (2 * capacity,) if channels is None else (channels, 2 * capacity)
+        self._data = np.zeros(shape, dtype=dtype)
+        self.head = 0           # Posición (en [0, N)) donde se escribe la próxima muestra
+        self.total_written = 0  # Muestras recibidas desde la creación (o el último clear)
+
+    def __len__(self):
+        return min(self.total_written, self.capacity)
+
+    @property
+    def is_full(self):
+        return self.total_written >= self.capacity
+
+    def append(self, samples):
+        """
+        Agrega muestras al final. 'samples' es [n] (o [canales x n] en multi-canal).
+        Si llegan más muestras que la capacidad solo se conservan las últimas N.
+        """
+        samples = np.asarray(samples)
+        n_new = samples.shape[-1]
+        if n_new == 0:
+            return
+        self.total_written += n_new
+        if n_new > self.capacity:
+            samples = samples[..., -self.capacity:]
+            n_new = self.capacity
+
+        # Tramo hasta el final de la primera mitad y resto que da la vuelta
+        head, capacity = self.head, self.capacity
+        first = min(n_new, capacity - head)
+        self._data[..., head:head + first] = samples[..., :first]
+        self._data[..., head + capacity:head + capacity + first] = samples[..., :first]
+        rest = n_new - first
+        if rest:
+            self._data[..., :rest] = samples[..., first:]
+            self._data[..., capacity:capacity + rest] = samples[..., first:]
+
+        self.head = (head + n_new) % capacity
+
+    def view(self, n_points=None):
+        """
+        Últimas 'n_points' muestras (por defecto la capacidad completa) como
+        vista contigua SIN copia, en orden cronológico. Se sobrescribe con los
+        próximos append: copiar si hay que conservarla.
+        """
+        if n_points is None:
+            n_points = self.capacity
+        elif n_points > self.capacity:
+            raise ValueError("No se pueden pedir más muestras que la capacidad del buffer")
+        end = self.head + self.capacity
+        return self._data[..., end - n_points:end]
+
+    def clear(self):
+        self._data.fill(0)
+        self.head = 0
+        self.total_written = 0
@@ -0,0 +1,131 @@
+import heapq
+
+"""
+-----------------------------------------------------------------------------
+SUBSYSTEM: ESTADÍSTICAS DESLIZANTES
+-----------------------------------------------------------------------------
+Descripción:
+Estructuras para estadísticas sobre ventanas deslizantes que se actualizan
+muestra a muestra sin recorrer ni ordenar toda la ventana.
+
+Mediana Deslizante (RunningMedian):
+'np.median(deque)' convierte la ventana a array y la ordena en cada ciclo:
+O(n log n) y varias asignaciones de memoria por llamada. Aquí se usan dos
+montículos (heaps) con borrado diferido:
+- 'low':  max-heap con la mitad inferior de la ventana (valores negados).
+- 'high': min-heap con la mitad superior.
+La mediana está siempre en la cima de los heaps: O(log n) por muestra.
+Cada valor entra con su número de secuencia: los que salen de la ventana
+(secuencia anterior a la más antigua viva) se eliminan solo cuando llegan a
+la cima (borrado diferido / "lazy deletion"), sin diccionario de pendientes:
+alcanza con comparar la secuencia. Si los heaps acumulan demasiados valores
+expirados se compactan en el lugar (poco frecuente, coste amortizado
+O(log n)): la memoria queda acotada aunque el servicio corra indefinidamente
+y, en régimen, no hay más asignaciones que la del valor que entra.
+-----------------------------------------------------------------------------
+"""
+
+
+class RunningMedian:
+    def __init__(self, window):
+        if window < 1:
+            raise ValueError("La ventana de la mediana debe ser >= 1")
+        self.window = window
+
+        # Entradas (valor, secuencia); 'low' guarda el valor negado
+        self.low = []   # Mitad inferior (max-heap)
+        self.high = []  # Mitad superior (min-heap)
+        # Tamaños efectivos (sin contar los valores expirados)
+        self.low_size = 0
+        self.high_size = 0
+        # Secuencia del próximo valor y del más antiguo dentro de la ventana
+        self._next_seq = 0
+        self._oldest_seq = 0
+        # Heap en el que está cada valor vivo (True = 'low'), indexado por secuencia % ventana
+        self._in_low = [False] * window
+
+    def __len__(self):
+        return self._next_seq - self._oldest_seq
+
+    def append(self, value):
+        """ Agrega un valor; si la ventana está llena, expira el más antiguo """
+        value = float(value)
+        # Primero expiramos: el valor nuevo reutiliza el casillero del más antiguo en '_in_low'
+        if len(self) == self.window:
+            self._expire_oldest()
+
+        seq = self._next_seq
+        self._next_seq += 1
+        if not self.low or value <= -self.low[0][0]:
+            heapq.heappush(self.low, (-value, seq))
+            self._in_low[seq % self.window] = True
+            self.low_size += 1
+        else:
+            heapq.heappush(self.high, (value, seq))
+            self._in_low[seq % self.window] = False
+            self.high_size += 1
+
+        self._rebalance()
+
+        # Compactación: más expirados que valores vivos => limpiamos los heaps
+        if len(self.low) + len(self.high) > 2 * self.window + 8:
+            self._rebuild()
+
+    def median(self):
+        """ Mediana de la ventana (promedio de los dos centrales si el tamaño es par) """
+        if not len(self):
+            raise ValueError("Mediana de una ventana vacía")
+        if self.low_size > self.high_size:
+            return -self.low[0][0]
+        return (-self.low[0][0] + self.high[0][0]) / 2.0
+
+    def clear(self):
+        self.low.clear()
+        self.high.clear()
+        self.low_size = 0
+        self.high_size = 0
+        self._oldest_seq = self._next_seq
+
+    def _expire_oldest(self):
+        # Borrado diferido: descontamos del heap que lo contiene y limpiamos su cima
+        if self._in_low[self._oldest_seq % self.window]:
+            self.low_size -= 1
+        else:
+            self.high_size -= 1
+        self._oldest_seq += 1
+        self._prune(self.low)
+        self._prune(self.high)
+
+    def _prune(self, heap):
+        # Elimina de la cima los valores expirados
+        while heap and heap[0][1] < self._oldest_seq:
+            heapq.heappop(heap)
+
+    def _rebuild(self):
+        # Compactación IN-PLACE (sin listas nuevas: corre en régimen, dentro del bucle
+        # principal). Los tamaños efectivos no cambian: solo se quitan expirados.
+        for heap in (self.low, self.high):
+            kept = 0
+            for entry in heap:
+                if entry[1] >= self._oldest_seq:
+                    heap[kept] = entry
+                    kept += 1
+            del heap[kept:]
+            heapq.heapify(heap)
+
+    def _rebalance(self):
+        # Invariante: low_size == high_size o low_size == high_size + 1
+        while self.low_size > self.high_size + 1:
+            value, seq = heapq.heappop(self.low)
+            heapq.heappush(self.high, (-value, seq))
+            self._in_low[seq % self.window] = False
+            self.low_size -= 1
+            self.high_size += 1
+            self._prune(self.low)
+        while self.low_size < self.high_size:
+            value, seq = heapq.heappop(self.high)
+            heapq.heappush(self.low, (-value, seq))
+            self._in_low[seq % self.window] = True
+            self.high_size -= 1
+            self.low_size += 1
+            self._prune(self.high)
@@ -0,0 +1,216 @@
+import time
+from bisect import bisect_right
+
+"""
+-----------------------------------------------------------------------------
+SUBSYSTEM: PLANIFICADOR POR DEADLINES (BUCLE PRINCIPAL SIN DERIVA)
+-----------------------------------------------------------------------------
+Descripción:
+Reemplaza el 'time.sleep(LOOP_SPEED_S)' al final de cada ciclo del main.
+Con el sleep fijo el periodo real es 50 ms + tiempo de proceso: el bucle se
+atrasa de forma acumulativa y el chunk de 'points_per_chunk' deja de coincidir
+con las muestras que realmente llegaron (puntos duplicados o perdidos).
+
+Solución:
+Los ciclos se anclan a una grilla fija sobre el reloj monótono:
+deadline_k = inicio + k * periodo. Se duerme solo lo que falta hasta el
+próximo deadline, así el tiempo de proceso no se acumula.
+
+Bajo carga (el ciclo terminó después de uno o más deadlines):
+- 'merge': un único ciclo cubre todos los periodos vencidos ('tick.periods'),
+  el que llama procesa los datos de todos ellos juntos (no se pierde stream).
+- 'skip':  los periodos vencidos se descartan y se vuelve a la grilla.
+En ambos casos NUNCA se ejecutan ciclos seguidos para "ponerse al día".
+
+Métricas:
+- Retraso (lateness): cuánto después de su deadline arrancó cada ciclo,
+  acumulado en un histograma de milisegundos.
+- Desborde (overrun): ciclos cuyo trabajo duró más que el periodo.
+- Ciclos salteados / fusionados.
+
+Disparo por datos (SampleCountTrigger):
+Alternativa al reloj: un ciclo se dispara cuando una placa acumuló al menos
+K muestras nuevas. No hay ciclos vacíos cuando los datos se atrasan y el
+chunk es exactamente lo que llegó (sin 'fs * 0.05' redondeado).
+-----------------------------------------------------------------------------
+"""
+
+# Límites superiores (ms) de las clases del histograma de retraso
+LATENESS_BINS_MS = [1, 2, 5, 10, 20, 50, 100]
+
+
+class Tick:
+    __slots__ = ("index", "deadline", "start", "lateness_s", "periods")
+
+    def __init__(self, index, deadline, start, lateness_s, periods):
+        self.index = index            # Posición en la grilla (deadline = inicio + index * periodo)
+        self.deadline = deadline
+        self.start = start            # Instante (monótono) en que arrancó el ciclo
+        self.lateness_s = lateness_s
+        self.periods = periods        # Periodos que cubre este ciclo (>1 solo con 'merge')
+
+
+class DeadlineScheduler:
+    def __init__(self, period_s, policy="merge", sleep=time.sleep, clock=time.monotonic):
+        if period_s <= 0:
+            raise ValueError("El periodo del planificador debe ser > 0")
+        if policy not in ("merge", "skip"):
+            raise ValueError(f"Política desconocida: {policy} (usar 'merge' o 'skip')")
+        self.period_s = period_s
+        self.policy = policy
+        self._sleep = sleep
+        self._clock = clock
+
+        self.start_time = None
+        self.index = 0
+        self.current = None
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.ticks = 0
+        self.skipped_ticks = 0
+        self.merged_ticks = 0
+        self.overruns = 0
+        self.max_overrun_s = 0.0
+        self.max_lateness_s = 0.0
+        self.lateness_sum_s = 0.0
+        # Una clase por límite + la clase abierta (> último límite)
+        self.lateness_histogram = [0] * (len(LATENESS_BINS_MS) + 1)
+
+    def start(self):
+        """ Ancla la grilla: el primer ciclo arranca de inmediato """
+        self.start_time = self._clock()
+        self.index = 0
+        self.current = None
+
+    def wait(self):
+        """
+        Duerme hasta el próximo deadline y retorna el Tick a procesar.
+        Si ya pasaron varios deadlines aplica la política ('merge' o 'skip').
+        """
+        if self.start_time is None:
+            self.start()
+        if self.current is not None:
+            self.done()
+
+        deadline = self.start_time + self.index * self.period_s
+        now = self._clock()
+        if now < deadline:
+            self._sleep(deadline - now)
+            now = self._clock()
+
+        lateness = max(0.0, now - deadline)
+        # Deadlines adicionales que también vencieron mientras tanto
+        missed = int(lateness / self.period_s)
+        if missed:
+            if self.policy == "merge":
+                self.merged_ticks += missed
+            else:
+                self.skipped_ticks += missed
+        periods = missed + 1 if self.policy == "merge" else 1
+
+        tick = Tick(self.index, deadline, now, lateness, periods)
+        self.index += missed + 1
+        self._record_lateness(lateness)
+        self.current = tick
+        return tick
+
+    def done(self):
+        """
+        Marca el fin del trabajo del ciclo actual (registra el desborde).
+        Opcional: 'wait' lo llama solo si quedó pendiente.
+        """
+        tick = self.current
+        if tick is None:
+            return
+        self.current = None
+        busy = self._clock() - tick.start
+        overrun = busy - self.period_s * tick.periods
+        if overrun > 0:
+            self.overruns += 1
+            self.max_overrun_s = max(self.max_overrun_s, overrun)
+
+    def _record_lateness(self, lateness):
+        self.ticks += 1
+        self.lateness_sum_s += lateness
+        self.max_lateness_s = max(self.max_lateness_s, lateness)
+        self.lateness_histogram[bisect_right(LATENESS_BINS_MS, lateness * 1000.0)] += 1
+
+    def histogram(self):
+        """ Histograma de retraso como {etiqueta: ciclos} ('<1ms', '1-2ms', ..., '>=100ms') """
+        labels = [f"<{LATENESS_BINS_MS[0]}ms"]
+        labels += [f"{low}-{high}ms" for low, high in zip(LATENESS_BINS_MS, LATENESS_BINS_MS[1:])]
+        labels.append(f">={LATENESS_BINS_MS[-1]}ms")
+        return dict(zip(labels, self.lateness_histogram))
+
+    def snapshot(self):
+        """ Resumen para logs / métricas """
+        return {
+            "ticks": self.ticks,
+            "skipped_ticks": self.skipped_ticks,
+            "merged_ticks": self.merged_ticks,
+            "overruns": self.overruns,
+            "max_overrun_ms": self.max_overrun_s * 1000.0,
+            "mean_lateness_ms": self.lateness_sum_s / self.ticks * 1000.0 if self.ticks else 0.0,
+            "max_lateness_ms": self.max_lateness_s * 1000.0,
+            "lateness_histogram": self.histogram(),
+        }
+
+
+class SampleCountTrigger:
+    def __init__(self, handlers, min_samples, poll_interval_s=0.002, max_wait_s=1.0,
+                 sleep=time.sleep, clock=time.monotonic):
+        """
+        'handlers' es {user_id: BrainflowHandler}; cada uno expone 'pending_samples()'.
+        'max_wait_s' acota la espera: sin datos 'wait' retorna [] (placas caídas, fin de
+        una reproducción) y el bucle puede seguir con sus tareas periódicas.
+        """
+        if min_samples < 1:
+            raise ValueError("El disparo por muestras necesita K >= 1")
+        self.handlers = handlers
+        self.min_samples = min_samples
+        self.poll_interval_s = poll_interval_s
+        self.max_wait_s = max_wait_s
+        self._sleep = sleep
+        self._clock = clock
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.ticks = 0
+        self.idle_polls = 0      # Consultas sin ninguna placa lista
+        self.timeouts = 0
+        self.samples_sum = 0     # Muestras pendientes al disparar (para el promedio)
+        self.ready_sum = 0       # Placas listas por disparo
+
+    def wait(self):
+        """ Espera hasta que alguna placa tenga >= K muestras nuevas. Retorna sus user_id """
+        deadline = self._clock() + self.max_wait_s
+        while True:
+            ready = []
+            for user_id, handler in self.handlers.items():
+                try:
+                    pending = handler.pending_samples()
+                except Exception:
+                    continue  # Una placa caída no bloquea al resto (poll reporta el error)
+                if pending >= self.min_samples:
+                    ready.append(user_id)
+                    self.samples_sum += pending
+            if ready:
+                self.ticks += 1
+                self.ready_sum += len(ready)
+                return ready
+            if self._clock() >= deadline:
+                self.timeouts += 1
+                return ready
+            self.idle_polls += 1
+            self._sleep(self.poll_interval_s)
+
+    def snapshot(self):
+        """ Resumen para logs / métricas """
+        return {
+            "ticks": self.ticks,
+            "idle_polls": self.idle_polls,
+            "timeouts": self.timeouts,
+            # Muestras por placa en cada disparo (tamaño medio del chunk)
+            "mean_samples_per_tick": self.samples_sum / self.ready_sum if self.ready_sum else 0.0,
+        }
@@ -0,0 +1,281 @@
+import math
+import numpy as np
+from scipy import signal
+
+"""
+-----------------------------------------------------------------------------
+SUBSYSTEM: ESTIMACIÓN ESPECTRAL (INCREMENTAL Y DE BANDA LIMITADA)
+-----------------------------------------------------------------------------
+Descripción:
+Estimadores espectrales alternativos a 'DataFilter.get_psd_welch' para la
+ETAPA 2 de DataAnalyzer (búsqueda de la frecuencia cardíaca dominante).
+
+Welch Deslizante (SlidingWelch):
+Dos ventanas consecutivas del main comparten ~99% de sus muestras, por lo que
+recalcular la PSD completa en cada ciclo es trabajo repetido. Aquí cada
+segmento de Welch se enventana y transforma (FFT) UNA sola vez, cuando las
+muestras nuevas lo completan. La PSD promedio se actualiza sumando la
+contribución del segmento nuevo y restando la del segmento que sale de la
+ventana. El coste por ciclo escala con las muestras nuevas, no con la ventana.
+
+Estimador de Banda Limitada (BandSpectrumEstimator):
+De la PSD completa (0 - 125Hz) solo se usa la banda fisiológica 0.75-3.8Hz
+(<3% del espectro). Este estimador evalúa ÚNICAMENTE esa banda con un banco
+precalculado de bins DFT (equivalente a un banco de Goertzel, resuelto como una
+sola multiplicación matriz-vector) con una rejilla mucho más fina que la FFT,
+y refina el pico con interpolación parabólica (resolución sub-bin).
+
+Periodograma por Filas (BandPeriodogram):
+Pico de la banda para una matriz [señales x N] (atletas o derivaciones ECG)
+con una sola rfft por filas, en la misma rejilla que DataFilter.get_psd_welch
+con nperseg = ventana (Blackman-Harris, sin refinamiento sub-bin).
+
+Calidad del Pico:
+Los estimadores por filas pueden devolver además la calidad de cada pico:
+fracción de la potencia de banda concentrada a +-0.25 Hz del pico (0-1). Una
+derivación limpia concentra su energía en el ritmo cardíaco; una ruidosa o
+desconectada la reparte por toda la banda.
+-----------------------------------------------------------------------------
+"""
+
+# Banda fisiológica de búsqueda (45 - 228 BPM)
+HEART_RATE_BAND_HZ = (0.75, 3.8)
+
+# Semiancho (Hz) alrededor del pico que cuenta como "energía del ritmo" en la calidad
+PEAK_QUALITY_HALF_WIDTH_HZ = 0.25
+
+
+def peak_quality(power, freqs, k, half_width_hz=PEAK_QUALITY_HALF_WIDTH_HZ):
+    """ Fracción de la potencia de banda de cada fila [señales x bins] cercana a su pico 'k' """
+    near = np.abs(freqs[None, :] - freqs[k][:, None]) <= half_width_hz
+    total = power.sum(axis=-1)
+    concentrated = np.sum(power * near, axis=-1)
+    return np.where(total > 0.0, concentrated / np.where(total > 0.0, total, 1.0), 0.0)
+
+
+class SlidingWelch:
+    def __init__(self, sampling_rate, window_points=1024, nperseg=512, noverlap=None,
+                 nfft=None, window='blackmanharris'):
+        if noverlap is None:
+            noverlap = nperseg // 2  # 50% de solapamiento (igual que el modo batch)
+        if nperseg > window_points:
+            raise ValueError("nperseg no puede ser mayor que la ventana de análisis")
+
+        self.sampling_rate = sampling_rate
+        self.nperseg = nperseg
+        self.hop = nperseg - noverlap
+        # Zero-padding opcional: interpola la rejilla de frecuencias (no añade resolución real)
+        self.nfft = nfft if nfft is not None else nperseg
+
+        # Número de segmentos que caben en la ventana de análisis
+        self.n_segments = (window_points - nperseg) // self.hop + 1
+
+        # Ventana de Blackman-Harris y escala de densidad (one-sided, como scipy.signal.welch)
+        self.taper = signal.get_window(window, nperseg)
+        self.scale = 1.0 / (sampling_rate * np.sum(self.taper ** 2))
+        self.freqs = np.fft.rfftfreq(self.nfft, 1.0 / sampling_rate)
+
+        # --- CACHÉ DE SEGMENTOS ---
+        # Buffer circular con la contribución (|FFT|^2) de cada segmento de la ventana.
+        self.segment_psd = np.zeros((self.n_segments, len(self.freqs)))
+        self.psd_sum = np.zeros(len(self.freqs))
+        self.next_slot = 0
+        self.valid_segments = 0
+
+        # Últimas 'nperseg' muestras (para armar el próximo segmento)
+        self.tail = np.zeros(nperseg)
+        self.samples_seen = 0
+        # Muestras que faltan para completar el próximo segmento
+        self.samples_to_next = nperseg
+
+    @property
+    def is_ready(self):
+        # La PSD es comparable a la del modo batch cuando todos los segmentos están llenos
+        return self.valid_segments >= self.n_segments
+
+    @property
+    def psd(self):
+        """ PSD promedio de los segmentos de la ventana actual """
+        return self.psd_sum / max(self.valid_segments, 1)
+
+    def update(self, new_samples):
+        """
+        Agrega muestras nuevas (ya filtradas). Solo calcula la FFT de los
+        segmentos que estas muestras completan. Retorna True si la PSD cambió.
+        """
+        changed = False
+        offset = 0
+        n_new = len(new_samples)
+
+        while offset < n_new:
+            take = min(self.samples_to_next, n_new - offset)
+            self._push_tail(new_samples[offset:offset + take])
+            offset += take
+            self.samples_to_next -= take
+
+            if self.samples_to_next == 0:
+                self._add_segment(self.tail)
+                self.samples_to_next = self.hop
+                changed = True
+
+        return changed
+
+    def _push_tail(self, samples):
+        n = len(samples)
+        self.tail[:-n] = self.tail[n:]
+        self.tail[-n:] = samples
+        self.samples_seen += n
+
+    def _add_segment(self, segment):
+        # Detrend constante por segmento (igual que Welch) + enventanado + FFT
+        windowed = (segment - np.mean(segment)) * self.taper
+        contribution = np.abs(np.fft.rfft(windowed, n=self.nfft)) ** 2 * self.scale
+        contribution[1:-1] *= 2.0  # one-sided
+
+        # Restamos el segmento que sale de la ventana y sumamos el nuevo
+        self.psd_sum -= self.segment_psd[self.next_slot]
+        self.psd_sum += contribution
+        self.segment_psd[self.next_slot] = contribution
+
+        self.next_slot = (self.next_slot + 1) % self.n_segments
+        self.valid_segments = min(self.valid_segments + 1, self.n_segments)
+
+        # Re-sincronizamos la suma una vez por vuelta del buffer para que el
+        # error de redondeo de las sumas/restas no se acumule indefinidamente.
+        if self.next_slot == 0:
+            self.psd_sum[:] = np.sum(self.segment_psd, axis=0)
+
+    def reset(self):
+        self.segment_psd.fill(0.0)
+        self.psd_sum.fill(0.0)
+        self.tail.fill(0.0)
+        self.next_slot = 0
+        self.valid_segments = 0
+        self.samples_seen = 0
+        self.samples_to_next = self.nperseg
+
+
+class BandSpectrumEstimator:
+    def __init__(self, sampling_rate, band_hz=HEART_RATE_BAND_HZ, n_bins=64, window='blackmanharris'):
+        self.sampling_rate = sampling_rate
+        self.window = window
+        # Rejilla de frecuencias de evaluación (extremos incluidos).
+        # 64 bins en 0.75-3.8Hz = 0.048Hz (~2.9 BPM) vs 0.244Hz (~14.6 BPM) de la FFT de 1024 pts.
+        self.freqs = np.linspace(band_hz[0], band_hz[1], n_bins)
+        self.bin_step = self.freqs[1] - self.freqs[0]
+
+        # Bancos precalculados por longitud de ventana (se construyen una sola vez)
+        self._banks = {}
+
+    def _get_bank(self, n_points):
+        bank = self._banks.get(n_points)
+        if bank is None:
+            # Fila k: ventana * exp(-j*2*pi*f_k*n/fs). Guardamos parte real e imaginaria
+            # apiladas en una matriz real [2*bins x N] => una sola llamada BLAS por ciclo.
+            taper = signal.get_window(self.window, n_points)
+            phase = 2.0 * np.pi * np.outer(self.freqs, np.arange(n_points)) / self.sampling_rate
+            matrix = np.vstack([taper * np.cos(phase), -taper * np.sin(phase)])
+            # Suma de cada fila: permite restar la media (detrend) sin copiar la señal.
+            # Los buffers de trabajo se reservan aquí: power() no asigna memoria.
+            n_bins = len(self.freqs)
+            bank = (matrix, matrix.sum(axis=1), np.zeros(2 * n_bins), np.zeros(2 * n_bins), np.zeros(n_bins))
+            self._banks[n_points] = bank
+        return bank
+
+    def power(self, data):
+        """
+        Potencia (sin normalizar) en cada bin de la banda.
+        Retorna un buffer interno: se sobrescribe en la próxima llamada.
+        """
+        matrix, row_sums, projection, offset, power = self._get_bank(len(data))
+        n_bins = len(self.freqs)
+
+        # projection = matrix @ (data - media), todo in-place
+        np.matmul(matrix, data, out=projection)
+        np.multiply(row_sums, np.mean(data), out=offset)
+        projection -= offset
+
+        # |X|^2 = Re^2 + Im^2
+        np.multiply(projection[:n_bins], projection[:n_bins], out=power)
+        np.multiply(projection[n_bins:], projection[n_bins:], out=offset[:n_bins])
+        power += offset[:n_bins]
+        return power
+
+    def peak_frequency(self, data):
+        """
+        Frecuencia del pico dominante en la banda, con interpolación parabólica
+        sobre el logaritmo de la potencia (exacta para lóbulos gaussianos, buena
+        aproximación para Blackman-Harris).
+        """
+        power = self.power(data)
+        k = int(np.argmax(power))
+
+        # En los extremos de la banda no hay vecinos: devolvemos el bin tal cual
+        if k == 0 or k == len(power) - 1:
+            return self.freqs[k]
+
+        left = math.log(power[k - 1] + 1e-300)
+        center = math.log(power[k] + 1e-300)
+        right = math.log(power[k + 1] + 1e-300)
+        denominator = left - 2.0 * center + right
+        if denominator >= 0.0:
+            return self.freqs[k]
+        offset = 0.5 * (left - right) / denominator
+        return self.freqs[k] + offset * self.bin_step
+
+    def peak_frequencies(self, data, return_quality=False):
+        """
+        Versión vectorizada de peak_frequency para una matriz [señales x N]
+        (una fila por atleta o derivación): una sola multiplicación matricial para todas.
+        Con 'return_quality' retorna (frecuencias, calidad del pico por fila).
+        """
+        matrix, row_sums = self._get_bank(data.shape[-1])[:2]
+        n_bins = len(self.freqs)
+
+        projection = data @ matrix.T - np.mean(data, axis=-1, keepdims=True) * row_sums
+        power = projection[:, :n_bins] ** 2 + projection[:, n_bins:] ** 2
+        k = np.argmax(power, axis=-1)
+
+        # Interpolación parabólica (los picos en los extremos de la banda no se refinan)
+        neighbours = np.clip(k, 1, n_bins - 2)[:, None] + np.array([-1, 0, 1])
+        left, center, right = np.log(np.take_along_axis(power, neighbours, axis=-1) + 1e-300).T
+        denominator = left - 2.0 * center + right
+        refinable = (k > 0) & (k < n_bins - 1) & (denominator < 0.0)
+        offset = np.where(refinable, 0.5 * (left - right) / np.where(refinable, denominator, -1.0), 0.0)
+        peaks = self.freqs[k] + offset * self.bin_step
+        if return_quality:
+            return peaks, peak_quality(power, self.freqs, k)
+        return peaks
+
+
+class BandPeriodogram:
+    def __init__(self, sampling_rate, band_hz=HEART_RATE_BAND_HZ, window='blackmanharris'):
+        self.sampling_rate = sampling_rate
+        self.band_hz = band_hz
+        self.window = window
+        # Ventana y límites de banda por longitud (se calculan una sola vez)
+        self._grids = {}
+
+    def _get_grid(self, n_points):
+        grid = self._grids.get(n_points)
+        if grid is None:
+            taper = signal.get_window(self.window, n_points)
+            freqs = np.fft.rfftfreq(n_points, 1.0 / self.sampling_rate)
+            # Misma búsqueda que DataAnalyzer: bins con 0.75 < f, hasta el primero > 3.8 (excluido)
+            min_idx = int(np.where(freqs > self.band_hz[0])[0][0])
+            max_idx = int(np.where(freqs > self.band_hz[1])[0][0])
+            grid = (taper, min_idx, max_idx, freqs[min_idx:max_idx])
+            self._grids[n_points] = grid
+        return grid
+
+    def peak_frequencies(self, data, return_quality=False):
+        """ Frecuencia dominante en la banda de cada fila de 'data' [señales x N] """
+        taper, min_idx, max_idx, band_freqs = self._get_grid(data.shape[-1])
+        # Periodograma: solo necesitamos el argmax, la escala de densidad es irrelevante
+        windowed = (data - np.mean(data, axis=-1, keepdims=True)) * taper
+        spectrum = np.fft.rfft(windowed, axis=-1)[:, min_idx:max_idx]
+        power = spectrum.real ** 2 + spectrum.imag ** 2
+        k = np.argmax(power, axis=-1)
+        if return_quality:
+            return band_freqs[k], peak_quality(power, band_freqs, k)
+        return band_freqs[k]
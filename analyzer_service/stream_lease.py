@@ -0,0 +1,121 @@
+import json
+import os
+import socket
+import threading
+
+"""
+-----------------------------------------------------------------------------
+SUBSYSTEM: LEASES DEL STREAM DE ONDA (PUBLICAR SOLO SI ALGUIEN MIRA)
+-----------------------------------------------------------------------------
+Descripción:
+El stream de onda (debug_ecg_data) es el mayor consumo de ancho de banda y
+solo lo usan los visualizadores. Cada consumidor declara que está mirando con
+un "lease" (permiso con vencimiento) y el analizador publica el stream de un
+atleta únicamente mientras algún lease vigente lo cubra.
+
+Protocolo:
+- Tópico: 'msoft/msrr/stream_lease/{consumer_id}', mensaje RETENIDO (retain):
+  un analizador que arranca después del consumidor recibe el lease igual.
+- Payload JSON: {"consumer_id", "users": [user_id, ...] o ["*"],
+  "ttl_s": vigencia, "max_rate_hz": mensajes/s por atleta (opcional)}.
+- El consumidor lo renueva cada ttl_s / 3. El vencimiento lo mide el
+  analizador con SU reloj desde la recepción (sin depender de relojes
+  sincronizados entre equipos).
+- Baja: al cerrar se publica un payload vacío retenido (borra el retenido).
+  Si el consumidor muere, el 'last will' registrado al conectar hace lo mismo.
+- 'max_rate_hz': el analizador junta los chunks del atleta y publica como
+  máximo esa cantidad de mensajes por segundo (sin perder muestras). Con
+  varios leases sobre un atleta manda el más permisivo.
+-----------------------------------------------------------------------------
+"""
+
+LEASE_TOPIC_PREFIX = "msoft/msrr/stream_lease"
+DEFAULT_LEASE_TTL_S = 10.0
+ALL_USERS = "*"
+
+
+def lease_topic(consumer_id):
+    return f"{LEASE_TOPIC_PREFIX}/{consumer_id}"
+
+
+def parse_lease(payload):
+    """
+    Decodifica un lease. Retorna (usuarios o None = todos, ttl_s, max_rate_hz o None),
+    o None si el payload está vacío (baja del consumidor).
+    """
+    if not payload:
+        return None
+    data = json.loads(payload)
+    users = data.get("users") or [ALL_USERS]
+    max_rate_hz = data.get("max_rate_hz")
+    return (None if ALL_USERS in users else frozenset(users),
+            float(data.get("ttl_s", DEFAULT_LEASE_TTL_S)),
+            float(max_rate_hz) if max_rate_hz else None)
+
+
+class StreamLease:
+    def __init__(self, client, consumer_id=None, users=None, ttl_s=DEFAULT_LEASE_TTL_S, max_rate_hz=None):
+        """
+        Lease de un consumidor sobre el cliente Paho 'client'.
+        Llamar 'install_will' ANTES de conectar, 'start' al conectar (también tras
+        una reconexión) y 'stop' al cerrar. 'users' = None pide todos los atletas.
+        """
+        self.client = client
+        self.consumer_id = consumer_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.users = list(users) if users else [ALL_USERS]
+        self.ttl_s = ttl_s
+        self.max_rate_hz = max_rate_hz
+        self.topic = lease_topic(self.consumer_id)
+        self._timer = None
+        self._active = False
+        self._lock = threading.Lock()
+
+    def payload(self):
+        data = {"consumer_id": self.consumer_id, "users": self.users, "ttl_s": self.ttl_s}
+        if self.max_rate_hz:
+            data["max_rate_hz"] = self.max_rate_hz
+        return json.dumps(data)
+
+    def install_will(self):
+        # Si el consumidor muere sin 'stop', el broker borra el lease retenido
+        self.client.will_set(self.topic, b"", qos=1, retain=True)
+
+    def start(self):
+        """ Publica el lease y programa su renovación (cada ttl_s / 3) """
+        with self._lock:
+            self._active = True
+            self._publish_and_schedule()
+
+    def _renew(self):
+        # Hilo del Timer: una renovación que compite con 'stop' no debe republicar el lease
+        with self._lock:
+            if self._active:
+                self._publish_and_schedule()
+
+    def _publish_and_schedule(self):
+        # Llamar con '_lock' tomado
+        if self._timer is not None:
+            self._timer.cancel()
+        self.client.publish(self.topic, self.payload(), qos=1, retain=True)
+        self._timer = threading.Timer(self.ttl_s / 3.0, self._renew)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def stop(self, timeout_s=2.0):
+        """
+        Baja del lease: cancela la renovación y borra el retenido. Espera la
+        confirmación (PUBACK): una desconexión limpia NO dispara el last will, así
+        que si la baja no llega el lease retenido seguiría encendiendo el stream.
+        Llamar ANTES de 'loop_stop' / 'disconnect'. Retorna True si se confirmó.
+        """
+        with self._lock:
+            self._active = False
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        info = self.client.publish(self.topic, b"", qos=1, retain=True)
+        try:
+            info.wait_for_publish(timeout_s)
+        except (RuntimeError, ValueError):
+            return False  # Sin conexión / cola de Paho llena: queda el vencimiento (ttl_s)
+        return info.is_published()
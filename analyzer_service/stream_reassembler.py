@@ -0,0 +1,228 @@
+import numpy as np
+
+"""
+-----------------------------------------------------------------------------
+SUBSYSTEM: REENSAMBLADO DEL STREAM DE ONDA (CONSUMIDORES)
+-----------------------------------------------------------------------------
+Descripción:
+Cada mensaje de debug_ecg_data lleva una secuencia (una por mensaje del
+emisor) y cada chunk el índice de su primera muestra en el stream de la
+placa. Con eso el consumidor reconstruye el stream de cada atleta EN ORDEN
+y sabe exactamente qué le falta, en lugar de concatenar chunks a ciegas.
+
+Por atleta:
+- Duplicados: muestras con índice ya entregado (chunk repetido o solapado);
+  se descartan y se cuentan.
+- Desorden: un chunk que llega antes que el anterior se retiene hasta
+  'reorder_window' muestras esperando al que falta; si este llega, el chunk
+  se cuenta como reordenado y no hay hueco.
+- Huecos: si el faltante no llega a tiempo, el hueco se declara, se cuenta
+  (eventos y muestras) y se rellena según 'fill':
+    'hold' repite la última muestra (el eje de tiempo del gráfico no se corre),
+    'nan' / 'zero' rellenan con NaN / 0, 'none' solo lo reporta.
+Por trama: saltos de secuencia = mensajes perdidos (p. ej. descartados por
+la cola de envío del analizador). Una secuencia vieja que faltaba se cuenta
+como trama desordenada (y deja de contar como perdida); una ya vista, como
+trama duplicada.
+
+Reinicio del emisor: al reiniciarse el analizador (Docker 'restart') el
+índice de muestra y la secuencia vuelven a 0. Un salto hacia atrás mayor que
+'reorder_window' (en muestras para el índice, en tramas para la secuencia)
+no es un duplicado sino un stream nuevo: se entrega lo retenido, se
+reinicia el estado y se cuenta en 'resets' / 'seq_resets'.
+
+Los chunks sin índice (formato JSON antiguo) pasan sin verificar.
+-----------------------------------------------------------------------------
+"""
+
+FILL_MODES = ("hold", "nan", "zero", "none")
+_SEQ_MODULUS = 2 ** 32
+# Secuencias faltantes recordadas para reconocer tramas que llegan tarde
+MAX_MISSING_SEQS = 1024
+
+
+class _UserStream:
+    __slots__ = ("next_index", "pending", "last_value", "chunks", "samples", "gaps", "missing_samples",
+                 "duplicate_samples", "reordered_chunks", "unindexed_chunks", "resets")
+
+    def __init__(self):
+        self.next_index = None  # Índice de la próxima muestra a entregar
+        self.pending = {}       # Chunks adelantados: índice inicial -> muestras
+        self.last_value = 0.0
+        self.chunks = 0
+        self.samples = 0
+        self.gaps = 0
+        self.missing_samples = 0
+        self.duplicate_samples = 0
+        self.reordered_chunks = 0
+        self.unindexed_chunks = 0
+        self.resets = 0
+
+
+class StreamReassembler:
+    def __init__(self, reorder_window=64, fill="hold", max_fill=4096):
+        """
+        'reorder_window': muestras adelantadas que se retienen esperando a un chunk atrasado.
+        'max_fill': tope de muestras de relleno por hueco (un corte largo no genera arrays enormes).
+        """
+        if fill not in FILL_MODES:
+            raise ValueError(f"Relleno desconocido: {fill} (usar {', '.join(FILL_MODES)})")
+        self.reorder_window = reorder_window
+        self.fill = fill
+        self.max_fill = max_fill
+        self.users = {}
+        self.next_seq = None
+        self.missing_seqs = set()
+        self.frames = 0
+        self.lost_frames = 0
+        self.reordered_frames = 0
+        self.duplicate_frames = 0
+        self.seq_resets = 0
+
+    def push(self, seq, chunks):
+        """
+        Registra una trama ('decode_ecg_frame' -> (seq, chunks)). Retorna
+        {user_hash: muestras listas EN ORDEN} (con los rellenos ya insertados).
+        """
+        self._track_seq(seq)
+        ready = {}
+        for chunk in chunks:
+            out = self._push_chunk(chunk.user_hash, chunk.sample_index, chunk.samples)
+            if out:
+                ready.setdefault(chunk.user_hash, []).extend(out)
+        return {user_hash: np.concatenate(parts) for user_hash, parts in ready.items()}
+
+    def flush(self):
+        """ Entrega todo lo retenido declarando los huecos pendientes (fin de captura) """
+        ready = {}
+        for user_hash, stream in self.users.items():
+            out = []
+            while stream.pending:
+                self._fill_gap(stream, min(stream.pending), out)
+                self._drain(stream, out)
+            if out:
+                ready[user_hash] = np.concatenate(out)
+        return ready
+
+    def _track_seq(self, seq):
+        if seq is None:
+            return
+        self.frames += 1
+        if self.next_seq is None:
+            self.next_seq = seq
+        ahead = (seq - self.next_seq) % _SEQ_MODULUS
+        if ahead >= _SEQ_MODULUS // 2 and _SEQ_MODULUS - ahead > self.reorder_window \
+                and seq not in self.missing_seqs:
+            # Salto hacia atrás grande: el emisor se reinició (secuencia nueva)
+            self.seq_resets += 1
+            self.missing_seqs.clear()
+            self.next_seq = (seq + 1) % _SEQ_MODULUS
+            return
+        if ahead >= _SEQ_MODULUS // 2:
+            # Secuencia anterior a la esperada: una que faltaba (desorden) o una repetida
+            if seq in self.missing_seqs:
+                self.missing_seqs.discard(seq)
+                self.lost_frames -= 1
+                self.reordered_frames += 1
+            else:
+                self.duplicate_frames += 1
+            return
+        self.lost_frames += ahead
+        if ahead and len(self.missing_seqs) < MAX_MISSING_SEQS:
+            self.missing_seqs.update((self.next_seq + k) % _SEQ_MODULUS
+                                     for k in range(min(ahead, MAX_MISSING_SEQS - len(self.missing_seqs))))
+        self.next_seq = (seq + 1) % _SEQ_MODULUS
+
+    def _push_chunk(self, user_hash, sample_index, samples):
+        stream = self.users.get(user_hash)
+        if stream is None:
+            stream = self.users[user_hash] = _UserStream()
+        stream.chunks += 1
+        out = []
+        if len(samples) == 0:
+            return out
+        if sample_index is None:
+            stream.unindexed_chunks += 1
+            self._emit(stream, samples, out)
+            return out
+        if stream.next_index is not None and sample_index < stream.next_index - self.reorder_window:
+            # Salto hacia atrás grande: el emisor se reinició (índices nuevos desde 0)
+            while stream.pending:
+                self._fill_gap(stream, min(stream.pending), out)
+                self._drain(stream, out)
+            stream.resets += 1
+            stream.next_index = None
+        if stream.next_index is None:
+            stream.next_index = sample_index
+
+        end = sample_index + len(samples)
+        if end <= stream.next_index:
+            stream.duplicate_samples += len(samples)
+            return out
+        if sample_index > stream.next_index:
+            # Adelantado: se retiene a la espera del faltante
+            if stream.pending and sample_index < max(stream.pending):
+                stream.reordered_chunks += 1  # Llegó después de un chunk posterior retenido
+            previous = stream.pending.get(sample_index)
+            if previous is not None:
+                stream.duplicate_samples += min(len(previous), len(samples))
+                if len(previous) >= len(samples):
+                    return out
+            stream.pending[sample_index] = samples
+            if end - stream.next_index > self.reorder_window:
+                self._fill_gap(stream, min(stream.pending), out)
+                self._drain(stream, out)
+            return out
+
+        if stream.pending:
+            stream.reordered_chunks += 1  # Llegó después de chunks posteriores
+        if sample_index < stream.next_index:
+            stream.duplicate_samples += stream.next_index - sample_index
+            samples = samples[stream.next_index - sample_index:]
+        self._emit(stream, samples, out)
+        stream.next_index = end
+        self._drain(stream, out)
+        return out
+
+    def _drain(self, stream, out):
+        # Entrega los chunks retenidos que ya quedaron contiguos
+        while stream.pending:
+            start = min(stream.pending)
+            if start > stream.next_index:
+                return
+            samples = stream.pending.pop(start)
+            end = start + len(samples)
+            if end <= stream.next_index:
+                stream.duplicate_samples += len(samples)
+                continue
+            if start < stream.next_index:
+                stream.duplicate_samples += stream.next_index - start
+                samples = samples[stream.next_index - start:]
+            self._emit(stream, samples, out)
+            stream.next_index = end
+
+    def _fill_gap(self, stream, until, out):
+        missing = until - stream.next_index
+        stream.gaps += 1
+        stream.missing_samples += missing
+        if self.fill != "none":
+            n = min(missing, self.max_fill)
+            value = {"hold": stream.last_value, "nan": np.nan, "zero": 0.0}[self.fill]
+            out.append(np.full(n, value))
+        stream.next_index = until
+
+    def _emit(self, stream, samples, out):
+        stream.samples += len(samples)
+        stream.last_value = samples[-1]
+        out.append(samples)
+
+    def snapshot(self, user_hash=None):
+        """ Contadores de un atleta (o la suma de todos) + pérdidas de tramas """
+        streams = [self.users[user_hash]] if user_hash is not None else list(self.users.values())
+        summary = {name: sum(getattr(stream, name) for stream in streams)
+                   for name in ("chunks", "samples", "gaps", "missing_samples", "duplicate_samples",
+                                "reordered_chunks", "unindexed_chunks", "resets")}
+        summary.update(frames=self.frames, lost_frames=self.lost_frames,
+                       reordered_frames=self.reordered_frames, duplicate_frames=self.duplicate_frames,
+                       seq_resets=self.seq_resets)
+        return summary
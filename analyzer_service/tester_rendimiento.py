@@ -0,0 +1,1641 @@
+import argparse
+import gc
+import json
+import threading
+import subprocess
+import sys
+import os
+import tempfile
+import time
+import tracemalloc
+from collections import deque
+import numpy as np
+from brainflow.board_shim import BoardShim, BoardIds
+from brainflow.data_filter import DataFilter, WindowOperations
+
+from scipy import signal as sp_signal
+
+from data_analysis import DataAnalyzer
+from batch_analysis import BatchDataAnalyzer
+from zone_engine import ZoneEngine
+from spectral import SlidingWelch
+from ring_buffer import RingBuffer
+from acquisition_stats import AcquisitionStats, PACKAGE_MODULUS
+from rolling_stats import RunningMedian
+from recording import SessionRecorder, ReplayBoard, load_recording
+from brainflow_handler import ReplayHandler
+from board_manager import BoardManager
+from scheduler import DeadlineScheduler, SampleCountTrigger
+from wire_format import decode_ecg_chunk, decode_ecg_frame, encode_ecg_chunk, user_id_hash
+import mqtt_handler
+from stream_reassembler import StreamReassembler
+from stream_lease import StreamLease
+
+"""
+-----------------------------------------------------------------------------
+TESTER: RENDIMIENTO Y EQUIVALENCIA DEL PIPELINE DSP (OFFLINE)
+-----------------------------------------------------------------------------
+Descripción:
+Script de verificación que NO necesita placa ni broker MQTT. Genera una señal
+ECG sintética con frecuencia cardíaca conocida y compara los distintos motores
+del analizador contra la implementación original (BrainFlow DataFilter).
+
+Uso:
+    python tester_rendimiento.py filtros
+    python tester_rendimiento.py welch
+    python tester_rendimiento.py decimacion
+    python tester_rendimiento.py qrs
+    python tester_rendimiento.py mediana
+    python tester_rendimiento.py memoria
+    python tester_rendimiento.py multiatleta
+    python tester_rendimiento.py zonas
+    python tester_rendimiento.py ringbuffer
+    python tester_rendimiento.py adquisicion
+    python tester_rendimiento.py placas
+    python tester_rendimiento.py replay
+    python tester_rendimiento.py planificador
+    python tester_rendimiento.py disparo
+    python tester_rendimiento.py arranque
+    python tester_rendimiento.py derivaciones
+    python tester_rendimiento.py formato
+    python tester_rendimiento.py cola
+    python tester_rendimiento.py agrupacion
+    python tester_rendimiento.py reensamblado
+    python tester_rendimiento.py leases
+-----------------------------------------------------------------------------
+"""
+
+FS = 250
+WINDOW = 1024
+# Muestras nuevas por ciclo del main (250Hz * 0.05s)
+CHUNK = 12
+
+
+def synthetic_ecg(n_points, fs=FS, hr_hz=1.5, seed=0):
+    """ ECG sintético: QRS + onda T, ruido de red 50Hz, deriva de línea base y ruido blanco """
+    rng = np.random.default_rng(seed)
+    t = np.arange(n_points) / fs
+    phase = (t * hr_hz) % 1.0
+    ecg = 800 * np.exp(-((phase - 0.5) / 0.04) ** 2) + 150 * np.exp(-((phase - 0.8) / 0.08) ** 2)
+    noise = 40 * np.sin(2 * np.pi * 50 * t) + 50 * np.sin(2 * np.pi * 0.2 * t) + rng.normal(0, 10, n_points)
+    return ecg + noise + 300
+
+
+def psd_peak_hz(filtered, fs=FS):
+    """ Pico espectral en la banda fisiológica (misma lógica que calculate_bpm) """
+    ampls, freqs = DataFilter.get_psd_welch(filtered, len(filtered), len(filtered) // 2,
+                                            fs, WindowOperations.BLACKMAN_HARRIS.value)
+    min_idx = np.where(freqs > 0.75)[0][0]
+    max_idx = np.where(freqs > 3.8)[0][0]
+    return freqs[min_idx + np.argmax(ampls[min_idx:max_idx])]
+
+
+def timeit(func, repeats=500):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        func()
+    return (time.perf_counter() - start) / repeats * 1e6  # microsegundos
+
+
+def bench_filtros(args):
+    """ Motor 'fused' vs 'brainflow': tolerancia documentada y coste por ciclo """
+    reference = DataAnalyzer(FS, filter_engine="brainflow")
+    fused = DataAnalyzer(FS, filter_engine="fused")
+    edge = FS // 2  # 0.5 s en cada borde
+
+    worst_interior, worst_total, peak_mismatches = 0.0, 0.0, 0
+    for seed in range(args.cases):
+        raw = synthetic_ecg(WINDOW, hr_hz=0.9 + 2.5 * seed / args.cases, seed=seed)
+        ref = reference.filter_signal(raw)
+        out = fused.filter_signal(raw)
+        scale = np.max(np.abs(ref))
+        error = np.abs(out - ref)
+        worst_total = max(worst_total, error.max() / scale)
+        worst_interior = max(worst_interior, error[edge:-edge].max() / scale)
+        peak_mismatches += psd_peak_hz(ref) != psd_peak_hz(out)
+
+    print(f"Casos: {args.cases}")
+    print(f"Error máximo (interior, sin 0.5s de bordes): {worst_interior * 100:.4f}% del pico (tolerancia 0.5%)")
+    print(f"Error máximo (ventana completa):            {worst_total * 100:.2f}% del pico")
+    print(f"Picos espectrales distintos (BPM):          {peak_mismatches}")
+
+    raw = synthetic_ecg(WINDOW)
+    t_ref = timeit(lambda: reference.filter_signal(raw))
+    t_fused = timeit(lambda: fused.filter_signal(raw))
+    print(f"Coste por ciclo: brainflow {t_ref:.1f} us | fused {t_fused:.1f} us")
+
+    ok = worst_interior < 0.005 and peak_mismatches == 0
+    print("RESULTADO:", "OK" if ok else "FUERA DE TOLERANCIA")
+    return ok
+
+
+def run_stream(analyzer, raw):
+    """
+    Simula el bucle del main sobre una señal completa (chunks de 12 pts).
+    Retorna (BPM final, segundos de CPU por ciclo de análisis).
+    """
+    bpm, busy, ticks = 0.0, 0.0, 0
+    for end in range(CHUNK, len(raw) + 1, CHUNK):
+        start = time.perf_counter()
+        if analyzer.filter_mode == "streaming":
+            filtered = analyzer.filter_new_samples(raw[end - CHUNK:end])
+        elif end >= WINDOW:
+            filtered = analyzer.filter_signal(raw[end - WINDOW:end])
+        else:
+            filtered = None
+        if filtered is not None:
+            bpm = analyzer.calculate_bpm(filtered)
+            busy += time.perf_counter() - start
+            ticks += 1
+    return bpm, busy / max(ticks, 1)
+
+
+def bench_welch(args):
+    """ Welch incremental: PSD idéntica a Welch por lotes, BPM vs get_psd_welch y costo por muestras nuevas """
+    nperseg = WINDOW // 2
+    ok = True
+
+    # 1. Misma PSD que un Welch completo (scipy) sobre la ventana que cubren los segmentos
+    x = synthetic_ecg(WINDOW * 4, hr_hz=2.0)
+    welch = SlidingWelch(FS, window_points=WINDOW, nperseg=nperseg, nfft=WINDOW)
+    for start in range(0, len(x), CHUNK):
+        welch.update(x[start:start + CHUNK])
+    end = welch.samples_seen - (welch.hop - welch.samples_to_next)
+    _, reference = sp_signal.welch(x[end - WINDOW:end], FS, window='blackmanharris', nperseg=nperseg,
+                                   noverlap=nperseg - welch.hop, nfft=WINDOW)
+    psd_error = float(np.max(np.abs(welch.psd - reference)) / np.max(reference))
+    print(f"PSD incremental vs Welch completo: error relativo máx {psd_error:.1e}")
+    ok &= psd_error < 1e-9
+
+    # 2. BPM en el rango de esfuerzo: 'sliding' vs el Welch de BrainFlow (mismo filtro streaming)
+    heart_rates = np.linspace(84, 180, args.cases)
+    errors = {"brainflow": [], "sliding": []}
+    for seed, bpm_true in enumerate(heart_rates):
+        raw = synthetic_ecg(int(args.seconds * FS), hr_hz=bpm_true / 60.0, seed=seed)
+        for psd_engine, engine_errors in errors.items():
+            analyzer = DataAnalyzer(FS, window_points=WINDOW, filter_mode="streaming", psd_engine=psd_engine)
+            bpm, _ = run_stream(analyzer, raw)
+            engine_errors.append(abs(bpm - bpm_true))
+    for psd_engine, engine_errors in errors.items():
+        print(f"BPM {psd_engine:9s}: error mediano {np.median(engine_errors):.2f} | máx {max(engine_errors):.2f} BPM "
+              f"({len(heart_rates)} casos, {heart_rates[0]:.0f}-{heart_rates[-1]:.0f} BPM)")
+    ok &= np.median(errors["sliding"]) <= np.median(errors["brainflow"]) + args.margin
+
+    # 3. Costo por ciclo según las muestras nuevas: el incremental solo procesa lo nuevo
+    #    (una FFT de 'nperseg' cada 'hop' muestras); get_psd_welch recalcula la ventana entera.
+    x = synthetic_ecg(WINDOW * 40)
+    per_sample = {}
+    print(f"{'Muestras nuevas':>16s} {'incremental':>12s} {'por muestra':>12s} {'get_psd_welch':>14s}")
+    for chunk in (6, CHUNK, 24, 48, 96):
+        welch = SlidingWelch(FS, window_points=WINDOW, nperseg=nperseg, nfft=WINDOW)
+        n_ticks = len(x) // chunk
+        start = time.perf_counter()
+        for tick in range(n_ticks):
+            welch.update(x[tick * chunk:(tick + 1) * chunk])
+        t_sliding = (time.perf_counter() - start) / n_ticks * 1e6
+        t_batch = timeit(lambda: DataFilter.get_psd_welch(x[-WINDOW:].copy(), WINDOW, WINDOW // 2, FS,
+                                                          WindowOperations.BLACKMAN_HARRIS.value), repeats=200)
+        per_sample[chunk] = t_sliding / chunk
+        print(f"{chunk:16d} {t_sliding:10.2f}us {per_sample[chunk]:10.3f}us {t_batch:12.2f}us")
+        if chunk == CHUNK:
+            ok &= t_sliding < t_batch
+    # El costo crece con las muestras nuevas y el costo por muestra no (solo baja el overhead por llamada)
+    ok &= per_sample[96] <= per_sample[6] * 1.5
+
+    print("RESULTADO:", "OK" if ok else "WELCH INCREMENTAL DISTINTO")
+    return ok
+
+
+def bench_decimacion(args):
+    """ CPU ahorrada por atleta y delta de precisión de la ruta diezmada """
+    configs = [
+        ("actual (batch/brainflow)", dict()),
+        ("streaming + band @250Hz", dict(filter_mode="streaming", psd_engine="band")),
+        ("streaming + band @50Hz", dict(filter_mode="streaming", psd_engine="band", decimate_to_hz=50)),
+        ("streaming + band @25Hz", dict(filter_mode="streaming", psd_engine="band", decimate_to_hz=25)),
+        ("batch fused + band @50Hz", dict(filter_engine="fused", psd_engine="band", decimate_to_hz=50)),
+    ]
+    heart_rates = np.linspace(60, 200, args.cases) / 60.0
+    n_points = int(args.seconds * FS)
+
+    # Error = mediana del |BPM final - BPM real|. La mediana evita que los casos
+    # donde el pico dominante es un armónico (común en todos los motores) oculten el delta.
+    # Criterio: cada ruta diezmada no puede errar más que la referencia a tasa completa
+    # (streaming + band @250Hz) por encima de 'margin' BPM.
+    print(f"{'Configuración':28s} {'CPU/ciclo':>10s} {'CPU/atleta':>11s} {'Error BPM':>10s} {'Delta':>8s}")
+    baseline_error = None
+    full_rate_error = None
+    decimated_errors = {}
+    for name, kwargs in configs:
+        errors, costs = [], []
+        for seed, hr_hz in enumerate(heart_rates):
+            analyzer = DataAnalyzer(FS, window_points=WINDOW, **kwargs)
+            bpm, cost = run_stream(analyzer, synthetic_ecg(n_points, hr_hz=hr_hz, seed=seed))
+            errors.append(abs(bpm - hr_hz * 60.0))
+            costs.append(cost)
+        median_error = float(np.median(errors))
+        if baseline_error is None:
+            baseline_error = median_error
+        cost_us = np.mean(costs) * 1e6
+        # 20 ciclos por segundo => % de un núcleo que consume cada atleta
+        load = cost_us * 20 / 1e6 * 100
+        print(f"{name:28s} {cost_us:8.1f}us {load:10.3f}% {median_error:9.2f} {median_error - baseline_error:+8.2f}")
+        if kwargs.get("decimate_to_hz"):
+            decimated_errors[name] = median_error
+        elif kwargs.get("filter_mode") == "streaming":
+            full_rate_error = median_error
+
+    worse = {name: error for name, error in decimated_errors.items() if error > full_rate_error + args.margin}
+    for name, error in worse.items():
+        print(f"{name}: error {error:.2f} BPM > referencia @250Hz {full_rate_error:.2f} + {args.margin:.2f}")
+    ok = not worse
+    print("RESULTADO:", "OK" if ok else "EL DIEZMADO DEGRADA LA PRECISIÓN")
+    return ok
+
+
+def bench_qrs(args):
+    """ Motor de BPM 'qrs': latidos perdidos / espurios, error de BPM y latencia de detección """
+    # Tolerancia de ubicación de la onda R (el pasa-banda causal la corre unas pocas muestras)
+    tolerance = int(0.1 * FS)
+    n_points = int(args.seconds * FS)
+    t = np.arange(n_points) / FS
+    # Se evalúa tras el aprendizaje de umbrales y el llenado del filtro, lejos del final
+    eval_start, eval_end = int(3.0 * FS), n_points - FS
+
+    ok = True
+    print(f"{'BPM':>5s} {'Señal':>8s} {'Latidos':>8s} {'Perdidos':>9s} {'Espurios':>9s} "
+          f"{'Error BPM':>10s} {'Latencia med/máx':>17s}")
+    for true_bpm in (45, 60, 90, 130, 170, 200):
+        hr_hz = true_bpm / 60.0
+        # synthetic_ecg ubica la onda R en la fase 0.5 de cada ciclo
+        true_r = np.round((np.arange(int(args.seconds * hr_hz) + 1) + 0.5) / hr_hz * FS).astype(int)
+        true_r = true_r[true_r < n_points]
+        for noisy in (False, True):
+            raw = synthetic_ecg(n_points, hr_hz=hr_hz, seed=true_bpm)
+            if noisy:
+                # Deriva de línea base fuerte (respiración + movimiento) y ruido blanco
+                rng = np.random.default_rng(true_bpm + 1)
+                raw = raw + 300 * np.sin(2 * np.pi * 0.33 * t) + 150 * np.sin(2 * np.pi * 0.07 * t) \
+                    + rng.normal(0, 40, n_points)
+
+            # Mismo recorrido que el main en streaming: chunks de 12 muestras
+            analyzer = DataAnalyzer(FS, filter_mode="streaming", bpm_engine="qrs")
+            detected, reported_at, errors = [], [], []
+            for start in range(0, n_points - CHUNK + 1, CHUNK):
+                filtered = analyzer.filter_new_samples(raw[start:start + CHUNK])
+                if filtered is None:
+                    continue
+                for r_index, _, _ in analyzer.new_beats:
+                    detected.append(r_index)
+                    reported_at.append(start + CHUNK)
+                bpm = analyzer.calculate_bpm(filtered)
+                if start >= n_points // 2:
+                    errors.append(abs(bpm - true_bpm))
+            detected = np.array(detected)
+            reported_at = np.array(reported_at)
+
+            truth = true_r[(true_r >= eval_start) & (true_r < eval_end)]
+            in_window = detected[(detected >= eval_start) & (detected < eval_end)]
+            nearest = np.abs(detected[None, :] - truth[:, None]).argmin(axis=1)
+            hit = np.abs(detected[nearest] - truth) <= tolerance
+            missed = int(np.count_nonzero(~hit))
+            extra = int(np.count_nonzero(np.abs(in_window[:, None] - true_r[None, :]).min(axis=1) > tolerance))
+            # Latencia: desde la onda R real hasta el fin del chunk que reportó el latido
+            latency = (reported_at[nearest[hit]] - truth[hit]) / FS
+            mean_error = float(np.mean(errors))
+            print(f"{true_bpm:5d} {'ruidosa' if noisy else 'limpia':>8s} {len(truth):8d} {missed:9d} {extra:9d} "
+                  f"{mean_error:10.2f} {np.median(latency):8.2f}/{latency.max():.2f} s")
+            ok &= missed <= len(truth) * 0.01 and extra <= max(1, len(truth) * 0.01)
+            ok &= mean_error <= args.max_error
+            # Un latido se confirma tras el refractario (200 ms) y la integración (150 ms);
+            # el máximo cubre los recuperados por la búsqueda hacia atrás
+            ok &= np.median(latency) <= 0.5 and latency.max() <= 1.5
+
+    print("RESULTADO:", "OK" if ok else "DETECCIÓN DE LATIDOS FUERA DE TOLERANCIA")
+    return ok
+
+
+def bench_mediana(args):
+    """ RunningMedian vs np.median sobre la ventana deslizante (incluye compactaciones y clear) """
+    rng = np.random.default_rng(0)
+    n = args.samples
+    streams = {
+        "BPM con ruido": rng.normal(140, 25, n),
+        "valores repetidos": rng.integers(60, 64, n).astype(float),
+        # Creciente: todo lo que expira queda al fondo de 'low' y solo sale compactando
+        "rampa creciente": np.arange(n, dtype=float),
+        "rampa decreciente": np.arange(n, 0, -1, dtype=float),
+    }
+
+    ok = True
+    print(f"{'Señal':20s} {'Ventana':>8s} {'Errores':>8s} {'Compact.':>9s} {'Heaps máx':>10s}")
+    for name, values in streams.items():
+        for window in (1, 2, 5, 40, 41):
+            median = RunningMedian(window)
+            rebuilds = [0]
+            rebuild = median._rebuild
+
+            def counting_rebuild():
+                rebuilds[0] += 1
+                rebuild()
+
+            median._rebuild = counting_rebuild
+            history = []
+            errors = 0
+            max_heaps = 0
+            for i, value in enumerate(values):
+                # A mitad de la corrida: 'clear' debe dejar la mediana como nueva
+                if i == n // 2:
+                    median.clear()
+                    history.clear()
+                median.append(value)
+                history.append(value)
+                errors += median.median() != np.median(history[-window:])
+                ok &= len(median) == min(len(history), window)
+                max_heaps = max(max_heaps, len(median.low) + len(median.high))
+            print(f"{name:20s} {window:8d} {errors:8d} {rebuilds[0]:9d} {max_heaps:10d}")
+            # Memoria acotada: nunca más del doble de la ventana (+ margen de compactación)
+            ok &= errors == 0 and max_heaps <= 2 * window + 9
+            if name.startswith("rampa") and window >= 5:
+                ok &= rebuilds[0] > 0
+
+    # Coste por muestra con la ventana del historial de BPM (40)
+    history = deque(maxlen=40)
+    median = RunningMedian(40)
+    values = streams["BPM con ruido"]
+    state = {"i": 0}
+
+    def numpy_step():
+        history.append(values[state["i"] % n])
+        state["i"] += 1
+        np.median(history)
+
+    def running_step():
+        median.append(values[state["i"] % n])
+        state["i"] += 1
+        median.median()
+
+    t_numpy = timeit(numpy_step, 5000)
+    t_running = timeit(running_step, 5000)
+    print(f"Coste por muestra (ventana 40): np.median(deque) {t_numpy:.2f}us | RunningMedian {t_running:.2f}us")
+    print("RESULTADO:", "OK" if ok else "MEDIANA INCORRECTA")
+    return ok
+
+
+def bench_memoria(args):
+    """
+    Asignaciones de memoria por ciclo en régimen (tracemalloc), en corridas largas
+    (2000 ciclos por defecto) para cubrir varias compactaciones de la mediana
+    """
+    configs = [
+        ("actual (batch/brainflow)", dict(), False),
+        ("batch fused", dict(filter_engine="fused"), False),
+        ("batch fused + band", dict(filter_engine="fused", psd_engine="band"), True),
+    ]
+    raw = synthetic_ecg(WINDOW + CHUNK * (args.ticks + args.warmup))
+
+    print(f"{'Configuración':28s} {'Neto/ciclo':>11s} {'Neto total':>11s} {'Tras GC':>10s} {'Pico/ciclo':>11s}")
+    ok = True
+    window_bytes = WINDOW * 8
+    for name, kwargs, must_be_flat in configs:
+        analyzer = DataAnalyzer(FS, window_points=WINDOW, **kwargs)
+
+        def tick(i):
+            start = i * CHUNK
+            filtered = analyzer.filter_signal(raw[start:start + WINDOW])
+            bpm = analyzer.calculate_bpm(filtered)
+            analyzer.detect_zone_change(bpm)
+
+        # Calentamiento: cachés, bancos y mediana llena antes de medir
+        for i in range(args.warmup):
+            tick(i)
+
+        # Pico por ciclo: lo máximo que un ciclo asigna por encima de lo que ya estaba vivo.
+        # Un temporal del tamaño de la ventana (p. ej. un np.copy) aparece aquí aunque se libere.
+        tracemalloc.start()
+        baseline, _ = tracemalloc.get_traced_memory()
+        tick_peak = 0
+        for i in range(args.warmup, args.warmup + args.ticks):
+            before, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            tick(i)
+            tick_peak = max(tick_peak, tracemalloc.get_traced_memory()[1] - before)
+        current, _ = tracemalloc.get_traced_memory()
+        # El wrapper de DataFilter.get_psd_welch (numpy.ctypeslib) deja ciclos que solo libera
+        # el GC y ~60 B cada ~13 llamadas que ni el GC libera: es de BrainFlow, no de la ruta
+        gc.collect()
+        collected, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        net = current - baseline
+        retained = collected - baseline
+        print(f"{name:28s} {net / args.ticks:9.1f} B {net / 1024:8.1f} KB {retained / 1024:7.1f} KB "
+              f"{tick_peak / 1024:8.1f} KB")
+        # Cota de la ruta sin asignaciones (válida en corridas largas): neto < una ventana
+        # (solo floats de la mediana) y ningún ciclo asigna media ventana, ni siquiera el
+        # que compacta los heaps de la mediana (ocurre cada ~50 ciclos)
+        if must_be_flat and (net > window_bytes or tick_peak >= window_bytes // 2):
+            ok = False
+
+    print("RESULTADO:", "OK" if ok else "ASIGNA MEMORIA EN RÉGIMEN")
+    return ok
+
+
+def bench_multiatleta(args):
+    """ BatchDataAnalyzer vs un DataAnalyzer por atleta: mismos BPM y coste por ciclo """
+    n_points = WINDOW + CHUNK * args.ticks
+    heart_rates = np.linspace(70, 190, args.athletes) / 60.0
+    raw = np.stack([synthetic_ecg(n_points, hr_hz=hr, seed=i) for i, hr in enumerate(heart_rates)])
+    ages = np.full(args.athletes, 30)
+
+    batch = BatchDataAnalyzer(FS, ages, window_points=WINDOW)
+    singles = [DataAnalyzer(FS, filter_engine="fused") for _ in range(args.athletes)]
+
+    worst, t_batch, t_loop = 0.0, 0.0, 0.0
+    for tick in range(args.ticks):
+        windows = raw[:, tick * CHUNK:tick * CHUNK + WINDOW]
+
+        start = time.perf_counter()
+        batch_bpm = batch.calculate_bpm(batch.filter_signals(windows))
+        t_batch += time.perf_counter() - start
+
+        start = time.perf_counter()
+        loop_bpm = [a.calculate_bpm(a.filter_signal(w)) for a, w in zip(singles, windows)]
+        t_loop += time.perf_counter() - start
+
+        worst = max(worst, float(np.max(np.abs(batch_bpm - loop_bpm))))
+
+    t_batch, t_loop = t_batch / args.ticks * 1e3, t_loop / args.ticks * 1e3
+    print(f"Atletas: {args.athletes} | Ciclos: {args.ticks}")
+    print(f"Diferencia máxima de BPM (batch vs 1-D): {worst:.4f}")
+    print(f"Coste por ciclo: bucle {t_loop:.2f} ms | batch {t_batch:.2f} ms ({t_loop / t_batch:.1f}x)")
+
+    ok = worst < 0.5
+    print("RESULTADO:", "OK" if ok else "BPM DISTINTOS")
+    return ok
+
+
+class ReferenceZoneMachine:
+    """ Máquina de estados original de DataAnalyzer (if/elif + histéresis), con reloj inyectado """
+    def __init__(self, age):
+        self.max_hr = 220 - age
+        self.current_zone = 0
+        self.candidate_zone = 0
+        self.zone_candidate_start_time = 0
+        self.MIN_TIME_IN_ZONE_S = 2.0
+
+    def detect_zone_change(self, bpm, now):
+        if bpm < (self.max_hr * 0.6): p_zone = 1
+        elif bpm < (self.max_hr * 0.7): p_zone = 2
+        elif bpm < (self.max_hr * 0.8): p_zone = 3
+        elif bpm < (self.max_hr * 0.9): p_zone = 4
+        else: p_zone = 5
+
+        if p_zone == self.current_zone:
+            self.candidate_zone = 0
+            self.zone_candidate_start_time = 0
+            return (False, 0, 0)
+        if p_zone != self.candidate_zone:
+            self.candidate_zone = p_zone
+            self.zone_candidate_start_time = now
+            return (False, 0, 0)
+        if now - self.zone_candidate_start_time >= self.MIN_TIME_IN_ZONE_S:
+            old = self.current_zone
+            self.current_zone = self.candidate_zone
+            self.candidate_zone = 0
+            self.zone_candidate_start_time = 0
+            return (True, old, self.current_zone)
+        return (False, 0, 0)
+
+
+def bench_zonas(args):
+    """ ZoneEngine vectorizado vs máquina de estados original sobre una sesión grabada """
+    rng = np.random.default_rng(0)
+    ages = rng.integers(18, 70, args.athletes)
+    # Sesión sintética: BPM con deriva lenta + ruido (cruza umbrales y rebota en ellos)
+    # y timestamps a ~20Hz con jitter distinto por atleta.
+    drift = np.cumsum(rng.normal(0, 1.5, (args.ticks, args.athletes)), axis=0)
+    bpm = np.clip(120 + drift + rng.normal(0, 4, drift.shape), 40, 230)
+    # Incluimos valores exactamente sobre los umbrales (caso límite del '<')
+    bpm[::50] = (220 - ages) * 0.7
+    timestamps = 1000.0 + np.cumsum(rng.uniform(0.03, 0.07, drift.shape), axis=0)
+
+    references = [ReferenceZoneMachine(int(age)) for age in ages]
+    engine = ZoneEngine(220 - ages)
+    # Atajo escalar de un único atleta (el que usa DataAnalyzer), verificado sobre el atleta 0
+    single = ZoneEngine(220 - ages[0])
+    mismatches, events = 0, 0
+    t_ref, t_engine = 0.0, 0.0
+    for tick in range(args.ticks):
+        start = time.perf_counter()
+        expected = [m.detect_zone_change(b, t) for m, b, t in zip(references, bpm[tick], timestamps[tick])]
+        t_ref += time.perf_counter() - start
+
+        start = time.perf_counter()
+        changed, old_zone, new_zone = engine.update(bpm[tick], timestamps[tick])
+        t_engine += time.perf_counter() - start
+
+        got = list(zip(changed.tolist(), old_zone.tolist(), new_zone.tolist()))
+        mismatches += sum(e != g for e, g in zip(expected, got))
+        mismatches += single.detect_zone_change(bpm[tick, 0], timestamps[tick, 0]) != expected[0]
+        events += sum(e[0] for e in expected)
+
+    print(f"Atletas: {args.athletes} | Ciclos: {args.ticks} | Cambios de zona: {events}")
+    print(f"Eventos distintos: {mismatches}")
+    print(f"Coste por ciclo: original {t_ref / args.ticks * 1e6:.1f} us | vectorizado {t_engine / args.ticks * 1e6:.1f} us")
+
+    ok = mismatches == 0 and events > 0
+    print("RESULTADO:", "OK" if ok else "EVENTOS DISTINTOS")
+    return ok
+
+
+def bench_ringbuffer(args):
+    """ RingBuffer espejado vs np.roll: equivalencia de la ventana y coste por chunk """
+    rng = np.random.default_rng(0)
+    ok = True
+    print(f"{'Ventana':>8s} {'Canales':>8s} {'np.roll':>10s} {'RingBuffer':>11s}")
+    for capacity in (1024, 1250, 8192):
+        for channels in (None, 8):
+            rows = 1 if channels is None else channels
+            stream = rng.normal(size=(rows, capacity * 4 + 400))
+            if channels is None:
+                stream = stream[0]
+
+            # Equivalencia: chunks de tamaño variable (incluye uno mayor que la ventana)
+            ring = RingBuffer(capacity, channels=channels)
+            rolled = np.zeros(stream.shape[:-1] + (capacity,))
+            start = 0
+            for size in [5, 12, 13, capacity + 3, 1, 12, 40] * 3:
+                chunk = stream[..., start:start + size]
+                start += size
+                n_new = min(size, capacity)
+                rolled = np.roll(rolled, -n_new, axis=-1)
+                rolled[..., -n_new:] = chunk[..., -n_new:]
+                ring.append(chunk)
+                ok &= bool(np.array_equal(ring.view(), rolled))
+                ok &= ring.view().flags['C_CONTIGUOUS'] or channels is not None
+
+            # Coste por chunk de 12 muestras (append + ventana lista para usar)
+            chunk = stream[..., :CHUNK]
+            state = {"buffer": np.zeros(stream.shape[:-1] + (capacity,))}
+
+            def roll_step():
+                buffer = np.roll(state["buffer"], -CHUNK, axis=-1)
+                buffer[..., -CHUNK:] = chunk
+                state["buffer"] = buffer
+
+            def ring_step():
+                ring.append(chunk)
+                ring.view()
+
+            t_roll = timeit(roll_step, 5000)
+            t_ring = timeit(ring_step, 5000)
+            print(f"{capacity:8d} {rows:8d} {t_roll:8.2f}us {t_ring:9.2f}us")
+
+    print("RESULTADO:", "OK" if ok else "VENTANAS DISTINTAS")
+    return ok
+
+
+def bench_adquisicion(args):
+    """ AcquisitionStats: huecos inyectados (cortos y de más de una vuelta del contador) y jitter """
+    rng = np.random.default_rng(0)
+    jitter_s = args.jitter_ms / 1000.0
+    window = WINDOW
+
+    # Stream "real" de la placa: contador de paquetes de 8 bits y reloj con jitter gaussiano
+    n_total = args.samples
+    sent_packages = np.arange(n_total) % PACKAGE_MODULUS
+    sent_timestamps = 1.7e9 + np.arange(n_total) / FS + rng.normal(0, jitter_s, n_total)
+
+    # Huecos: cortos (dentro de una vuelta del contador), uno en el primer chunk y uno largo
+    # (600 muestras > 256: solo el reloj lo ve completo)
+    lost = np.zeros(n_total, dtype=bool)
+    gap_starts = np.sort(rng.choice(np.arange(2 * window, n_total - 2000), args.gaps, replace=False))
+    gap_lengths = rng.integers(1, 40, args.gaps)
+    gap_lengths[args.gaps // 2] = 600
+    for start, length in zip(gap_starts, gap_lengths):
+        lost[start:start + length] = True
+    lost[5:8] = True
+    kept = np.flatnonzero(~lost)
+    # Eventos reales = tramos perdidos contiguos (dos huecos pueden solaparse)
+    edges = np.diff(lost.astype(np.int8))
+    true_events = int(np.count_nonzero(edges == 1))
+    true_dropped = int(np.count_nonzero(lost))
+
+    # Verdad de ventana: la muestra recibida i viene después de un hueco
+    gap_before = np.zeros(len(kept), dtype=bool)
+    gap_before[1:] = np.diff(kept) > 1
+
+    stats = AcquisitionStats(FS)
+    window_errors = 0
+    received = 0
+    # Lecturas de tamaño variable, como un bucle con backlog
+    while received < len(kept):
+        size = int(rng.integers(1, 60))
+        block = kept[received:received + size]
+        stats.update(sent_packages[block], sent_timestamps[block])
+        received += len(block)
+        truth = received >= window and not gap_before[received - window + 1:received].any()
+        window_errors += stats.window_intact(window) != truth
+
+    snap = stats.snapshot()
+    expected_jitter_ms = args.jitter_ms * np.sqrt(2.0)  # intervalo = diferencia de dos relojes con jitter
+    expected_rate = (len(kept) - 1) / (sent_timestamps[kept[-1]] - sent_timestamps[kept[0]])
+    print(f"Muestras: {snap['samples_received']}/{len(kept)} | perdidas {snap['dropped_samples']}/{true_dropped} "
+          f"en {snap['gap_events']}/{true_events} huecos")
+    print(f"Jitter: {snap['jitter_ms']:.3f} ms (esperado {expected_jitter_ms:.3f}) | "
+          f"tasa efectiva {snap['effective_rate_hz']:.2f} Hz (esperada {expected_rate:.2f}) | "
+          f"backlog máx {snap['max_backlog']}")
+    print(f"Ventana íntegra ({window} pts): {window_errors} diferencias con la verdad en {received} muestras")
+    ok = (snap["samples_received"] == len(kept) and snap["dropped_samples"] == true_dropped
+          and snap["gap_events"] == true_events and window_errors == 0)
+    ok &= abs(snap["jitter_ms"] - expected_jitter_ms) <= 0.1 * expected_jitter_ms
+    ok &= abs(snap["effective_rate_hz"] - expected_rate) <= 0.01
+
+    # Sin huecos: el jitter no debe contarse como pérdida
+    clean = AcquisitionStats(FS)
+    for start in range(0, n_total, CHUNK):
+        clean.update(sent_packages[start:start + CHUNK], sent_timestamps[start:start + CHUNK])
+    print(f"Sin huecos: perdidas {clean.dropped_samples} | ventana íntegra {clean.window_intact(window)}")
+    ok &= clean.dropped_samples == 0 and clean.gap_events == 0 and clean.window_intact(window)
+
+    print("RESULTADO:", "OK" if ok else "DIAGNÓSTICO DE ADQUISICIÓN INCORRECTO")
+    return ok
+
+
+def bench_placas(args):
+    """
+    Ciclo de vida de BoardManager con placas sintéticas de BrainFlow: arranque y lectura,
+    fallo a mitad del arranque (libera también las ya preparadas), placa que falla al leer
+    y 'stop' best-effort
+    """
+    # Sin el log del driver: los fallos inyectados se ven en los logs del gestor
+    BoardShim.disable_board_logger()
+    users = [f"atleta_{athlete:02d}" for athlete in range(args.athletes)]
+    athletes = [(user_id, 30) for user_id in users]
+
+    def prepared(boards):
+        return {user_id: handler.board_shim.is_prepared() for user_id, handler in boards.handlers.items()}
+
+    def failing(*_args, **_kwargs):
+        raise RuntimeError("fallo inyectado")
+
+    ok = True
+    # 1. Arranque completo, lectura en paralelo y liberación al salir del 'with'
+    with BoardManager(athletes, descr_cache=None) as boards:
+        ready = all(prepared(boards).values()) and boards.started == users
+        received = dict.fromkeys(users, 0)
+        for _ in range(int(args.seconds / 0.05)):
+            time.sleep(0.05)
+            for user_id, samples in boards.poll(streaming=True).items():
+                received[user_id] += 0 if samples is None else len(samples)
+    released = not any(prepared(boards).values())
+    print(f"Arranque: {len(users)} placas preparadas {ready} | muestras por placa {min(received.values())}-"
+          f"{max(received.values())} | liberadas al salir {released}")
+    ok &= ready and released and min(received.values()) > 0
+
+    # 2. La última placa falla tras 'prepare_session': todo o nada, sin sesiones colgadas
+    boards = BoardManager(athletes, descr_cache=None)
+    boards.handlers[users[-1]].board_shim.start_stream = failing
+    try:
+        boards.start()
+        raised = False
+    except RuntimeError:
+        raised = True
+    leaked = [user_id for user_id, is_prepared in prepared(boards).items() if is_prepared]
+    print(f"Fallo al arrancar {users[-1]}: excepción propagada {raised} | sesiones colgadas {leaked or 'ninguna'} "
+          f"| activas {len(boards.started)}")
+    ok &= raised and not leaked and not boards.started
+
+    # 3. Una placa que falla al leer no detiene al resto; 'stop' sigue aunque una falle al liberar
+    boards = BoardManager(athletes, descr_cache=None)
+    boards.start()
+    time.sleep(0.2)
+    broken = boards.handlers[users[0]]
+    broken.get_new_data = failing
+    readings = boards.poll(streaming=True)
+    others_read = all(readings[user_id] is not None for user_id in users[1:])
+    real_stop = broken.stop
+    broken.stop = failing
+    boards.stop()
+    leaked = [user_id for user_id, is_prepared in prepared(boards).items() if is_prepared]
+    real_stop()
+    print(f"Lectura fallida de {users[0]}: None {readings[users[0]] is None} | resto leído {others_read} | "
+          f"stop con un fallo: colgadas {leaked}")
+    ok &= readings[users[0]] is None and others_read and leaked == [users[0]]
+    ok &= not broken.board_shim.is_prepared()
+
+    print("RESULTADO:", "OK" if ok else "CICLO DE VIDA DE PLACAS INCORRECTO")
+    return ok
+
+
+def bench_replay(args):
+    """ Graba una sesión sintética y la reproduce a máxima velocidad con ReplayHandler """
+    board_id = BoardIds.SYNTHETIC_BOARD.value
+    n_rows = BoardShim.get_num_rows(board_id)
+    package_channel = BoardShim.get_package_num_channel(board_id)
+    timestamp_channel = BoardShim.get_timestamp_channel(board_id)
+    ecg_channel = BoardShim.get_ecg_channels(board_id)[0]
+
+    # Sesión: FC en escalones (zona 1 -> 4 -> 1 para 30 años) con fase continua
+    n_points = int(args.seconds * FS) // CHUNK * CHUNK
+    hr_hz = np.full(n_points, 1.5)
+    hr_hz[n_points // 3:2 * n_points // 3] = 2.8
+    phase = np.cumsum(hr_hz) / FS % 1.0
+    rng = np.random.default_rng(0)
+    t = np.arange(n_points) / FS
+    ecg = (800 * np.exp(-((phase - 0.5) / 0.15) ** 2) + 40 * np.sin(2 * np.pi * 50 * t)
+           + rng.normal(0, 10, n_points) + 300)
+
+    session = np.zeros((n_rows, n_points))
+    session[package_channel] = np.arange(n_points) % 256
+    session[timestamp_channel] = 1.7e9 + t
+    session[ecg_channel] = ecg
+
+    ok = True
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "atleta_01.msrr")
+        # Grabación en bloques irregulares + un bloque truncado al final (proceso interrumpido)
+        recorder = SessionRecorder(path, board_id, FS, n_rows)
+        start = 0
+        while start < n_points:
+            size = int(rng.integers(1, 40))
+            recorder.write(session[:, start:start + size])
+            start += size
+        recorder.file.write(np.uint32(50).tobytes() + b"\0" * 64)
+        recorder.close()
+
+        file_board_id, fs, loaded = load_recording(path)
+        round_trip = file_board_id == board_id and fs == FS and np.array_equal(loaded, session)
+        print(f"Ida y vuelta de la grabación: {'idéntica' if round_trip else 'DISTINTA'} "
+              f"({os.path.getsize(path) / 1e6:.1f} MB, {n_points} muestras)")
+        ok &= round_trip
+
+        # Referencia: ventanas cortadas a mano con el timestamp de la última muestra
+        reference = DataAnalyzer(sampling_rate=FS, age=30, window_points=WINDOW)
+        expected = []
+        for end in range(WINDOW, n_points + 1, CHUNK):
+            bpm = reference.calculate_bpm(reference.filter_signal(ecg[end - WINDOW:end]))
+            change = reference.detect_zone_change(bpm, now=session[timestamp_channel, end - 1])
+            if change[0]:
+                expected.append(change[1:])
+
+        # Reproducción a máxima velocidad (mismo bucle que el main)
+        replay = ReplayHandler(path, num_points=WINDOW, speed=0, chunk_points=CHUNK)
+        replay.start()
+        # Timestamps rebasados al arranque (latencia medible) con los segundos de sesión intactos
+        replay_ts = replay.board_shim.data[timestamp_channel]
+        rebased = abs(replay_ts[0] - time.time()) < 5.0 and np.allclose(np.diff(replay_ts), 1.0 / FS, atol=1e-6)
+        print(f"Timestamps de la reproducción: {'rebasados al arranque' if rebased else 'de la sesión ORIGINAL'} "
+              f"(original {session[timestamp_channel, 0]:.0f} -> {replay_ts[0]:.0f})")
+        ok &= rebased
+        analyzer = DataAnalyzer(sampling_rate=replay.sampling_rate, age=30, window_points=WINDOW)
+        events = []
+        start = time.perf_counter()
+        while not replay.finished:
+            raw = replay.get_data()
+            if raw is None:
+                continue
+            bpm = analyzer.calculate_bpm(analyzer.filter_signal(raw), window_intact=replay.window_intact)
+            change = analyzer.detect_zone_change(bpm, now=replay.now())
+            if change[0]:
+                events.append(change[1:])
+        elapsed = time.perf_counter() - start
+        replay.stop()
+
+    print(f"Sesión de {n_points / FS:.0f}s reproducida en {elapsed:.2f}s ({n_points / FS / elapsed:.0f}x tiempo real)")
+    print(f"Cambios de zona: referencia {expected} | reproducción {events}")
+    print(f"Muestras perdidas según la reproducción: {replay.stats.dropped_samples}")
+    ok &= events == expected and len(events) > 0 and replay.stats.dropped_samples == 0
+
+    print("RESULTADO:", "OK" if ok else "REPRODUCCIÓN DISTINTA")
+    return ok
+
+
+class FakeClock:
+    """ Reloj simulado: 'sleep' y el trabajo del ciclo solo avanzan el tiempo """
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def bench_planificador(args):
+    """ Deriva del bucle con sleep fijo vs DeadlineScheduler (reloj simulado, con picos de carga) """
+    period = 0.05
+    rng = np.random.default_rng(0)
+    # Trabajo por ciclo: 5-15 ms, con picos ocasionales de 60-180 ms (GC, CPU compartida)
+    work = rng.uniform(0.005, 0.015, args.ticks)
+    spikes = rng.random(args.ticks) < 0.02
+    work[spikes] = rng.uniform(0.06, 0.18, spikes.sum())
+
+    # Bucle original: trabajo + sleep(periodo) => el periodo real es 50 ms + trabajo
+    clock = FakeClock()
+    for busy in work:
+        clock.sleep(busy)
+        clock.sleep(period)
+    sleep_drift = clock() - args.ticks * period
+
+    ok = True
+    for policy in ("merge", "skip"):
+        clock = FakeClock()
+        scheduler = DeadlineScheduler(period, policy=policy, sleep=clock.sleep, clock=clock)
+        scheduler.start()
+        covered = 0
+        for busy in work:
+            tick = scheduler.wait()
+            covered += tick.periods
+            # Todo ciclo arranca sobre la grilla (o después de su deadline, nunca antes)
+            ok &= tick.start >= tick.deadline and abs(tick.deadline - tick.index * period) < 1e-9
+            clock.sleep(busy)
+        scheduler.done()
+        snap = scheduler.snapshot()
+        # Sin deriva: el índice de la grilla sigue al reloj (a lo sumo un periodo de diferencia)
+        drift = clock() - scheduler.index * period
+        ok &= abs(drift) <= period
+        if policy == "merge":
+            # Ningún periodo se pierde: los ciclos cubren toda la grilla recorrida
+            ok &= covered == scheduler.index
+        else:
+            ok &= covered + snap["skipped_ticks"] == scheduler.index
+        print(f"[{policy:5s}] ciclos {snap['ticks']} | periodos cubiertos {covered}/{scheduler.index} | "
+              f"fusionados {snap['merged_ticks']} | salteados {snap['skipped_ticks']} | "
+              f"desbordes {snap['overruns']} | retraso medio {snap['mean_lateness_ms']:.2f} ms "
+              f"(máx {snap['max_lateness_ms']:.1f} ms)")
+        print(f"        histograma {snap['lateness_histogram']}")
+
+    print(f"Deriva tras {args.ticks} ciclos: sleep fijo {sleep_drift:.1f}s | planificador < {period * 1000:.0f} ms")
+    print("RESULTADO:", "OK" if ok else "DERIVA DETECTADA")
+    return ok
+
+
+class FakeBoard:
+    """ Placa simulada: entrega bloques de muestras según un reloj simulado """
+    def __init__(self, clock, arrival_times):
+        self.clock = clock
+        self.arrival_times = arrival_times  # Instante de llegada de cada muestra
+        self.consumed = 0
+
+    def pending_samples(self):
+        return int(np.searchsorted(self.arrival_times, self.clock(), side='right')) - self.consumed
+
+    def read_new(self):
+        # Índices de las muestras nuevas (lo que retiraría get_board_data)
+        end = self.consumed + self.pending_samples()
+        indices = np.arange(self.consumed, end)
+        self.consumed = end
+        return indices
+
+
+def bench_disparo(args):
+    """ Chunk fijo de 'fs * 0.05' por ciclo de reloj vs disparo por K muestras nuevas """
+    rng = np.random.default_rng(0)
+    n_samples = int(args.seconds * FS)
+    # La placa entrega bloques de 10 muestras con jitter y cortes ocasionales (Bluetooth)
+    block_times = np.arange(n_samples // 10) * 10 / FS + rng.uniform(0, 0.01, n_samples // 10)
+    stalls = rng.random(len(block_times)) < 0.01
+    block_times += np.cumsum(stalls * rng.uniform(0.1, 0.4, len(block_times)))
+    arrival_times = np.maximum.accumulate(np.repeat(block_times, 10))
+    end_time = arrival_times[-1] + 0.1
+    points_per_chunk = int(FS * 0.05)
+
+    # Reloj fijo: cada 50 ms se envía la cola de la ventana (points_per_chunk puntos)
+    clock = FakeClock()
+    board = FakeBoard(clock, arrival_times)
+    sent = np.zeros(n_samples, dtype=int)
+    timer_ticks, empty_ticks = 0, 0
+    while clock() < end_time:
+        new = board.read_new()
+        timer_ticks += 1
+        if len(new) == 0:
+            empty_ticks += 1  # Ciclo desperdiciado: se re-analiza y re-envía la misma ventana
+        if board.consumed >= points_per_chunk:
+            sent[board.consumed - points_per_chunk:board.consumed] += 1
+        clock.sleep(0.05)
+    timer_missing = int(np.count_nonzero(sent == 0))
+    timer_duplicated = int(np.count_nonzero(sent > 1))
+
+    # Disparo por muestras: el chunk son exactamente las muestras nuevas
+    clock = FakeClock()
+    board = FakeBoard(clock, arrival_times)
+    trigger = SampleCountTrigger({"a": board}, args.k, sleep=clock.sleep, clock=clock)
+    sent = np.zeros(n_samples, dtype=int)
+    while board.consumed < n_samples and clock() < end_time + 1.0:
+        if trigger.wait():
+            sent[board.read_new()] += 1
+    trigger_missing = int(np.count_nonzero(sent == 0))
+    trigger_duplicated = int(np.count_nonzero(sent > 1))
+    snap = trigger.snapshot()
+
+    print(f"Sesión: {n_samples} muestras en {end_time:.1f}s (cortes de señal: {int(stalls.sum())})")
+    print(f"Reloj 20Hz:       {timer_ticks} ciclos ({empty_ticks} sin datos nuevos) | "
+          f"muestras no enviadas {timer_missing} | duplicadas {timer_duplicated}")
+    print(f"Disparo K={args.k:<3d}:    {snap['ticks']} ciclos ({snap['mean_samples_per_tick']:.1f} muestras/ciclo) | "
+          f"muestras no enviadas {trigger_missing} | duplicadas {trigger_duplicated}")
+
+    ok = trigger_missing == 0 and trigger_duplicated == 0
+    print("RESULTADO:", "OK" if ok else "CHUNKS INEXACTOS")
+    return ok
+
+
+def time_to_first_bpm(raw, prewarm_s, psd_engine):
+    """ Segundos de sesión hasta el primer BPM (mismo bucle que el main, ventana parcial opcional) """
+    analyzer = DataAnalyzer(sampling_rate=FS, age=30, window_points=WINDOW, psd_engine=psd_engine)
+    min_points = int(prewarm_s * FS) if prewarm_s else WINDOW
+    for end in range(CHUNK, len(raw) + 1, CHUNK):
+        if end < min_points:
+            continue
+        bpm = analyzer.calculate_bpm(analyzer.filter_signal(raw[max(0, end - WINDOW):end]))
+        if bpm > 0:
+            return end / FS, bpm
+    return None, 0.0
+
+
+def bench_arranque(args):
+    """ Constructor del handler con/sin caché de metadata y tiempo hasta el primer BPM """
+    cache_path = os.path.join(tempfile.gettempdir(), "tester_board_descr.json")
+    if os.path.exists(cache_path):
+        os.remove(cache_path)
+    # Proceso nuevo por medición: la carga de la librería nativa ocurre una vez por proceso.
+    # Tras el constructor se informa si BrainFlow ya cargó libBoardController (singleton).
+    probe = ("import time; from brainflow_handler import BrainflowHandler; "
+             "from brainflow.board_shim import BoardControllerDLL; t = time.perf_counter(); "
+             "h = BrainflowHandler(descr_cache={!r}); print((time.perf_counter() - t) * 1000, "
+             "BoardControllerDLL._BoardControllerDLL__instance is not None)")
+    results = {}
+    loaded = {}
+    for label, path in (("sin caché", None), ("caché fría", cache_path), ("caché caliente", cache_path)):
+        out = subprocess.run([sys.executable, "-c", probe.format(path)], capture_output=True, text=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)))
+        elapsed_ms, native = out.stdout.strip().splitlines()[-1].split()
+        results[label] = float(elapsed_ms)
+        loaded[label] = native == "True"
+    os.remove(cache_path)
+    print("Constructor de BrainflowHandler: " + " | ".join(
+        f"{k} {v:.1f} ms (librería nativa {'cargada' if loaded[k] else 'sin cargar'})" for k, v in results.items()))
+
+    # Con caché caliente la librería nativa recién se carga en 'prepare_session' (board_descriptor.py)
+    ok = results["caché caliente"] < results["sin caché"] and not loaded["caché caliente"]
+    # Primer BPM en todo el rango de esfuerzo: el pre-calentado no puede ser menos preciso que
+    # la ventana completa. El main solo lo aplica con PSD 'band'; la fila 'brainflow' muestra por qué.
+    heart_rates = np.arange(84.0, 181.0, 6.0)
+    for psd_engine in ("brainflow", "band"):
+        errors_full, errors_warm = [], []
+        for bpm_true in heart_rates:
+            raw = synthetic_ecg(WINDOW * 3, hr_hz=bpm_true / 60.0)
+            t_full, bpm_full = time_to_first_bpm(raw, 0.0, psd_engine)
+            t_warm, bpm_warm = time_to_first_bpm(raw, args.prewarm, psd_engine)
+            errors_full.append(abs(bpm_full - bpm_true))
+            errors_warm.append(abs(bpm_warm - bpm_true))
+            ok &= t_warm < t_full
+        kept = max(errors_warm) <= max(errors_full) + args.tolerance
+        print(f"PSD {psd_engine:9s}: primer BPM ventana completa {t_full:.2f}s (error medio {np.mean(errors_full):.1f}, "
+              f"máx {max(errors_full):.1f} BPM) | pre-calentado {args.prewarm:.1f}s -> {t_warm:.2f}s (error medio "
+              f"{np.mean(errors_warm):.1f}, máx {max(errors_warm):.1f} BPM) | "
+              f"{'precisión conservada' if kept else 'DEGRADA el primer BPM'}"
+              + (" (el main no lo aplica)" if psd_engine != "band" else ""))
+        if psd_engine == "band":
+            ok &= kept
+
+    print("RESULTADO:", "OK" if ok else "SIN MEJORA")
+    return ok
+
+
+def multi_lead_ecg(n_points, n_leads, hr_hz, corrupted, seed=0):
+    """ Derivaciones del mismo corazón; 'corrupted' lleva un artefacto de movimiento periódico fuerte """
+    rng = np.random.default_rng(seed)
+    t = np.arange(n_points) / FS
+    leads = np.empty((n_leads, n_points))
+    for lead in range(n_leads):
+        # Cada derivación ve el QRS con otra amplitud y con ruido propio
+        leads[lead] = synthetic_ecg(n_points, hr_hz=hr_hz, seed=seed * n_leads + lead) * (1.0 - 0.15 * lead)
+    artifact_hz = rng.uniform(0.8, 3.5)
+    while abs(artifact_hz - hr_hz) < 0.3:
+        artifact_hz = rng.uniform(0.8, 3.5)
+    leads[corrupted] += 2000 * np.sin(2 * np.pi * artifact_hz * t) + rng.normal(0, 200, n_points)
+    return leads
+
+
+def bench_derivaciones(args):
+    """ Voto ponderado multi-derivación vs una sola derivación, y filtrado 2-D vs bucle 1-D """
+    n_leads = args.leads
+    errors_single, errors_fused = [], []
+    for case in range(args.cases):
+        rng = np.random.default_rng(case)
+        # Bajo ~75 BPM el QRS angosto del ECG sintético deja ganar a un armónico (en todas las derivaciones)
+        hr_hz = rng.uniform(1.3, 3.0)
+        # La derivación principal (la que usa el modo de una derivación) falla en la mitad de los casos
+        corrupted = 0 if case % 2 == 0 else int(rng.integers(1, n_leads))
+        leads = multi_lead_ecg(WINDOW * 4, n_leads, hr_hz, corrupted, seed=case)
+
+        single = DataAnalyzer(sampling_rate=FS, age=30, window_points=WINDOW,
+                              filter_engine="fused", psd_engine="band")
+        fused = DataAnalyzer(sampling_rate=FS, age=30, window_points=WINDOW, psd_engine="band", n_leads=n_leads)
+        for end in range(WINDOW, leads.shape[1] + 1, CHUNK):
+            window = leads[:, end - WINDOW:end]
+            bpm_single = single.calculate_bpm(single.filter_signal(window[0]))
+            bpm_fused = fused.calculate_bpm(fused.filter_signal(window))
+        errors_single.append(abs(bpm_single - hr_hz * 60))
+        errors_fused.append(abs(bpm_fused - hr_hz * 60))
+
+    errors_single, errors_fused = np.array(errors_single), np.array(errors_fused)
+    print(f"{args.cases} casos, {n_leads} derivaciones (una con artefacto de movimiento por caso)")
+    print(f"Una derivación:   error medio {errors_single.mean():6.2f} BPM | máx {errors_single.max():6.2f} | "
+          f"casos > 5 BPM: {int((errors_single > 5).sum())}")
+    print(f"Voto ponderado:   error medio {errors_fused.mean():6.2f} BPM | máx {errors_fused.max():6.2f} | "
+          f"casos > 5 BPM: {int((errors_fused > 5).sum())}")
+
+    # Filtrado: una llamada 2-D [derivaciones x N] vs una llamada por derivación
+    window = multi_lead_ecg(WINDOW, n_leads, 1.5, 0)
+    per_lead = DataAnalyzer(sampling_rate=FS, age=30, window_points=WINDOW)
+    fused = DataAnalyzer(sampling_rate=FS, age=30, window_points=WINDOW, psd_engine="band", n_leads=n_leads)
+    t_loop = timeit(lambda: [per_lead.filter_signal(window[lead]) for lead in range(n_leads)], repeats=200)
+    t_fused = timeit(lambda: fused.filter_signal(window), repeats=200)
+    print(f"Filtrado por ciclo: bucle 1-D (BrainFlow) {t_loop:.1f} us | 2-D fusionado {t_fused:.1f} us "
+          f"(x{t_loop / t_fused:.1f})")
+
+    ok = errors_fused.max() < 5.0 and errors_fused.mean() < errors_single.mean()
+    print("RESULTADO:", "OK" if ok else "VOTO NO ROBUSTO")
+    return ok
+
+
+def bench_formato(args):
+    """ Stream de onda: JSON (.tolist + json.dumps) vs binario float32 / int16 """
+    analyzer = DataAnalyzer(sampling_rate=FS, age=30, window_points=WINDOW, filter_engine="fused")
+    chunk = np.array(analyzer.filter_signal(synthetic_ecg(WINDOW))[-args.chunk:])
+    meta = dict(user_id="atleta_01", sample_index=123456, acquisition_ts=time.time())
+
+    def encode_json():
+        payload = {"ecg_data": chunk.tolist(), "user_id": meta["user_id"],
+                   "sample_index": meta["sample_index"], "timestamp": meta["acquisition_ts"]}
+        return json.dumps(payload).encode()
+
+    encoders = {
+        "json": encode_json,
+        "float32": lambda: encode_ecg_chunk(chunk, sampling_rate=FS, encoding="float32", **meta),
+        "int16": lambda: encode_ecg_chunk(chunk, sampling_rate=FS, encoding="int16", **meta),
+    }
+    ok = True
+    results = {}
+    for name, encode in encoders.items():
+        payload = encode()
+        decoded = decode_ecg_chunk(payload)
+        error = float(np.max(np.abs(decoded.samples - chunk)))
+        results[name] = (len(payload), timeit(encode, repeats=args.repeats),
+                         timeit(lambda: decode_ecg_chunk(payload), repeats=args.repeats))
+        size, t_enc, t_dec = results[name]
+        print(f"{name:8s}: {size:4d} bytes | codificar {t_enc:6.2f} us | decodificar {t_dec:6.2f} us | "
+              f"error máx {error:.4f} (pico {np.max(np.abs(chunk)):.1f})")
+        ok &= decoded.sample_index == meta["sample_index"] and abs(decoded.timestamp - meta["acquisition_ts"]) < 1e-6
+
+    for name in ("float32", "int16"):
+        size, t_enc, t_dec = results[name]
+        print(f"{name:8s} vs json: tamaño x{results['json'][0] / size:.1f} | "
+              f"codificar x{results['json'][1] / t_enc:.1f} | decodificar x{results['json'][2] / t_dec:.1f}")
+        ok &= size < results["json"][0] and t_enc + t_dec < results["json"][1] + results["json"][2]
+
+    print("RESULTADO:", "OK" if ok else "SIN MEJORA")
+    return ok
+
+
+class FakeMessageInfo:
+    def __init__(self, mid, rc=0):
+        self.mid = mid
+        self.rc = rc
+
+
+class SlowBrokerClient:
+    """ Cliente Paho simulado: cada publish tarda 'delay_s' y se confirma 'ack_s' después """
+    def __init__(self, delay_s, ack_s):
+        self.delay_s = delay_s
+        self.ack_s = ack_s
+        self.on_publish = None
+        self.published = []
+        self.mid = 0
+
+    def publish(self, topic, payload, qos=0):
+        if self.delay_s:
+            time.sleep(self.delay_s)
+        self.mid += 1
+        self.published.append(payload)
+        if self.ack_s:
+            threading.Timer(self.ack_s, self.on_publish, args=(self, None, self.mid, 0, None)).start()
+        else:
+            self.on_publish(self, None, self.mid, 0, None)
+        return FakeMessageInfo(self.mid)
+
+    def loop_stop(self):
+        pass
+
+    def disconnect(self):
+        pass
+
+
+def bench_cola(args):
+    """ Cola de envío MQTT: costo para el bucle, descartes con broker lento y eventos sin pérdidas """
+    client = SlowBrokerClient(args.delay_ms / 1000.0, args.ack_ms / 1000.0)
+    original = mqtt_handler.mqtt.Client, mqtt_handler.MQTTPublisher.connect
+    mqtt_handler.mqtt.Client = lambda *a, **k: client
+    mqtt_handler.MQTTPublisher.connect = lambda self: None
+    try:
+        publisher = mqtt_handler.MQTTPublisher(ecg_format="float32", sampling_rate=FS, queue_size=args.queue)
+    finally:
+        mqtt_handler.mqtt.Client, mqtt_handler.MQTTPublisher.connect = original
+
+    chunk = synthetic_ecg(CHUNK)
+    n_events = 0
+    publish_time = 0.0
+    # Ciclos de 50 ms comprimidos a 'tick_ms': con broker lento el bucle publica más de lo que se acepta
+    for tick in range(args.ticks):
+        time.sleep(args.tick_ms / 1000.0)
+        start = time.perf_counter()
+        for athlete in range(args.athletes):
+            user_id = f"atleta_{athlete:02d}"
+            publisher.publish_ecg_data(chunk, user_id, sample_index=tick * CHUNK, acquisition_ts=time.time())
+            publisher.publish_status(user_id, 120.0, 3)
+            if tick % 50 == athlete % 50:
+                publisher.publish_zone_change(user_id, 2, 3, 120.0)
+                n_events += 1
+        publish_time += time.perf_counter() - start
+    enqueue_cost = publish_time / args.ticks * 1000.0
+    publisher.disconnect(flush_timeout_s=30.0)
+    time.sleep(args.ack_ms / 1000.0 + 0.05)
+
+    snap = publisher.snapshot()
+    print(f"{args.ticks} ciclos de {args.tick_ms:.1f} ms x {args.athletes} atletas | broker {args.delay_ms:.1f} ms/mensaje | "
+          f"cola {args.queue}")
+    print(f"Costo de publicar por ciclo (bucle principal): {enqueue_cost:.3f} ms")
+    for priority, s in snap.items():
+        print(f"  {priority:6s}: encolados {s['enqueued']:5d} | enviados {s['sent']:5d} | descartados {s['dropped']:5d} | "
+              f"en vuelo {s['in_flight']} | ack medio {s['mean_ack_ms']:.1f} ms (máx {s['max_ack_ms']:.1f})")
+    events_ok = snap["event"]["sent"] == n_events and snap["event"]["dropped"] == 0
+    print(f"Eventos de zona: {snap['event']['sent']}/{n_events} enviados")
+
+    # Todo mensaje encolado terminó enviado o descartado, y todo lo enviado fue confirmado
+    accounted = all(s['sent'] + s['dropped'] + s['failed'] == s['enqueued'] and s['in_flight'] == 0
+                    for s in snap.values())
+    ok = events_ok and accounted
+    print("RESULTADO:", "OK" if ok else "COLA INCORRECTA")
+    return ok
+
+
+def bench_agrupacion(args):
+    """ Stream de onda: un mensaje por chunk vs agrupado por tiempo vs tramas multi-atleta """
+    users = [f"atleta_{athlete:02d}" for athlete in range(args.athletes)]
+    streams = {user_id: synthetic_ecg(args.ticks * CHUNK, seed=athlete) for athlete, user_id in enumerate(users)}
+    hashes = {user_id_hash(user_id): user_id for user_id in users}
+    configs = (("sin agrupar", dict()),
+               (f"{args.batch_ms:.0f} ms", dict(batch_ms=args.batch_ms)),
+               (f"{args.batch_ms:.0f} ms multi", dict(batch_ms=args.batch_ms, batch_users=True)))
+
+    ok = True
+    for label, batching in configs:
+        client = SlowBrokerClient(0.0, 0.0)
+        clock = FakeClock()
+        original = mqtt_handler.mqtt.Client, mqtt_handler.MQTTPublisher.connect
+        mqtt_handler.mqtt.Client = lambda *a, **k: client
+        mqtt_handler.MQTTPublisher.connect = lambda self: None
+        try:
+            publisher = mqtt_handler.MQTTPublisher(ecg_format="float32", sampling_rate=FS, queue_size=10 ** 6,
+                                                   clock=clock, **batching)
+        finally:
+            mqtt_handler.mqtt.Client, mqtt_handler.MQTTPublisher.connect = original
+
+        start = time.perf_counter()
+        for tick in range(args.ticks):
+            for user_id in users:
+                chunk = streams[user_id][tick * CHUNK:(tick + 1) * CHUNK]
+                publisher.publish_ecg_data(chunk, user_id, sample_index=tick * CHUNK, acquisition_ts=tick * 0.05)
+            clock.sleep(0.05)
+        publish_cost = (time.perf_counter() - start) / args.ticks * 1000.0
+        publisher.disconnect(flush_timeout_s=10.0)
+
+        # Reensamblado: secuencia sin saltos y cada muestra en su índice
+        frames = [decode_ecg_frame(payload) for payload in client.published]
+        seqs = [seq for seq, _ in frames]
+        rebuilt = {user_id: np.full(args.ticks * CHUNK, np.nan) for user_id in users}
+        for _, chunks in frames:
+            for chunk in chunks:
+                target = rebuilt[hashes[chunk.user_hash]]
+                target[chunk.sample_index:chunk.sample_index + len(chunk.samples)] = chunk.samples
+        exact = seqs == list(range(len(frames))) and all(
+            np.allclose(rebuilt[user_id], streams[user_id].astype(np.float32)) for user_id in users)
+        n_bytes = sum(len(payload) for payload in client.published)
+        print(f"{label:16s}: {len(frames):6d} mensajes ({len(frames) / (args.ticks * 0.05):7.1f}/s) | "
+              f"{n_bytes / 1024:8.1f} KB | publicar {publish_cost:.3f} ms/ciclo | "
+              f"reensamblado {'exacto' if exact else 'INCORRECTO'}")
+        ok &= exact
+
+    ok &= check_pending_deadline(users[:2], args.batch_ms)
+    print("RESULTADO:", "OK" if ok else "REENSAMBLADO INCORRECTO")
+    return ok
+
+
+def check_pending_deadline(users, batch_ms):
+    """
+    Lo pendiente de la agrupación sale al vencer el plazo aunque no lleguen chunks nuevos
+    (service_stream), y un atleta que se queda sin lease pierde lo que tenía pendiente
+    """
+    client = SlowBrokerClient(0.0, 0.0)
+    clock = FakeClock()
+    original = mqtt_handler.mqtt.Client, mqtt_handler.MQTTPublisher.connect
+    mqtt_handler.mqtt.Client = lambda *a, **k: client
+    mqtt_handler.MQTTPublisher.connect = lambda self: None
+    try:
+        publisher = mqtt_handler.MQTTPublisher(ecg_format="float32", sampling_rate=FS, clock=clock,
+                                               batch_ms=batch_ms, stream_lease=True)
+    finally:
+        mqtt_handler.mqtt.Client, mqtt_handler.MQTTPublisher.connect = original
+    leases = {user_id: StreamLease(None, consumer_id=f"vis_{k}", users=[user_id])
+              for k, user_id in enumerate(users)}
+    for lease in leases.values():
+        publisher._on_lease_message(client, None, FakeLeaseMessage(lease.topic, lease.payload()))
+
+    # Dos ciclos con ambos atletas mirados, baja del segundo y un ciclo más; luego la placa calla
+    n_ticks = 3
+    for tick in range(n_ticks):
+        if tick == n_ticks - 1:
+            publisher._on_lease_message(client, None, FakeLeaseMessage(leases[users[1]].topic, b""))
+        for user_id in users:
+            publisher.publish_ecg_data(np.full(CHUNK, float(tick)), user_id, sample_index=tick * CHUNK)
+        clock.sleep(0.05)
+    publisher.service_stream()
+    held = publisher.snapshot()["stream"]["enqueued"]
+    clock.sleep(batch_ms / 1000.0)
+    publisher.service_stream()
+    released = publisher.snapshot()["stream"]["enqueued"]
+    publisher.disconnect(flush_timeout_s=10.0)
+
+    chunks = [chunk for payload in client.published for chunk in decode_ecg_frame(payload)[1]]
+    first_user = [chunk for chunk in chunks if chunk.user_hash == user_id_hash(users[0])]
+    print(f"Placa sin datos: {held} mensajes antes del plazo, {released} al vencer (sin chunks nuevos) | "
+          f"atleta sin lease: {len(chunks) - len(first_user)} chunks publicados")
+    return (held == 0 and released == 1 and len(first_user) == len(chunks) == 1
+            and first_user[0].sample_index == 0 and len(first_user[0].samples) == n_ticks * CHUNK)
+
+
+class _Chunk:
+    """ Chunk ya decodificado (misma forma que wire_format.EcgChunk) """
+    def __init__(self, sample_index, samples, user_hash=0):
+        self.user_hash = user_hash
+        self.sample_index = sample_index
+        self.samples = samples
+
+
+def bench_reensamblado(args):
+    """ Chunk fijo 'fs * 0.05' vs muestras nuevas exactas, y canal con pérdidas / duplicados / desorden """
+    rng = np.random.default_rng(0)
+    signal_ = np.arange(args.ticks * 20, dtype=np.float64)
+    # Muestras que llegan en cada ciclo: ~12.5 con deriva del bucle (a veces 0, a veces el doble)
+    arrivals = rng.poisson(12.5, args.ticks)
+    ends = np.minimum(np.cumsum(arrivals), len(signal_))
+
+    ok = True
+    for label, fixed in (("chunk fijo 12 pts", True), ("muestras exactas", False)):
+        reassembler = StreamReassembler(fill="none")
+        for seq, (end, n_new) in enumerate(zip(ends, arrivals)):
+            n_send = 12 if fixed else n_new
+            if n_send and end >= n_send:
+                reassembler.push(seq, [_Chunk(end - n_send, signal_[end - n_send:end])])
+        snap = reassembler.snapshot()
+        print(f"{label:18s}: huecos {snap['gaps']:4d} ({snap['missing_samples']:5d} muestras) | "
+              f"duplicadas {snap['duplicate_samples']:5d} | entregadas {snap['samples']} de {ends[-1]}")
+        if not fixed:
+            ok &= snap["gaps"] == 0 and snap["duplicate_samples"] == 0
+
+    # Canal con fallas inyectadas: pérdidas, duplicados y pares desordenados
+    chunks = [(seq, seq * CHUNK) for seq in range(args.ticks)]
+    lost = set(rng.choice(args.ticks - 2, args.faults, replace=False) + 1)
+    delivered = [chunk for chunk in chunks if chunk[0] not in lost]
+    duplicated = rng.choice(len(delivered), args.faults, replace=False)
+    for position in sorted(duplicated, reverse=True):
+        delivered.insert(position + 1, delivered[position])
+    swapped = 0
+    for position in rng.choice(len(delivered) - 1, args.faults, replace=False):
+        a, b = delivered[position], delivered[position + 1]
+        if a[0] + 1 == b[0]:  # Solo pares consecutivos distintos: el desorden es medible
+            delivered[position], delivered[position + 1] = b, a
+            swapped += 1
+
+    reassembler = StreamReassembler(fill="nan")
+    output = [reassembler.push(seq, [_Chunk(index, signal_[index:index + CHUNK])]).get(0, np.zeros(0))
+              for seq, index in delivered]
+    output.append(reassembler.flush().get(0, np.zeros(0)))
+    output = np.concatenate(output)
+    snap = reassembler.snapshot()
+    expected = signal_[:args.ticks * CHUNK].copy()
+    for seq in lost:
+        expected[seq * CHUNK:(seq + 1) * CHUNK] = np.nan
+    exact = len(output) == len(expected) and np.array_equal(np.isnan(output), np.isnan(expected)) \
+        and np.array_equal(output[~np.isnan(output)], expected[~np.isnan(expected)])
+
+    print(f"Canal con fallas: {len(lost)} chunks perdidos, {args.faults} duplicados, {swapped} pares desordenados")
+    print(f"  detectado: huecos {snap['gaps']} ({snap['missing_samples']} muestras) | "
+          f"duplicadas {snap['duplicate_samples']} | desordenados {snap['reordered_chunks']} | "
+          f"tramas perdidas {snap['lost_frames']} / desordenadas {snap['reordered_frames']} / "
+          f"duplicadas {snap['duplicate_frames']}")
+    print(f"  stream reensamblado {'exacto' if exact else 'INCORRECTO'} (huecos rellenados con NaN)")
+    ok &= (exact and snap["missing_samples"] == len(lost) * CHUNK
+           and snap["duplicate_samples"] == args.faults * CHUNK and snap["reordered_chunks"] == swapped
+           and snap["lost_frames"] == len(lost) and snap["reordered_frames"] == swapped)
+
+    # Reinicio del analizador: índice y secuencia vuelven a 0 (stream nuevo, no duplicados)
+    reassembler = StreamReassembler(fill="none")
+    sessions = (args.ticks // 4, args.ticks // 8)
+    released = 0
+    for n_chunks in sessions:
+        for seq in range(n_chunks):
+            ready = reassembler.push(seq, [_Chunk(seq * CHUNK, signal_[seq * CHUNK:(seq + 1) * CHUNK])])
+            released += len(ready.get(0, ()))
+    snap = reassembler.snapshot()
+    print(f"Reinicio del emisor ({sessions[0]} + {sessions[1]} chunks): entregadas {released} de "
+          f"{sum(sessions) * CHUNK} | reinicios {snap['resets']} (secuencia {snap['seq_resets']}) | "
+          f"duplicadas {snap['duplicate_samples']} | tramas duplicadas {snap['duplicate_frames']}")
+    ok &= (released == sum(sessions) * CHUNK and snap["resets"] == 1 and snap["seq_resets"] == 1
+           and snap["duplicate_samples"] == 0 and snap["duplicate_frames"] == 0)
+
+    # Adquisición incremental con ciclos vacíos (mismo cálculo de índices que el main)
+    released, snap = incremental_stream_indices(args.ticks)
+    print(f"Adquisición incremental con lecturas vacías: entregadas {released} | huecos {snap['gaps']} | "
+          f"duplicadas {snap['duplicate_samples']}")
+    ok &= released > 0 and snap["gaps"] == 0 and snap["duplicate_samples"] == 0
+
+    print("RESULTADO:", "OK" if ok else "REENSAMBLADO INCORRECTO")
+    return ok
+
+
+class StutteringReplayBoard(ReplayBoard):
+    """ Reproducción que solo entrega muestras en una de cada tres consultas (ciclos vacíos) """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.polls = 0
+
+    def _advance(self):
+        self.polls += 1
+        if self.polls % 3 == 0:
+            super()._advance()
+
+
+def incremental_stream_indices(n_ticks):
+    """
+    Lee una sesión grabada en modo 'incremental' con lecturas vacías intercaladas y
+    arma el chunk de cada ciclo como 'process_athlete' (last_read_index / last_read_count).
+    Retorna (muestras entregadas por el reensamblador, snapshot).
+    """
+    board_id = BoardIds.SYNTHETIC_BOARD.value
+    n_rows = BoardShim.get_num_rows(board_id)
+    n_points = n_ticks * CHUNK
+    session = np.zeros((n_rows, n_points))
+    session[BoardShim.get_package_num_channel(board_id)] = np.arange(n_points) % 256
+    session[BoardShim.get_timestamp_channel(board_id)] = 1.7e9 + np.arange(n_points) / FS
+    # La muestra vale su índice: un chunk reenviado aparece como duplicado
+    session[BoardShim.get_ecg_channels(board_id)[0]] = np.arange(n_points)
+
+    reassembler = StreamReassembler(fill="none")
+    released = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "atleta_01.msrr")
+        recorder = SessionRecorder(path, board_id, FS, n_rows)
+        recorder.write(session)
+        recorder.close()
+        handler = ReplayHandler(path, num_points=WINDOW, acquisition_mode="incremental", speed=0,
+                                chunk_points=CHUNK)
+        handler.board_shim = StutteringReplayBoard(handler.board_shim.data, handler.sampling_rate, speed=0,
+                                                   chunk_points=CHUNK)
+        handler.start()
+        for seq in range(n_ticks * 3):
+            window = handler.get_data()
+            n_send = min(handler.last_read_count, 0 if window is None else len(window))
+            if n_send > 0:
+                first_index = handler.last_read_index + handler.last_read_count - n_send
+                ready = reassembler.push(seq, [_Chunk(first_index, window[-n_send:])])
+                released += len(ready.get(0, ()))
+        handler.stop()
+    return released, reassembler.snapshot()
+
+
+class FakeLeaseMessage:
+    """ Mensaje MQTT entrante simulado (tópico + payload) """
+    def __init__(self, topic, payload):
+        self.topic = topic
+        self.payload = payload.encode("utf-8") if isinstance(payload, str) else payload
+
+
+def bench_leases(args):
+    """ Stream bajo demanda: sin consumidores, un atleta, todos con tasa máxima, baja y vencimiento """
+    users = [f"atleta_{athlete:02d}" for athlete in range(args.athletes)]
+    hashes = {user_id_hash(user_id): user_id for user_id in users}
+    vis_a = StreamLease(None, consumer_id="vis_a", users=[users[0]], ttl_s=args.ttl)
+    vis_b = StreamLease(None, consumer_id="vis_b", ttl_s=args.ttl, max_rate_hz=args.rate)
+    # (nombre, segundos, leases que se renuevan, leases que se dan de baja al empezar)
+    phases = (("sin consumidores", args.seconds, (), ()),
+              ("vis_a: atleta_00", args.seconds, (vis_a,), ()),
+              (f"+ vis_b: todos a {args.rate:g} Hz", args.seconds, (vis_a, vis_b), ()),
+              ("baja de vis_a", args.seconds, (vis_b,), (vis_a,)),
+              ("vis_b sin renovar", args.ttl, (), ()),
+              ("lease vencido", args.seconds, (), ()))
+
+    client = SlowBrokerClient(0.0, 0.0)
+    clock = FakeClock()
+    original = mqtt_handler.mqtt.Client, mqtt_handler.MQTTPublisher.connect
+    mqtt_handler.mqtt.Client = lambda *a, **k: client
+    mqtt_handler.MQTTPublisher.connect = lambda self: None
+    try:
+        publisher = mqtt_handler.MQTTPublisher(ecg_format="float32", sampling_rate=FS, queue_size=10 ** 6,
+                                               clock=clock, stream_lease=True)
+    finally:
+        mqtt_handler.mqtt.Client, mqtt_handler.MQTTPublisher.connect = original
+
+    def deliver(lease, payload):
+        publisher._on_lease_message(client, None, FakeLeaseMessage(lease.topic, payload))
+
+    tick = 0
+    phase_ticks = []
+    gated = []
+    for _, seconds, renewed, revoked in phases:
+        for lease in revoked:
+            deliver(lease, b"")
+        first = tick
+        last_renewal = None
+        publisher.reset_stats()
+        for _ in range(int(round(seconds / 0.05))):
+            if renewed and (last_renewal is None or clock() - last_renewal >= args.ttl / 3.0):
+                for lease in renewed:
+                    deliver(lease, lease.payload())
+                last_renewal = clock()
+            for user_id in users:
+                publisher.publish_ecg_data(np.full(CHUNK, float(tick)), user_id, sample_index=tick * CHUNK)
+                publisher.publish_status(user_id, 120.0, 3)
+            clock.sleep(0.05)
+            tick += 1
+        phase_ticks.append((first, tick))
+        gated.append(publisher.gated_chunks)
+    publisher.disconnect(flush_timeout_s=10.0)
+
+    # Mensajes del stream por fase y atleta (fase = ciclo de la última muestra del chunk)
+    counts = [dict.fromkeys(users, 0) for _ in phases]
+    reassembler = StreamReassembler(fill="none")
+    n_stream = n_status = 0
+    for payload in client.published:
+        if not isinstance(payload, bytes):
+            n_status += 1
+            continue
+        n_stream += 1
+        seq, chunks = decode_ecg_frame(payload)
+        reassembler.push(seq, chunks)
+        for chunk in chunks:
+            end_tick = (chunk.sample_index + len(chunk.samples)) // CHUNK - 1
+            phase = next(k for k, (first, last) in enumerate(phase_ticks) if first <= end_tick < last)
+            counts[phase][hashes[chunk.user_hash]] += 1
+
+    ok = n_status == tick * len(users)
+    always_on = tick * len(users)
+    for k, (label, seconds, _, _) in enumerate(phases):
+        first, last = phase_ticks[k]
+        per_user = counts[k]
+        total = sum(per_user.values())
+        print(f"{label:24s}: {total / seconds:6.1f} mensajes/s del stream (siempre activo: "
+              f"{len(users) / 0.05:.0f}/s) | atleta_00 {per_user[users[0]] / seconds:5.1f}/s | "
+              f"resto máx {max(per_user[user_id] for user_id in users[1:]) / seconds:4.1f}/s | "
+              f"sin lease {gated[k]}")
+        n_ticks = last - first
+        others_max = max(per_user[user_id] for user_id in users[1:])
+        if k in (0, len(phases) - 1):
+            ok &= total == 0
+        elif k == 1:
+            ok &= per_user[users[0]] == n_ticks and others_max == 0
+        elif k == 2:
+            ok &= per_user[users[0]] == n_ticks and others_max <= args.rate * seconds + 1
+        elif k == 3:
+            ok &= max(per_user.values()) <= args.rate * seconds + 1
+
+    snap = reassembler.snapshot()
+    print(f"Stream total: {n_stream} mensajes vs {always_on} sin leases (x{always_on / max(n_stream, 1):.0f} menos) | "
+          f"status {n_status}/{tick * len(users)}")
+    print(f"Reensamblado: {snap['samples']} muestras | huecos {snap['gaps']} | duplicadas {snap['duplicate_samples']} "
+          f"| tramas perdidas {snap['lost_frames']}")
+    ok &= snap["gaps"] == 0 and snap["duplicate_samples"] == 0 and snap["lost_frames"] == 0
+    print("RESULTADO:", "OK" if ok else "LEASES INCORRECTOS")
+    return ok
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmarks y verificaciones offline del analizador")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_filtros = sub.add_parser("filtros", help="Motor de filtrado fusionado vs BrainFlow")
+    p_filtros.add_argument("--cases", type=int, default=50)
+    p_filtros.set_defaults(func=bench_filtros)
+
+    p_welch = sub.add_parser("welch", help="Welch incremental vs Welch completo (PSD, BPM y costo)")
+    p_welch.add_argument("--cases", type=int, default=13)
+    p_welch.add_argument("--seconds", type=float, default=20.0)
+    p_welch.add_argument("--margin", type=float, default=0.5)
+    p_welch.set_defaults(func=bench_welch)
+
+    p_dec = sub.add_parser("decimacion", help="Ruta multirate: CPU por atleta y precisión")
+    p_dec.add_argument("--cases", type=int, default=15)
+    p_dec.add_argument("--seconds", type=float, default=20.0)
+    p_dec.add_argument("--margin", type=float, default=0.5)
+    p_dec.set_defaults(func=bench_decimacion)
+
+    p_qrs = sub.add_parser("qrs", help="Detector de latidos: BPM, latidos perdidos / espurios y latencia")
+    p_qrs.add_argument("--seconds", type=float, default=60.0)
+    p_qrs.add_argument("--max-error", type=float, default=2.0)
+    p_qrs.set_defaults(func=bench_qrs)
+
+    p_median = sub.add_parser("mediana", help="Mediana deslizante (heaps) vs np.median")
+    p_median.add_argument("--samples", type=int, default=3000)
+    p_median.set_defaults(func=bench_mediana)
+
+    p_mem = sub.add_parser("memoria", help="Asignaciones por ciclo en régimen (tracemalloc)")
+    p_mem.add_argument("--ticks", type=int, default=2000)
+    p_mem.add_argument("--warmup", type=int, default=100)
+    p_mem.set_defaults(func=bench_memoria)
+
+    p_multi = sub.add_parser("multiatleta", help="Analizador vectorizado multi-atleta vs bucle 1-D")
+    p_multi.add_argument("--athletes", type=int, default=32)
+    p_multi.add_argument("--ticks", type=int, default=200)
+    p_multi.set_defaults(func=bench_multiatleta)
+
+    p_zonas = sub.add_parser("zonas", help="Motor de zonas vectorizado vs máquina de estados original")
+    p_zonas.add_argument("--athletes", type=int, default=64)
+    p_zonas.add_argument("--ticks", type=int, default=4000)
+    p_zonas.set_defaults(func=bench_zonas)
+
+    p_ring = sub.add_parser("ringbuffer", help="Buffer circular espejado vs np.roll")
+    p_ring.set_defaults(func=bench_ringbuffer)
+
+    p_acq = sub.add_parser("adquisicion", help="Diagnóstico de adquisición: huecos, jitter y ventana íntegra")
+    p_acq.add_argument("--samples", type=int, default=60000)
+    p_acq.add_argument("--gaps", type=int, default=25)
+    p_acq.add_argument("--jitter-ms", type=float, default=0.5)
+    p_acq.set_defaults(func=bench_adquisicion)
+
+    p_boards = sub.add_parser("placas", help="Ciclo de vida multi-placa: arranque, fallo parcial y liberación")
+    p_boards.add_argument("--athletes", type=int, default=3)
+    p_boards.add_argument("--seconds", type=float, default=1.0)
+    p_boards.set_defaults(func=bench_placas)
+
+    p_replay = sub.add_parser("replay", help="Grabación y reproducción acelerada de una sesión")
+    p_replay.add_argument("--seconds", type=float, default=90.0)
+    p_replay.set_defaults(func=bench_replay)
+
+    p_sched = sub.add_parser("planificador", help="Bucle por deadlines vs sleep fijo")
+    p_sched.add_argument("--ticks", type=int, default=12000)
+    p_sched.set_defaults(func=bench_planificador)
+
+    p_trigger = sub.add_parser("disparo", help="Disparo por cantidad de muestras vs reloj fijo")
+    p_trigger.add_argument("--seconds", type=float, default=300.0)
+    p_trigger.add_argument("--k", type=int, default=12)
+    p_trigger.set_defaults(func=bench_disparo)
+
+    p_start = sub.add_parser("arranque", help="Caché de metadata y pre-calentamiento (primer BPM)")
+    p_start.add_argument("--prewarm", type=float, default=2.5)
+    p_start.add_argument("--tolerance", type=float, default=1.0)
+    p_start.set_defaults(func=bench_arranque)
+
+    p_leads = sub.add_parser("derivaciones", help="Voto multi-derivación vs una derivación")
+    p_leads.add_argument("--cases", type=int, default=20)
+    p_leads.add_argument("--leads", type=int, default=4)
+    p_leads.set_defaults(func=bench_derivaciones)
+
+    p_wire = sub.add_parser("formato", help="Stream de onda binario vs JSON (tamaño y CPU)")
+    p_wire.add_argument("--chunk", type=int, default=CHUNK)
+    p_wire.add_argument("--repeats", type=int, default=20000)
+    p_wire.set_defaults(func=bench_formato)
+
+    p_queue = sub.add_parser("cola", help="Cola de envío MQTT con prioridades y descarte")
+    p_queue.add_argument("--ticks", type=int, default=400)
+    p_queue.add_argument("--athletes", type=int, default=8)
+    p_queue.add_argument("--queue", type=int, default=256)
+    p_queue.add_argument("--tick-ms", type=float, default=5.0)
+    p_queue.add_argument("--delay-ms", type=float, default=0.5)
+    p_queue.add_argument("--ack-ms", type=float, default=5.0)
+    p_queue.set_defaults(func=bench_cola)
+
+    p_batch = sub.add_parser("agrupacion", help="Agrupación del stream y tramas multi-atleta")
+    p_batch.add_argument("--athletes", type=int, default=16)
+    p_batch.add_argument("--ticks", type=int, default=400)
+    p_batch.add_argument("--batch-ms", type=float, default=200.0)
+    p_batch.set_defaults(func=bench_agrupacion)
+
+    p_reasm = sub.add_parser("reensamblado", help="Índices de muestra y detección de huecos / duplicados")
+    p_reasm.add_argument("--ticks", type=int, default=4000)
+    p_reasm.add_argument("--faults", type=int, default=40)
+    p_reasm.set_defaults(func=bench_reensamblado)
+
+    p_lease = sub.add_parser("leases", help="Stream bajo demanda (leases de consumidores)")
+    p_lease.add_argument("--athletes", type=int, default=8)
+    p_lease.add_argument("--seconds", type=float, default=10.0)
+    p_lease.add_argument("--ttl", type=float, default=6.0)
+    p_lease.add_argument("--rate", type=float, default=2.0)
+    p_lease.set_defaults(func=bench_leases)
+
+    args = parser.parse_args()
+    ok = args.func(args)
+    raise SystemExit(0 if ok else 1)
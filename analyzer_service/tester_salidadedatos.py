@@ -3,6 +3,10 @@ import json
 import time
 import sys
 
+from wire_format import decode_ecg_frame
+from stream_reassembler import StreamReassembler
+from stream_lease import StreamLease
+
 # Configuración
 MQTT_BROKER = "localhost"
 TOPIC_DATA = "msoft/msrr/debug_ecg_data"
@@ -10,11 +14,15 @@ TOPIC_DATA = "msoft/msrr/debug_ecg_data"
 received_chunks = 0
 total_points = 0
 collected_data = []
+# Sin relleno: solo se reportan los huecos (los datos recolectados son los reales)
+reassembler = StreamReassembler(fill="none")
 
 def on_connect(client, userdata, flags, rc, properties=None):
     if rc == 0:
         print(f"--> Conectado. Escuchando {TOPIC_DATA} por 5 segundos...")
         client.subscribe(TOPIC_DATA, qos=0)
+        # El analizador solo publica el stream si alguien lo pide (lease)
+        lease.start()
     else:
         print(f"Error conexión: {rc}")
         sys.exit(1)
@@ -22,8 +30,10 @@ def on_connect(client, userdata, flags, rc, properties=None):
 def on_message(client, userdata, msg):
     global received_chunks, total_points, collected_data
     try:
-        payload = json.loads(msg.payload.decode())
-        chunk = payload.get("ecg_data", [])
+        # Binario, trama multi-atleta o JSON (ver wire_format.py)
+        seq, chunks = decode_ecg_frame(msg.payload)
+        ready = reassembler.push(seq, chunks)
+        chunk = [sample for part in ready.values() for sample in part.tolist()]
         
         # Guardamos estadísticas
         chunk_len = len(chunk)
@@ -41,6 +51,8 @@ def on_message(client, userdata, msg):
 client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
 client.on_connect = on_connect
 client.on_message = on_message
+lease = StreamLease(client, consumer_id="tester_salidadedatos")
+lease.install_will()
 
 try:
     client.connect(MQTT_BROKER, 1883, 60)
@@ -51,6 +63,9 @@ except Exception as e:
 
 # Esperar 5 segundos para recolectar datos
 time.sleep(5)
+# Baja confirmada antes de desconectar (una desconexión limpia no dispara el last will)
+if not lease.stop():
+    print("\n⚠️ La baja del lease no se confirmó: el stream seguirá activo hasta que venza.")
 client.loop_stop()
 client.disconnect()
 
@@ -69,6 +84,15 @@ print(f"Frecuencia (aprox):   {fs_real:.2f} Hz (Esperado: ~250 Hz)")
 avg_chunk_size = total_points / received_chunks if received_chunks > 0 else 0
 print(f"Tamaño prom. Chunk:   {avg_chunk_size:.2f} puntos (Esperado: 12-13)")
 
+# Integridad del stream (índice de muestra + secuencia)
+health = reassembler.snapshot()
+print(f"Huecos:               {health['gaps']} ({health['missing_samples']} muestras)")
+print(f"Muestras duplicadas:  {health['duplicate_samples']}")
+print(f"Chunks desordenados:  {health['reordered_chunks']}")
+print(f"Tramas perdidas:      {health['lost_frames']} (desordenadas {health['reordered_frames']}, "
+      f"duplicadas {health['duplicate_frames']})")
+print(f"Reinicios del emisor:  {health['resets']} (secuencia {health['seq_resets']})")
+
 print("\n" + "-"*40)
 print("--- DATOS PARA PEGAR EN EL CHAT ---")
 print("-"*40)
@@ -77,7 +101,8 @@ print(json.dumps(collected_data[:50]))
 print("-"*40)
 
 if total_points == 0:
-    print("\n⚠️ ALERTA: No se recibieron datos. Revisa si el Docker está enviando.")
+    print("\n⚠️ ALERTA: No se recibieron datos. Revisa si el Docker está enviando "
+          "(y que reciba los leases de 'msoft/msrr/stream_lease/+').")
 elif avg_chunk_size > 500:
     print("\n⚠️ ALERTA: Los chunks son gigantes. El 'slicing' en main.py no está funcionando.")
 elif avg_chunk_size < 2:
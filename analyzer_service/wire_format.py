@@ -0,0 +1,143 @@
+import json
+import math
+import struct
+import zlib
+import numpy as np
+
+"""
+-----------------------------------------------------------------------------
+SUBSYSTEM: FORMATO BINARIO DEL STREAM DE ONDA (debug_ecg_data)
+-----------------------------------------------------------------------------
+Descripción:
+El stream de onda es el tópico de mayor volumen (20 chunks/s por atleta).
+Con JSON cada muestra viaja como texto decimal ('.tolist()' + 'json.dumps')
+y el consumidor la vuelve a parsear. Este formato la envía empaquetada:
+una cabecera fija seguida de las muestras, que el consumidor lee con
+'np.frombuffer' sin parsear nada.
+
+    Cabecera (little-endian, 40 bytes):
+    MAGIC 'MSEC' | versión (u8) | codificación (u8) | n_muestras (u16)
+    | hash user_id (u32) | secuencia (u32) | índice 1ª muestra (i64, -1 = desconocido)
+    | timestamp de adquisición (f64, NaN = desconocido) | fs (f32) | escala (f32)
+    Muestras: float32 (escala 1.0) o int16 (valor = entero * escala)
+
+Trama multi-atleta (varios chunks en un solo mensaje MQTT):
+    MAGIC 'MSEM' | versión (u8) | relleno (u8) | n_chunks (u16) | secuencia (u32)
+    seguido de n_chunks chunks 'MSEC' completos (cada uno con su cabecera).
+
+- Secuencia: contador de tramas del emisor (uno por mensaje publicado). Un
+  salto en la secuencia es un mensaje perdido (p. ej. descartado por la cola
+  de envío); el índice de muestra ubica cada chunk dentro del stream del atleta.
+- 'int16': la escala se elige por chunk (pico / 32767); error de cuantización
+  <= escala / 2, muy por debajo del ruido de la señal filtrada.
+- El user_id viaja como CRC32; el consumidor lo compara con 'user_id_hash'.
+- Detección por MAGIC: 'decode_ecg_chunk' también acepta los payloads JSON
+  del formato anterior, así los consumidores funcionan con ambos.
+-----------------------------------------------------------------------------
+"""
+
+WIRE_MAGIC = b"MSEC"
+FRAME_MAGIC = b"MSEM"
+WIRE_VERSION = 2
+_HEADER = struct.Struct("<4sBBHIIqdff")
+_FRAME_HEADER = struct.Struct("<4sBxHI")
+
+# Codificaciones de las muestras (formato 'json' = payload de texto anterior)
+ENCODINGS = {"float32": 0, "int16": 1}
+_DTYPES = {0: np.dtype("<f4"), 1: np.dtype("<i2")}
+WIRE_FORMATS = ("json",) + tuple(ENCODINGS)
+
+INT16_MAX = 32767
+
+
+def user_id_hash(user_id):
+    """ Identificador de 32 bits del atleta en la cabecera (CRC32 del user_id) """
+    return zlib.crc32(str(user_id).encode("utf-8")) if user_id is not None else 0
+
+
+class EcgChunk:
+    __slots__ = ("user_hash", "user_id", "seq", "sample_index", "timestamp", "sampling_rate", "samples")
+
+    def __init__(self, user_hash, user_id, seq, sample_index, timestamp, sampling_rate, samples):
+        self.user_hash = user_hash
+        self.user_id = user_id              # Solo en payloads JSON (el binario lleva el hash)
+        self.seq = seq                      # Secuencia de la trama que lo trajo (o None)
+        self.sample_index = sample_index    # None si el emisor no lo conoce
+        self.timestamp = timestamp          # Reloj de la placa de la 1ª muestra (o None)
+        self.sampling_rate = sampling_rate  # None en payloads JSON
+        self.samples = samples              # float64 [n_muestras]
+
+
+def encode_ecg_chunk(samples, user_id=None, sample_index=None, acquisition_ts=None,
+                     sampling_rate=0.0, encoding="float32", seq=0):
+    """ Empaqueta un chunk 1-D en el formato binario. Retorna bytes """
+    code = ENCODINGS[encoding]
+    samples = np.asarray(samples, dtype=np.float64)
+    if code == 1:
+        peak = float(np.max(np.abs(samples))) if len(samples) else 0.0
+        scale = peak / INT16_MAX if peak > 0.0 else 1.0
+        packed = np.rint(samples / scale).astype(_DTYPES[1])
+    else:
+        scale = 1.0
+        packed = samples.astype(_DTYPES[0])
+
+    header = _HEADER.pack(WIRE_MAGIC, WIRE_VERSION, code, len(samples), user_id_hash(user_id), seq & 0xFFFFFFFF,
+                          -1 if sample_index is None else int(sample_index),
+                          math.nan if acquisition_ts is None else float(acquisition_ts),
+                          float(sampling_rate or 0.0), scale)
+    return header + packed.tobytes()
+
+
+def encode_ecg_frame(chunks, seq=0):
+    """ Trama multi-atleta: 'chunks' es una lista de payloads de 'encode_ecg_chunk' """
+    return _FRAME_HEADER.pack(FRAME_MAGIC, WIRE_VERSION, len(chunks), seq & 0xFFFFFFFF) + b"".join(chunks)
+
+
+def _decode_binary_chunk(payload, offset):
+    # Retorna (EcgChunk, offset del byte siguiente al chunk)
+    (magic, version, code, n_samples, user_hash, seq, sample_index,
+     timestamp, sampling_rate, scale) = _HEADER.unpack_from(payload, offset)
+    if magic != WIRE_MAGIC or version != WIRE_VERSION or code not in _DTYPES:
+        raise ValueError(f"Chunk ECG binario no soportado (versión {version}, codificación {code})")
+
+    offset += _HEADER.size
+    samples = np.frombuffer(payload, dtype=_DTYPES[code], count=n_samples, offset=offset)
+    samples = samples.astype(np.float64)
+    if code == 1:
+        samples *= scale
+    chunk = EcgChunk(user_hash, None, seq, None if sample_index < 0 else sample_index,
+                     None if math.isnan(timestamp) else timestamp, sampling_rate or None, samples)
+    return chunk, offset + n_samples * _DTYPES[code].itemsize
+
+
+def _decode_json_chunk(data, seq):
+    user_id = data.get("user_id")
+    return EcgChunk(user_id_hash(user_id), user_id, seq, data.get("sample_index"), data.get("timestamp"),
+                    None, np.asarray(data.get("ecg_data", []), dtype=np.float64))
+
+
+def decode_ecg_chunk(payload):
+    """ Decodifica un payload de un solo chunk (binario o JSON). Retorna un EcgChunk """
+    if payload[:4] == WIRE_MAGIC:
+        return _decode_binary_chunk(payload, 0)[0]
+    data = json.loads(payload)
+    return _decode_json_chunk(data, data.get("seq"))
+
+
+def decode_ecg_frame(payload):
+    """
+    Decodifica cualquier mensaje del stream de onda: chunk binario, trama
+    multi-atleta o JSON. Retorna (secuencia o None, lista de EcgChunk).
+    """
+    if payload[:4] == FRAME_MAGIC:
+        _, version, n_chunks, seq = _FRAME_HEADER.unpack_from(payload, 0)
+        if version != WIRE_VERSION:
+            raise ValueError(f"Trama ECG multi-atleta no soportada (versión {version})")
+        chunks = []
+        offset = _FRAME_HEADER.size
+        for _ in range(n_chunks):
+            chunk, offset = _decode_binary_chunk(payload, offset)
+            chunks.append(chunk)
+        return seq, chunks
+    chunk = decode_ecg_chunk(payload)
+    return chunk.seq, [chunk]
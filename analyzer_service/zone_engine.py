@@ -0,0 +1,130 @@
+import numpy as np
+import time
+from bisect import bisect_right
+
+"""
+-----------------------------------------------------------------------------
+SUBSYSTEM: MOTOR DE ZONAS (CLASIFICACIÓN + HISTÉRESIS VECTORIZADA)
+-----------------------------------------------------------------------------
+Descripción:
+Máquina de estados de zonas de esfuerzo (Etapa 5 de DataAnalyzer) para uno o
+muchos atletas a la vez.
+
+Clasificación:
+Los umbrales de cada atleta (FC Máx * [0.6, 0.7, 0.8, 0.9]) se calculan UNA
+sola vez al crear el motor. La zona es la posición del BPM en ese vector
+ordenado (np.searchsorted, side='right') + 1: mismo resultado exacto que la
+escalera de if/elif 'bpm < max_hr * X' (los umbrales son los mismos floats).
+Con varios atletas, cada uno con su propio vector, la búsqueda se resuelve
+como un conteo vectorizado de umbrales superados (equivalente fila a fila).
+El atajo de un único atleta (DataAnalyzer) hace la misma búsqueda con bisect.
+
+Histéresis:
+Zona actual, zona candidata e instante de inicio del candidato se guardan
+como arrays [atletas]. El instante lo aporta quien llama (un escalar común o
+un array de timestamps por atleta), así un ciclo del main consulta el reloj
+una sola vez para todo el equipo y una sesión grabada se puede reproducir
+con sus timestamps originales.
+-----------------------------------------------------------------------------
+"""
+
+# Límites de zona como fracción de la FC Máxima (Zonas 1-5)
+ZONE_FRACTIONS = np.array([0.6, 0.7, 0.8, 0.9])
+
+# Tiempo que el atleta debe mantener la nueva intensidad para confirmar el cambio
+MIN_TIME_IN_ZONE_S = 2.0
+
+
+class ZoneEngine:
+    def __init__(self, max_hr, min_time_in_zone_s=MIN_TIME_IN_ZONE_S):
+        # FC Máxima por atleta (un escalar equivale a un único atleta)
+        self.max_hr = np.atleast_1d(np.asarray(max_hr, dtype=float))
+        self.n_athletes = len(self.max_hr)
+        self.min_time_in_zone_s = min_time_in_zone_s
+
+        # Umbrales precalculados: [atletas x 4], ordenados de forma creciente por fila
+        self.thresholds = self.max_hr[:, None] * ZONE_FRACTIONS
+        # Copia como lista de floats para el atajo de un único atleta (sin overhead de NumPy)
+        self._scalar_thresholds = self.thresholds[0].tolist()
+
+        # Estado de la máquina (0 = sin zona / sin candidato)
+        self.current_zone = np.zeros(self.n_athletes, dtype=int)
+        self.candidate_zone = np.zeros(self.n_athletes, dtype=int)
+        self.candidate_start_time = np.zeros(self.n_athletes)
+
+    def classify(self, bpm):
+        """ Zona pura (1-5) sin histéresis. 'bpm' tiene un valor por atleta """
+        if self.n_athletes == 1:
+            return np.searchsorted(self.thresholds[0], bpm, side='right') + 1
+        # searchsorted fila a fila == cantidad de umbrales <= bpm en cada fila
+        return np.count_nonzero(self.thresholds <= np.asarray(bpm)[:, None], axis=-1) + 1
+
+    def update(self, bpm, now=None):
+        """
+        Avanza la histéresis de todos los atletas con el BPM de este ciclo.
+        'now' es un instante común (escalar) o un array de timestamps por atleta.
+        Retorna (cambio: bool[atletas], zona_anterior: int[atletas], zona_nueva: int[atletas]);
+        las zonas valen 0 donde no hubo cambio.
+        """
+        if now is None:
+            now = time.time()
+        p_zone = self.classify(bpm)
+
+        # CASO A: Seguimos en la misma zona actual => se descarta el candidato
+        same = p_zone == self.current_zone
+        # CASO B: Zona potencial distinta, vista por primera vez => inicia el contador
+        new_candidate = ~same & (p_zone != self.candidate_zone)
+        # CASO C: La zona candidata se mantuvo el tiempo mínimo => ¡Cambio Confirmado!
+        confirmed = ~same & ~new_candidate & (now - self.candidate_start_time >= self.min_time_in_zone_s)
+
+        old_zone = np.where(confirmed, self.current_zone, 0)
+        new_zone = np.where(confirmed, p_zone, 0)
+        np.copyto(self.current_zone, p_zone, where=confirmed)
+
+        # Reset de variables temporales / arranque del nuevo candidato
+        reset = same | confirmed
+        np.copyto(self.candidate_zone, 0, where=reset)
+        np.copyto(self.candidate_start_time, 0.0, where=reset)
+        np.copyto(self.candidate_zone, p_zone, where=new_candidate)
+        np.copyto(self.candidate_start_time, now, where=new_candidate)
+
+        return confirmed, old_zone, new_zone
+
+    def detect_zone_change(self, bpm, now=None):
+        """
+        Atajo para un único atleta: (bool: hubo_cambio, int: zona_anterior, int: zona_nueva).
+        Misma lógica que update() sobre escalares: con un solo atleta el coste fijo de
+        cada llamada NumPy (~1 us) supera al trabajo real.
+        """
+        if self.n_athletes != 1:
+            raise ValueError("detect_zone_change es para un único atleta; usar update()")
+        if now is None:
+            now = time.time()
+        p_zone = bisect_right(self._scalar_thresholds, bpm) + 1
+        current = int(self.current_zone[0])
+
+        # CASO A: misma zona actual
+        if p_zone == current:
+            self.candidate_zone[0] = 0
+            self.candidate_start_time[0] = 0.0
+            return (False, 0, 0)
+
+        # CASO B: zona potencial nueva (inicia contador)
+        if p_zone != self.candidate_zone[0]:
+            self.candidate_zone[0] = p_zone
+            self.candidate_start_time[0] = now
+            return (False, 0, 0)
+
+        # CASO C: la zona candidata se mantiene; confirmamos tras el tiempo mínimo
+        if now - self.candidate_start_time[0] >= self.min_time_in_zone_s:
+            self.current_zone[0] = p_zone
+            self.candidate_zone[0] = 0
+            self.candidate_start_time[0] = 0.0
+            return (True, current, p_zone)
+
+        return (False, 0, 0)
+
+    def reset(self):
+        self.current_zone.fill(0)
+        self.candidate_zone.fill(0)
+        self.candidate_start_time.fill(0.0)
@@ -1,3 +1,4 @@
+import os
 import sys
 import json
 import time
@@ -6,6 +7,13 @@ import paho.mqtt.client as mqtt
 import pyqtgraph as pg
 from pyqtgraph.Qt import QtWidgets, QtCore
 
+# Buffer circular compartido con el backend (analyzer_service/ring_buffer.py)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'analyzer_service'))
+from ring_buffer import RingBuffer
+from wire_format import decode_ecg_frame, user_id_hash
+from stream_reassembler import StreamReassembler
+from stream_lease import StreamLease
+
 """
 -----------------------------------------------------------------------------
 SUBSYSTEM: CONSUMER / VISUALIZER (FRONTEND)
@@ -17,8 +25,13 @@ Broker MQTT para recibir el stream de datos ECG procesados por el backend
 
 Tecnologías:
 - PyQt5 / PyQtGraph: Para renderizado de gráficos de alto rendimiento (OpenGL).
-- Numpy: Para manejo eficiente de buffers circulares de datos.
+- Numpy + RingBuffer: buffer circular espejado (append O(chunk), ventana contigua).
 - Paho MQTT: Para la recepción de telemetría.
+- wire_format: el stream de onda llega binario (np.frombuffer) o en JSON.
+- StreamReassembler: ordena los chunks por índice de muestra, rellena los
+  huecos y cuenta huecos / duplicados / desorden / tramas perdidas.
+- StreamLease: el backend solo publica el stream mientras este visualizador
+  mantenga su lease (se renueva solo; al cerrar se da de baja).
 -----------------------------------------------------------------------------
 """
 
@@ -39,6 +52,11 @@ MQTT_TOPIC_DATA = "msoft/msrr/debug_ecg_data"  # Stream de onda (alto volumen)
 MQTT_TOPIC_ZONE = "msoft/msrr/zone_change"     # Eventos (bajo volumen)
 MQTT_TOPIC_STATUS = "msoft/msrr/status"        # Heartbeat (bajo volumen)
 
+# Atleta a visualizar (user_id). Vacío = el primero que aparezca en el stream.
+VIS_USER = os.getenv("VIS_USER", "")
+# Tasa máxima de mensajes del stream por atleta que se pide al backend (0 = sin límite)
+VIS_MAX_RATE_HZ = float(os.getenv("VIS_MAX_RATE_HZ", "0"))
+
 class MqttVisualizer(QtWidgets.QWidget):
     def __init__(self):
         super().__init__()
@@ -48,9 +66,10 @@ class MqttVisualizer(QtWidgets.QWidget):
         # Cálculo: 5 segundos * 250 Hz (tasa de muestreo) = 1250 puntos.
         self.max_points = 1250 
         
-        # Usamos numpy.zeros para pre-reservar memoria contigua.
-        # Es mucho más rápido que usar listas de Python (append/pop).
-        self.data_buffer = np.zeros(self.max_points)
+        # Buffer circular espejado: memoria pre-reservada, cada chunk se escribe
+        # en O(n_new) (np.roll copiaba los 1250 pts) y la ventana para graficar
+        # es siempre un slice contiguo, sin copia.
+        self.data_buffer = RingBuffer(self.max_points)
         
         # Variables de estado del atleta
         self.bpm_val = 0.0
@@ -61,6 +80,10 @@ class MqttVisualizer(QtWidgets.QWidget):
         # Contadores para calcular la tasa real de llegada de paquetes (Hz reales)
         self.received_points_counter = 0
         self.lbl_stats_text = "Esperando datos..."
+        # Reensamblado por índice de muestra: los huecos se rellenan repitiendo la
+        # última muestra para que el eje de tiempo del gráfico no se corra
+        self.reassembler = StreamReassembler(fill="hold")
+        self.user_hash = user_id_hash(VIS_USER) if VIS_USER else None
 
         # Inicialización de componentes
         self.init_ui()
@@ -151,6 +174,10 @@ class MqttVisualizer(QtWidgets.QWidget):
         self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
         self.client.on_connect = self.on_connect
         self.client.on_message = self.on_message
+        # Lease del stream: la baja (last will) se registra antes de conectar
+        self.lease = StreamLease(self.client, users=[VIS_USER] if VIS_USER else None,
+                                 max_rate_hz=VIS_MAX_RATE_HZ or None)
+        self.lease.install_will()
         
         try:
             self.client.connect(MQTT_BROKER, 1883, 60)
@@ -166,38 +193,38 @@ class MqttVisualizer(QtWidgets.QWidget):
             client.subscribe(MQTT_TOPIC_STATUS, qos=0)
             # QoS 1 para eventos (asegura datos que lleguen al menos una vez)
             client.subscribe(MQTT_TOPIC_ZONE, qos=1)
+            # Pedimos el stream (también tras una reconexión)
+            self.lease.start()
 
     def on_message(self, client, userdata, msg):
         """ Manejo de mensajes entrantes (Se ejecuta en hilo de red) """
         try:
-            # Decodificamos el JSON
-            payload = json.loads(msg.payload.decode())
-            
             # CASO 1: Paquete de Datos ECG (Stream)
+            # Binario, trama multi-atleta o JSON: el decodificador lo detecta por el MAGIC
             if msg.topic == MQTT_TOPIC_DATA:
-                chunk = payload.get("ecg_data", [])
-                n_new = len(chunk)
-                
-                if n_new > 0:
-                    # LÓGICA DE BUFFER CIRCULAR (NUMPY ROLL)
-                    # 1. Desplazamos todo el array hacia la izquierda (-n_new posiciones)
-                    #    Los datos más viejos al principio del array "dan la vuelta" al final.
-                    self.data_buffer = np.roll(self.data_buffer, -n_new)
-                    
-                    # 2. Sobrescribimos el final del array con los datos nuevos.
-                    #    Así eliminamos los datos viejos que dieron la vuelta.
-                    self.data_buffer[-n_new:] = chunk
-                    
+                seq, chunks = decode_ecg_frame(msg.payload)
+                if self.user_hash is None and chunks:
+                    self.user_hash = chunks[0].user_hash
+                ready = self.reassembler.push(seq, chunks).get(self.user_hash)
+                if ready is not None and len(ready) > 0:
+                    # LÓGICA DE BUFFER CIRCULAR (ESPEJADO)
+                    # Solo escribimos los datos nuevos; los más viejos quedan fuera de la ventana.
+                    self.data_buffer.append(ready)
+
                     # Contamos puntos para estadística
-                    self.received_points_counter += n_new
+                    self.received_points_counter += len(ready)
                 
             # CASO 2: Estado (Heartbeat)
             elif msg.topic == MQTT_TOPIC_STATUS:
+                payload = json.loads(msg.payload.decode())
+                if self.user_hash is not None and user_id_hash(payload.get("user_id")) != self.user_hash:
+                    return
                 self.bpm_val = payload.get("bpm", 0)
                 self.zone_val = payload.get("zone", 0)
                 
             # CASO 3: Evento Crítico
             elif msg.topic == MQTT_TOPIC_ZONE:
+                payload = json.loads(msg.payload.decode())
                 old = payload.get("zona_anterior")
                 new = payload.get("zona_nueva")
                 self.msg_log = f"CAMBIO DE ZONA DETECTADO: {old} -> {new}"
@@ -208,7 +235,12 @@ class MqttVisualizer(QtWidgets.QWidget):
     def update_stats(self):
         """ Calcula calidad de señal (Hz) cada segundo """
         hz = self.received_points_counter
-        self.lbl_stats.setText(f"Calidad Stream: {hz} pts/seg")
+        health = (self.reassembler.snapshot(self.user_hash) if self.user_hash in self.reassembler.users
+                  else self.reassembler.snapshot())
+        self.lbl_stats.setText(f"Calidad Stream: {hz} pts/seg | Huecos {health['gaps']} "
+                               f"({health['missing_samples']} pts) | Duplicados {health['duplicate_samples']} | "
+                               f"Desorden {health['reordered_chunks']} | Tramas perdidas {health['lost_frames']} | "
+                               f"Reinicios {health['resets']}")
         
         # Código de colores para diagnóstico rápido
         if hz < 50:
@@ -223,13 +255,19 @@ class MqttVisualizer(QtWidgets.QWidget):
     def update_plot(self):
         """ Actualización del Canvas (Se ejecuta en el hilo principal de UI) """
         # Seteamos la curva con el buffer numpy actual
-        self.curve.setData(self.data_buffer)
+        self.curve.setData(self.data_buffer.view())
         
         # Actualizamos etiquetas de texto
         self.lbl_bpm.setText(f"BPM: {self.bpm_val:.1f}")
         self.lbl_zone.setText(f"ZONA: {self.zone_val}")
         self.lbl_log.setText(self.msg_log)
 
+    def closeEvent(self, event):
+        """ Al cerrar: baja del lease (el backend deja de publicar el stream) """
+        self.lease.stop()
+        self.client.loop_stop()
+        event.accept()
+
 if __name__ == '__main__':
     app = QtWidgets.QApplication(sys.argv)
     viz = MqttVisualizer()
@@ -1,3 +1,4 @@
+import os
 import sys
 import numpy as np
 import pyqtgraph as pg
@@ -5,13 +6,21 @@ from pyqtgraph.Qt import QtWidgets, QtCore
 import paho.mqtt.client as mqtt
 import json
 import logging
-from collections import deque
+
+# Buffer circular compartido con el backend (analyzer_service/ring_buffer.py)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'analyzer_service'))
+from ring_buffer import RingBuffer
+from wire_format import decode_ecg_frame, user_id_hash
+from stream_reassembler import StreamReassembler
+from stream_lease import StreamLease
 
 # --- Configuración MQTT (Conexión Local) ---
 MQTT_BROKER = "localhost"
 MQTT_PORT = 1883
 TOPIC_ZONE = "msoft/msrr/zone_change"
 TOPIC_DATA = "msoft/msrr/debug_ecg_data"
+# Atleta a visualizar (user_id). Vacío = el primero que aparezca en el stream.
+VIS_USER = os.getenv("VIS_USER", "")
 
 # Configura un logger básico para la GUI
 logging.basicConfig(level=logging.INFO)
@@ -21,12 +30,16 @@ class MqttGraph(QtWidgets.QWidget):
         super().__init__()
         
         # --- Variables de Estado ---
-        # Usamos 'deque' para almacenar los datos del gráfico
+        # Buffer circular espejado para los datos del gráfico: la ventana es una
+        # vista contigua (sin convertir un 'deque' a array en cada cuadro)
         self.num_points = 1024 
-        self.plot_data = deque(np.zeros(self.num_points), maxlen=self.num_points)
+        self.plot_data = RingBuffer(self.num_points)
         self.current_bpm = 0.0
         self.current_zone = 0
         self.time_axis = np.linspace(0, 4.0, self.num_points) # Asumimos 4s de ventana
+        # Reensamblado por índice de muestra (huecos rellenados con la última muestra)
+        self.reassembler = StreamReassembler(fill="hold")
+        self.user_hash = user_id_hash(VIS_USER) if VIS_USER else None
 
         # --- Configuración de la GUI ---
         self.setup_gui()
@@ -69,8 +82,8 @@ class MqttGraph(QtWidgets.QWidget):
 
     def update_plot(self):
         """ Esta función solo dibuja los datos, no los procesa """
-        # Convierte el 'deque' a un array numpy para pyqtgraph
-        self.curve.setData(x=self.time_axis, y=np.array(self.plot_data))
+        # La ventana ya es un array numpy contiguo (vista del buffer)
+        self.curve.setData(x=self.time_axis, y=self.plot_data.view())
 
     # --- Lógica de MQTT (Callbacks) ---
 
@@ -78,6 +91,9 @@ class MqttGraph(QtWidgets.QWidget):
         client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
         client.on_connect = self.on_mqtt_connect
         client.on_message = self.on_mqtt_message
+        # Sin lease el backend no publica el stream; la baja (last will) va antes de conectar
+        self.lease = StreamLease(client, users=[VIS_USER] if VIS_USER else None)
+        self.lease.install_will()
         try:
             client.connect(MQTT_BROKER, MQTT_PORT, 60)
             client.loop_start()
@@ -92,6 +108,7 @@ class MqttGraph(QtWidgets.QWidget):
             client.subscribe(TOPIC_ZONE)
             client.subscribe(TOPIC_DATA)
             logging.info(f"Suscrito a {TOPIC_ZONE} y {TOPIC_DATA}")
+            self.lease.start()
         else:
             logging.error(f"Error de conexión MQTT: {rc}")
 
@@ -102,10 +119,8 @@ class MqttGraph(QtWidgets.QWidget):
         El QTimer se encargará de dibujarlas.
         """
         try:
-            payload_str = msg.payload.decode('utf-8')
-            data = json.loads(payload_str)
-            
             if msg.topic == TOPIC_ZONE:
+                data = json.loads(msg.payload.decode('utf-8'))
                 # Actualizar estado de BPM y Zona
                 self.current_bpm = data.get('bpm_actual', self.current_bpm)
                 self.current_zone = data.get('zona_nueva', self.current_zone)
@@ -113,14 +128,18 @@ class MqttGraph(QtWidgets.QWidget):
                 QtCore.QTimer.singleShot(0, self.update_title)
                 
             elif msg.topic == TOPIC_DATA:
-                # Actualizar datos del gráfico
-                ecg_list = data.get('ecg_data', [])
-                # Convertimos a mV (asumiendo que el servicio envía uV)
-                ecg_mv = np.array(ecg_list) / 1000.0
-                
-                # Reemplazamos los datos del 'deque'
-                # Esto es más eficiente que 'extend'
-                self.plot_data = deque(ecg_mv, maxlen=self.num_points)
+                # Actualizar datos del gráfico (chunk binario, trama multi-atleta o JSON, ver wire_format)
+                seq, chunks = decode_ecg_frame(msg.payload)
+                if self.user_hash is None and chunks:
+                    self.user_hash = chunks[0].user_hash
+                # Muestras del atleta en orden, con huecos / duplicados ya resueltos
+                ready = self.reassembler.push(seq, chunks).get(self.user_hash)
+                if ready is not None:
+                    # Convertimos a mV (asumiendo que el servicio envía uV)
+                    ecg_mv = ready / 1000.0
+
+                    # Agregamos el chunk al final de la ventana
+                    self.plot_data.append(ecg_mv)
 
         except Exception as e:
             logging.warning(f"Error procesando mensaje MQTT: {e}")
@@ -128,7 +147,9 @@ class MqttGraph(QtWidgets.QWidget):
     def closeEvent(self, event):
         """ Asegura que el cliente MQTT se detenga al cerrar la ventana """
         if self.mqtt_client:
+            self.lease.stop()
             self.mqtt_client.loop_stop()
+        logging.info(f"Stream recibido: {self.reassembler.snapshot()}")
         event.accept()
 
 def main():